@@ -1,33 +1,38 @@
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
 from dotenv import load_dotenv
+from retrieval_client import RetrievalClient
 
 load_dotenv()
 
-# Setup
-persistent_directory = "db/chroma_db"
-embedding_model = OpenAIEmbeddings(model="text-embedding-3-small")
-
-db = Chroma(
-    persist_directory=persistent_directory,
-    embedding_function=embedding_model,
-    collection_metadata={"hnsw:space": "cosine"}
-)
+# Setup: the retrieval server (python retrieval_server.py) owns the warm
+# Chroma collection and embedding client, this script only sends queries
+client = RetrievalClient()
 
 # Query to test
 query = "How much did Microsoft pay to acquire GitHub?"
 # query = "How do you plant tomatoes in a garden?"
 print(f"Query: {query}\n")
 
+# Two store calls, shared by every method: the server runs one similarity search for
+# 10 candidates and one get() for their embeddings, then computes every method below
+# locally (top-k, threshold, MMR and a λ sweep)
+lambda_values = [0.0, 0.25, 0.5, 0.75, 1.0]
+similarity_docs, threshold_docs, mmr_docs, *sweep_docs = client.search_strategies(
+    query,
+    [
+        {"search_type": "similarity", "k": 3},
+        {"search_type": "similarity_score_threshold", "k": 3, "score_threshold": 0.3},
+        {"search_type": "mmr", "k": 3, "lambda_mult": 0.5},
+    ] + [{"search_type": "mmr", "k": 3, "lambda_mult": lambda_mult} for lambda_mult in lambda_values],
+    fetch_k=10 # Initial pool to select from
+)
+
 # ──────────────────────────────────────────────────────────────────
 # METHOD 1: Basic Similarity Search
 # Returns the top k most similar documents
 # ──────────────────────────────────────────────────────────────────
 
 print("=== METHOD 1: Similarity Search (k=3) ===")
-retriever = db.as_retriever(search_kwargs={"k": 3})
-
-docs = retriever.invoke(query)
+docs = similarity_docs
 print(f"Retrieved {len(docs)} documents:\n")
 
 for i, doc in enumerate(docs, 1):
@@ -42,15 +47,8 @@ print("-" * 60)
 # ──────────────────────────────────────────────────────────────────
 
 print("\n=== METHOD 2: Similarity with Score Threshold ===")
-retriever = db.as_retriever(
-    search_type="similarity_score_threshold",
-    search_kwargs={
-        "k": 3,
-        "score_threshold": 0.3  # Only return docs with similarity >= 0.3
-    }
-)
+docs = threshold_docs  # Only docs with similarity >= 0.3
 
-docs = retriever.invoke(query)
 print(f"Retrieved {len(docs)} documents (threshold: 0.3):\n")
 
 for i, doc in enumerate(docs, 1):
@@ -65,21 +63,43 @@ print("-" * 60)
 # # ──────────────────────────────────────────────────────────────────
 
 print("\n=== METHOD 3: Maximum Marginal Relevance (MMR) ===")
-retriever = db.as_retriever(
-    search_type="mmr",
-    search_kwargs={
-        "k": 3,           # Final number of docs
-        "fetch_k": 10,    # Initial pool to select from
-        "lambda_mult": 0.5  # 0=max diversity, 1=max relevance
-    }
-)
+docs = mmr_docs  # k=3 from the 10 candidates, λ=0.5 (0=max diversity, 1=max relevance)
 
-docs = retriever.invoke(query)
 print(f"Retrieved {len(docs)} documents (λ=0.5):\n")
 
 for i, doc in enumerate(docs, 1):
     print(f"Document {i}:")
     print(f"{doc.page_content}\n")
 
+# ──────────────────────────────────────────────────────────────────
+# METHOD 4: MMR λ sweep
+# Same candidates, one selection per lambda_mult value
+# ──────────────────────────────────────────────────────────────────
+
+print("\n=== METHOD 4: MMR λ sweep ===")
+for lambda_mult, docs in zip(lambda_values, sweep_docs):
+    print(f"λ={lambda_mult:.2f}: " + " | ".join(doc.page_content[:40].replace("\n", " ") for doc in docs))
+
+# ──────────────────────────────────────────────────────────────────
+# METHOD 5: BM25 and Hybrid Search
+# BM25 matches exact terms ("GitHub", "$7.5 billion") without an embedding call;
+# hybrid runs BM25 and vector search in parallel and fuses the rankings
+# ──────────────────────────────────────────────────────────────────
+
+print("\n=== METHOD 5: BM25 (lexical only) ===")
+for i, doc in enumerate(client.search(query, search_type="bm25", k=3), 1):
+    print(f"Document {i} (BM25 {doc.metadata['score']:.2f}): {doc.page_content[:100]}...\n")
+
+print("\n=== METHOD 5: Hybrid (BM25 + vector, reciprocal-rank fusion) ===")
+for i, doc in enumerate(client.search(query, search_type="hybrid", k=3, fetch_k=10), 1):
+    print(f"Document {i} (RRF {doc.metadata['score']:.4f}): {doc.page_content[:100]}...\n")
+
 print("=" * 60)
-print("Done! Try different queries or parameters to see the differences.")
\ No newline at end of file
+print("Done! Try different queries or parameters to see the differences.")
+
+# Server-side latency per request type (methods 1-4 are one rerank request: one embedding, two store calls)
+metrics = client.metrics()
+cache_stats = metrics.pop("query_embedding_cache")
+for search_type, stats in metrics.items():
+    print(f"{search_type}: {stats['count']} requests, p50 {stats['p50_ms']:.1f} ms, p99 {stats['p99_ms']:.1f} ms")
+print(f"Query embedding cache hit rate: {cache_stats['hit_rate']:.1%}")
\ No newline at end of file
@@ -1,22 +1,15 @@
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
+from langchain_openai import ChatOpenAI
 from dotenv import load_dotenv
 from pydantic import BaseModel
 from typing import List
+from retrieval_client import RetrievalClient
 
 load_dotenv()
 
-# Setup
-persistent_directory = "db/chroma_db"
-embedding_model = OpenAIEmbeddings(model="text-embedding-3-small")
+# Setup: searches go to the retrieval server (python retrieval_server.py)
+client = RetrievalClient()
 llm = ChatOpenAI(model="gpt-4o", temperature=0)
 
-db = Chroma(
-    persist_directory=persistent_directory,
-    embedding_function=embedding_model,
-    collection_metadata={"hnsw:space": "cosine"}
-)
-
 # Pydantic model for structured output
 class QueryVariations(BaseModel):
     queries: List[str]
@@ -50,17 +43,14 @@ for i, variation in enumerate(query_variations, 1): # Print each variation
 print("\n" + "="*60)
 
 # ──────────────────────────────────────────────────────────────────
-# Step 2: Search with Each Query Variation & Store Results
+# Step 2: Search with All Query Variations Concurrently
+# (one batch embedding call, vector and BM25 searches run in parallel on the server)
 # ──────────────────────────────────────────────────────────────────
 
-retriever = db.as_retriever(search_kwargs={"k": 5}) # Initialize retriever with k=5
-all_retrieval_results = [] # To store results from all queries 
-for i, query in enumerate(query_variations, 1): # For each generated query
+fused_docs, all_retrieval_results = client.multi_search(query_variations, k=5, hybrid=True) # k=5 per query
+
+for i, (query, docs) in enumerate(zip(query_variations, all_retrieval_results), 1): # For each generated query
     print(f"\n=== RESULTS FOR QUERY {i}: {query} ===")
-    
-    docs = retriever.invoke(query) # Retrieve documents
-    all_retrieval_results.append(docs) # Store results
-    
     print(f"Retrieved {len(docs)} documents:\n")
     
     for j, doc in enumerate(docs, 1): # Print each retrieved document
@@ -69,6 +59,17 @@ for i, query in enumerate(query_variations, 1): # For each generated query
     
     print("-" * 50)
 
+# ──────────────────────────────────────────────────────────────────
+# Step 3: Reciprocal-Rank Fusion
+# Merges all result lists into one ranking, deduplicated by chunk ID
+# ──────────────────────────────────────────────────────────────────
+
+print("\n" + "="*60)
+print(f"\n=== FUSED RESULTS ({len(fused_docs)} unique documents) ===")
+for j, doc in enumerate(fused_docs, 1):
+    print(f"Document {j} (RRF score: {doc.metadata['score']:.4f}):")
+    print(f"{doc.page_content[:150]}...\n")
+
 print("\n" + "="*60)
 print("Multi-Query Retrieval Complete!")
 
@@ -77,4 +78,5 @@ print("Multi-Query Retrieval Complete!")
 #     [Doc1, Doc2, Doc3, Doc4, Doc5],  ← Query 1 results
 #     [Doc2, Doc1, Doc6, Doc7, Doc3],  ← Query 2 results  
 #     [Doc8, Doc2, Doc9, Doc10, Doc11] ← Query 3 results
-# ]
\ No newline at end of file
+# ]
+# fused_docs = [Doc2, Doc1, Doc3, Doc8, Doc6, ...]  ← one ranked list, no duplicates
@@ -1,9 +1,28 @@
 import os
+import glob
+import json
+import hashlib
+import argparse
+import threading
+import multiprocessing
+from queue import Full, Queue
+from collections import deque
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 from langchain_community.document_loaders import TextLoader, DirectoryLoader
-from langchain_text_splitters import CharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
 from langchain_chroma import Chroma
 from dotenv import load_dotenv
+from embedding_cache import CachedEmbeddings
+from embedding_providers import cache_model_name, create_embeddings, embedding_config
+from embedding_scheduler import EmbeddingScheduler
+from answer_cache import SemanticAnswerCache
+from lexical_index import LexicalIndex
+from quantized_index import QuantizedIndex
+from semantic_chunking import SemanticSplitter
+from agentic_chunking import AgenticSplitter
+from span_splitter import SpanCharacterSplitter
+from context_reader import split_documents_with_locations
+from collection_paths import collection_paths
 
 load_dotenv()
 
@@ -38,18 +57,24 @@ def load_documents(docs_path):
     
   return documents
 
-def split_documents(documents, chunk_size=800, chunk_overlap=0):
-  """Splits documents into smaller chunks"""
+def split_documents(documents, chunk_size=800, chunk_overlap=0, text_splitter=None):
+  """Splits documents into smaller chunks (pass text_splitter to use another splitter, e.g. SemanticSplitter)"""
   print("Splitting documents into chunks...")
   
   # Initialize the text splitter
-  text_splitter = CharacterTextSplitter( # CharacterTextSplitter class from langchain_text_splitters
-    chunk_size=chunk_size, # size of each chunk in characters
-    chunk_overlap=chunk_overlap # overlap between chunks in characters
-  )
+  if text_splitter is None:
+    # Same chunks as CharacterTextSplitter (langchain_text_splitters), computed as offsets
+    text_splitter = SpanCharacterSplitter(
+      chunk_size=chunk_size, # size of each chunk in characters
+      chunk_overlap=chunk_overlap # overlap between chunks in characters
+    )
   
   # Split documents into chunks
-  chunks = text_splitter.split_documents(documents)
+  if hasattr(text_splitter, "split_spans"):
+    # Offset-based splitters also record each chunk's byte range and hash in its source file
+    chunks = split_documents_with_locations(text_splitter, documents)
+  else:
+    chunks = text_splitter.split_documents(documents)
   
   print(f"Total chunks created: {len(chunks)}")
   
@@ -68,36 +93,441 @@ def split_documents(documents, chunk_size=800, chunk_overlap=0):
     
   return chunks
 
-def create_vector_store(chunks, persist_directory="db/chroma_db"):
-  """Create and persist a Chroma vector store from document chunks"""
+def create_embedding_model(model_name=None, cache_path="db/embedding_cache.sqlite3", max_in_flight=4, max_batch_tokens=8000, provider=None):
+  """Creates the embedding model wrapped in a persistent on-disk embedding cache
+  
+  The provider (openai, local or fake) and model come from EMBEDDING_PROVIDER and
+  the provider's model variable (EMBEDDING_MODEL, LOCAL_EMBEDDING_MODEL or
+  FAKE_EMBEDDING_MODEL) unless passed in.
+  """
+  provider, model_name = embedding_config(provider, model_name)
+  if provider == "openai":
+    # OpenAIEmbeddings class from langchain_openai (retries are handled by the scheduler)
+    embedding_model = create_embeddings(provider, model_name, max_retries=0)
+    # Send cache misses as concurrent, token-sized batches with rate-limit backoff
+    embedding_model = EmbeddingScheduler(
+      embedding_model,
+      model_name=model_name,
+      max_in_flight=max_in_flight, # number of batches sent at the same time
+      max_batch_tokens=max_batch_tokens # token budget per batch (shrinks after rate limits)
+    )
+  else:
+    # Local and fake models run in-process, no rate limits to schedule around
+    embedding_model = create_embeddings(provider, model_name)
+  # Chunks already embedded by a previous run are read from the cache instead
+  return CachedEmbeddings(embedding_model, model_name=cache_model_name(provider, model_name), cache_path=cache_path)
+
+def create_vector_store(chunks, persist_directory="db/chroma_db", embedding_model=None, lexical_index_path="db/bm25_index.npz", manifest_path="db/ingest_manifest.json"):
+  """Create and persist a Chroma vector store (and the BM25 index) from document chunks
+  
+  A full rebuild: chunks left over from earlier runs (files that shrank or were
+  removed) are deleted, and the ingest manifest is rewritten so the next
+  --incremental run only picks up later changes.
+  """
   print("Creating embeddings and storing in Chroma vector database...")
   
-  # Initialize the embedding model
-  # OpenAIEmbeddings class from langchain_openai
-  embedding_model = OpenAIEmbeddings(model="text-embedding-3-small") 
+  # Initialize the embedding model (cached, so only new or changed chunks are embedded)
+  if embedding_model is None:
+    embedding_model = create_embedding_model()
   
   # Create ChromaDB vector store
   print("--- Creating Chroma vector store ---")
+  chunk_ids = assign_chunk_ids(chunks)
   vector_store = Chroma.from_documents( # Chroma class from langchain_chroma
     documents=chunks, # document chunks
+    ids=chunk_ids, # stable IDs so re-runs upsert instead of appending duplicates
     embedding=embedding_model, # embedding model
     persist_directory=persist_directory, # directory to persist the database
     collection_metadata={"hnsw:space": "cosine"} # specify algorithm to use cosine similarity
   )
   print("--- Finished creating Chroma vector store ---")
   
+  # Stable IDs are upserted, so IDs past a file's new chunk count (or of removed files) must be deleted
+  stale_ids = sorted(set(vector_store.get(include=[])["ids"]) - set(chunk_ids))
+  if stale_ids:
+    vector_store.delete(ids=stale_ids)
+    print(f"Deleted {len(stale_ids)} stale chunks from earlier runs")
+  
   print(f"Vector store created and persisted at {persist_directory}")
+  
+  # Lexical (BM25) index over the same chunks and IDs, rebuilt from scratch
+  lexical_index = LexicalIndex(lexical_index_path)
+  lexical_index.add_documents(chunks, ids=chunk_ids)
+  lexical_index.save()
+  print(f"BM25 index with {len(lexical_index)} chunks saved at {lexical_index_path}")
+  
+  # Record what was indexed per source file, as incremental_ingest does
+  ids_by_source = {}
+  for chunk, chunk_id in zip(chunks, chunk_ids):
+    ids_by_source.setdefault(chunk.metadata["source"], []).append(chunk_id)
+  manifest = {
+    source: {**file_fingerprint(source), "chunk_ids": ids}
+    for source, ids in ids_by_source.items() if os.path.isfile(source)
+  }
+  save_manifest(manifest, manifest_path)
+  return vector_store
+
+def assign_chunk_ids(chunks):
+  """Builds a stable ID ("<source>:<index>") for every chunk"""
+  ids = []
+  counters = {} # next chunk index per source file
+  for chunk in chunks:
+    source = chunk.metadata["source"]
+    index = counters.get(source, 0)
+    counters[source] = index + 1
+    ids.append(f"{source}:{index}")
+  return ids
+
+def file_fingerprint(path):
+  """Returns mtime, size and content hash of a source file"""
+  sha256 = hashlib.sha256()
+  with open(path, "rb") as f:
+    for block in iter(lambda: f.read(1024 * 1024), b""): # hash in 1 MB blocks
+      sha256.update(block)
+  stat = os.stat(path)
+  return {"mtime": stat.st_mtime, "size": stat.st_size, "sha256": sha256.hexdigest()}
+
+def load_manifest(manifest_path):
+  """Loads the ingest manifest ({source: {mtime, size, sha256, chunk_ids}})"""
+  if not os.path.exists(manifest_path):
+    return {}
+  with open(manifest_path, "r", encoding="utf-8") as f:
+    return json.load(f)
+
+def save_manifest(manifest, manifest_path):
+  """Writes the ingest manifest atomically"""
+  manifest_dir = os.path.dirname(manifest_path)
+  if manifest_dir:
+    os.makedirs(manifest_dir, exist_ok=True)
+  tmp_path = manifest_path + ".tmp"
+  with open(tmp_path, "w", encoding="utf-8") as f:
+    json.dump(manifest, f, indent=2)
+  os.replace(tmp_path, manifest_path) # never leave a half-written manifest behind
+
+def incremental_ingest(docs_path="docs", persist_directory="db/chroma_db", manifest_path="db/ingest_manifest.json", embedding_model=None, answer_cache_path="db/answer_cache.sqlite3", lexical_index_path="db/bm25_index.npz", text_splitter=None):
+  """Only re-indexes source files that were added, changed or removed since the last run"""
+  print(f"Incrementally ingesting documents from {docs_path}...")
+  
+  if not os.path.exists(docs_path):
+    raise FileNotFoundError(f"Directory {docs_path} does not exist.")
+  
+  if embedding_model is None:
+    embedding_model = create_embedding_model()
+  
+  # Open the existing collection (created on the first run)
+  vector_store = Chroma(
+    persist_directory=persist_directory,
+    embedding_function=embedding_model,
+    collection_metadata={"hnsw:space": "cosine"}
+  )
+  
+  # Cached answers built from re-indexed or removed chunks are dropped
+  answer_cache = SemanticAnswerCache(cache_path=answer_cache_path)
+  # The BM25 index gets the same deletes and upserts as the vector store
+  lexical_index = LexicalIndex.load(lexical_index_path)
+  
+  manifest = load_manifest(manifest_path)
+  sources = sorted(glob.glob(os.path.join(docs_path, "*.txt"))) # same files as load_documents
+  skipped, updated = 0, 0
+  
+  for source in sources:
+    entry = manifest.get(source)
+    stat = os.stat(source)
+    
+    # Fast path: unchanged mtime and size means the file was not touched
+    if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+      skipped += 1
+      continue
+    
+    fingerprint = file_fingerprint(source)
+    # Touched but identical content: only refresh the manifest entry
+    if entry and entry["sha256"] == fingerprint["sha256"]:
+      entry.update(fingerprint)
+      skipped += 1
+      continue
+    
+    # New or changed file: drop its old chunks and upsert the new ones
+    if entry and entry["chunk_ids"]:
+      vector_store.delete(ids=entry["chunk_ids"])
+      lexical_index.delete(entry["chunk_ids"])
+      answer_cache.invalidate_chunks(entry["chunk_ids"])
+    chunks = split_documents(TextLoader(source).load(), text_splitter=text_splitter)
+    chunk_ids = assign_chunk_ids(chunks)
+    if chunks:
+      vector_store.add_documents(documents=chunks, ids=chunk_ids)
+      lexical_index.add_documents(chunks, ids=chunk_ids)
+    manifest[source] = {**fingerprint, "chunk_ids": chunk_ids}
+    updated += 1
+    print(f"Re-indexed {source} ({len(chunk_ids)} chunks)")
+  
+  # Purge files that no longer exist in the docs directory
+  current_sources = set(sources)
+  removed = [source for source in manifest if source not in current_sources]
+  for source in removed:
+    if manifest[source]["chunk_ids"]:
+      vector_store.delete(ids=manifest[source]["chunk_ids"])
+      lexical_index.delete(manifest[source]["chunk_ids"])
+      answer_cache.invalidate_chunks(manifest[source]["chunk_ids"])
+    del manifest[source]
+    print(f"Removed {source} from the vector store")
+  
+  if updated or removed:
+    lexical_index.save()
+  save_manifest(manifest, manifest_path)
+  print(f"Incremental ingest finished: {updated} updated, {skipped} unchanged, {len(removed)} removed")
+  return vector_store
+
+def iter_documents(docs_path):
+  """Lazily yields text documents from the docs directory, one file at a time"""
+  if not os.path.exists(docs_path):
+    raise FileNotFoundError(f"Directory {docs_path} does not exist.")
+  
+  loader = DirectoryLoader(path=docs_path, glob="*.txt", loader_cls=TextLoader)
+  yield from loader.lazy_load() # unlike load(), never materialises the whole corpus
+
+def iter_chunks(documents, chunk_size=800, chunk_overlap=0):
+  """Splits documents one at a time, yielding (chunk_id, chunk) pairs"""
+  text_splitter = SpanCharacterSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+  for document in documents:
+    chunks = split_documents_with_locations(text_splitter, [document]) # with byte ranges in the source file
+    yield from zip(assign_chunk_ids(chunks), chunks)
+
+def iter_batches(items, batch_size):
+  """Groups (chunk_id, chunk) pairs into (ids, chunks) batches of at most batch_size"""
+  ids, chunks = [], []
+  for chunk_id, chunk in items:
+    ids.append(chunk_id)
+    chunks.append(chunk)
+    if len(chunks) == batch_size:
+      yield ids, chunks
+      ids, chunks = [], []
+  if chunks:
+    yield ids, chunks
+
+def load_and_split_file(source, chunk_size=800, chunk_overlap=0):
+  """Loads and splits a single file into (chunk_id, chunk) pairs (runs in a worker process)"""
+  documents = TextLoader(source).load()
+  text_splitter = SpanCharacterSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+  chunks = split_documents_with_locations(text_splitter, documents) # with byte ranges in the source file
+  return list(zip(assign_chunk_ids(chunks), chunks))
+
+def create_process_pool(workers=None):
+  """Process pool for loading and splitting files
+  
+  Workers are started with "spawn", never forked: the pool is used from the
+  streaming producer thread, and forking a process that runs threads (ours,
+  Chroma's, the HTTP client's) can deadlock the child.
+  """
+  return ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1, mp_context=multiprocessing.get_context("spawn"))
+
+def iter_chunks_parallel(docs_path, workers=None, chunk_size=800, chunk_overlap=0, executor=None):
+  """Loads and splits files across a process pool, yielding (chunk_id, chunk) pairs in file order
+  
+  Pass an executor from create_process_pool(workers) to use a pool created by the caller.
+  """
+  if not os.path.exists(docs_path):
+    raise FileNotFoundError(f"Directory {docs_path} does not exist.")
+  
+  sources = sorted(glob.glob(os.path.join(docs_path, "*.txt"))) # sorted so chunk order is deterministic
+  worker = partial(load_and_split_file, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+  own_executor = executor is None
+  if own_executor:
+    executor = create_process_pool(workers)
+  max_pending = (workers or os.cpu_count() or 1) * 2 # keep every worker busy without queueing the whole corpus
+  
+  try:
+    pending = deque()
+    for source in sources:
+      pending.append(executor.submit(worker, source))
+      if len(pending) >= max_pending:
+        yield from pending.popleft().result() # results come back in submission order
+    while pending:
+      yield from pending.popleft().result()
+  finally:
+    if own_executor:
+      executor.shutdown(cancel_futures=True)
+
+def stream_ingest(docs_path="docs", persist_directory="db/chroma_db", batch_size=256, max_pending_batches=2, embedding_model=None, workers=None, lexical_index_path="db/bm25_index.npz", manifest_path="db/ingest_manifest.json"):
+  """Streams load -> split -> embed -> upsert with bounded chunk and vector memory
+  
+  A background thread loads and splits documents into a queue that holds at most
+  max_pending_batches batches. When embedding falls behind, the producer blocks
+  (backpressure), so chunk text and embeddings in flight stay proportional to the
+  batch size (plus the file being split), not to the corpus size.
+  
+  What still grows with the corpus: the BM25 index (held in memory until it is
+  saved), the chunk IDs upserted per source, and the collection's ID list read
+  for the stale-chunk cleanup at the end. These are IDs and postings, not chunk
+  text or vectors, so they are a small fraction of the corpus size.
+  
+  With workers set, loading and splitting are sharded by file across a process
+  pool; this process stays the only writer to the Chroma collection.
+  
+  Every file is streamed, so once the stream ends the chunks of earlier runs that
+  were not re-upserted (files that shrank or were removed) are deleted from both
+  the vector store and the BM25 index, and the ingest manifest is rewritten.
+  """
+  print(f"Streaming documents from {docs_path} in batches of {batch_size}...")
+  
+  if embedding_model is None:
+    embedding_model = create_embedding_model()
+  
+  vector_store = Chroma(
+    persist_directory=persist_directory,
+    embedding_function=embedding_model,
+    collection_metadata={"hnsw:space": "cosine"}
+  )
+  
+  lexical_index = LexicalIndex.load(lexical_index_path) # upserted batch by batch, like the vector store
+  
+  # The process pool is created here, in the calling thread, and handed to the producer
+  executor = create_process_pool(workers) if workers else None
+  
+  batches = Queue(maxsize=max_pending_batches) # bounded queue between producer and consumer
+  done = object() # marks the end of the stream
+  stop = threading.Event() # set when the consumer stops early, so the producer does not block forever
+  
+  def put(item):
+    """Blocks while the queue is full, gives up once the consumer has stopped"""
+    while not stop.is_set():
+      try:
+        batches.put(item, timeout=0.1)
+        return True
+      except Full:
+        pass
+    return False
+  
+  def produce():
+    try:
+      if workers:
+        chunks = iter_chunks_parallel(docs_path, workers=workers, executor=executor)
+      else:
+        chunks = iter_chunks(iter_documents(docs_path))
+      for batch in iter_batches(chunks, batch_size):
+        if not put(batch):
+          return
+    except Exception as e:
+      put(e) # hand errors over to the consumer
+      return
+    put(done)
+  
+  producer = threading.Thread(target=produce, daemon=True)
+  producer.start()
+  
+  total_chunks = 0
+  ids_by_source = {} # chunk IDs upserted in this run, per source file
+  try:
+    while True:
+      batch = batches.get()
+      if batch is done:
+        break
+      if isinstance(batch, Exception):
+        raise batch
+      ids, chunks = batch
+      vector_store.add_documents(documents=chunks, ids=ids) # embed and upsert this batch only
+      lexical_index.add_documents(chunks, ids=ids)
+      for chunk, chunk_id in zip(chunks, ids):
+        ids_by_source.setdefault(chunk.metadata["source"], []).append(chunk_id)
+      total_chunks += len(chunks)
+      print(f"Upserted {total_chunks} chunks...")
+  finally:
+    stop.set()
+    producer.join()
+    if executor is not None:
+      executor.shutdown(cancel_futures=True)
+  
+  if total_chunks == 0:
+    raise FileNotFoundError(f"No text files found in directory {docs_path}.")
+  
+  # Delete the chunks this run did not upsert, from the vector store and the BM25 postings alike
+  streamed_ids = {chunk_id for ids in ids_by_source.values() for chunk_id in ids}
+  stale_ids = sorted((set(vector_store.get(include=[])["ids"]) | set(lexical_index.doc_numbers)) - streamed_ids)
+  if stale_ids:
+    vector_store.delete(ids=stale_ids)
+    lexical_index.delete(stale_ids)
+    print(f"Deleted {len(stale_ids)} stale chunks from earlier runs")
+  
+  lexical_index.save()
+  save_manifest({
+    source: {**file_fingerprint(source), "chunk_ids": ids}
+    for source, ids in ids_by_source.items() if os.path.isfile(source)
+  }, manifest_path)
+  print(f"Streaming ingest finished: {total_chunks} chunks persisted at {persist_directory}")
   return vector_store
 
+def build_quantized_index(vector_store, mode="int8", dims=None, directory="db/quantized_index"):
+  """Builds the compact int8/binary index (with Matryoshka truncation to dims) from the stored embeddings
+  
+  mode=None rebuilds an existing index with its saved mode and dims (nothing is
+  built if there is none), so every ingestion run keeps it in sync with Chroma.
+  """
+  if mode is None:
+    header = QuantizedIndex.header(directory)
+    if header is None:
+      return None
+    mode, dims = header["mode"], header["dims"]
+  index = QuantizedIndex.from_chroma(vector_store, mode=mode, dims=dims)
+  index.save(directory)
+  print(f"Quantized index ({mode}, {dims or 'all'} dims) with {len(index)} chunks saved at {directory}: "
+        f"{index.memory_bytes() / 1e6:.1f} MB in RAM vs {index.full.nbytes / 1e6:.1f} MB of float32 vectors")
+  return index
+
+def create_text_splitter(name, embedding_model=None):
+  """Returns the splitter selected with --splitter (None = SpanCharacterSplitter)"""
+  if name == "semantic":
+    # Sentence embeddings go through the same cached embedding model as the chunks
+    return SemanticSplitter(embedding_model or create_embedding_model(), breakpoint_type="percentile", breakpoint_amount=95)
+  if name == "agentic":
+    # LLM-chosen boundaries over overlapping windows, processed 8 at a time (cached per window)
+    from langchain_openai import ChatOpenAI
+    return AgenticSplitter(ChatOpenAI(model="gpt-4o", temperature=0), target_chars=800, max_concurrency=8)
+  return None
+
 def main():
   print("Main function executed")
   
+  parser = argparse.ArgumentParser(description="Ingest documents into the Chroma vector database")
+  parser.add_argument("--persist-directory", default="db/chroma_db", help="Chroma directory to ingest into (use one per embedding provider)")
+  mode = parser.add_mutually_exclusive_group()
+  mode.add_argument("--incremental", action="store_true", help="only re-index added, changed or removed files")
+  mode.add_argument("--stream", action="store_true", help="stream documents through the pipeline with bounded chunk and vector memory")
+  parser.add_argument("--batch-size", type=int, default=256, help="chunks per embedding batch in --stream mode")
+  parser.add_argument("--workers", type=int, default=None, help="load and split files across this many processes (requires --stream)")
+  parser.add_argument("--splitter", choices=["character", "semantic", "agentic"], default="character", help="how documents are split into chunks (full and --incremental modes)")
+  parser.add_argument("--quantize", choices=["int8", "binary"], default=None, help="also build a compact quantized index for the retrieval server (an existing one is rebuilt on every run)")
+  parser.add_argument("--dims", type=int, default=None, help="truncate embeddings to this many dimensions in the quantized index")
+  args = parser.parse_args()
+  if args.workers and not args.stream:
+    parser.error("--workers only applies to --stream mode, pass --stream --workers N")
+  persist_directory = args.persist_directory
+  manifest_path, quantized_index_dir, lexical_index_path, answer_cache_path = collection_paths(persist_directory)
+  
+  if args.incremental:
+    embedding_model = create_embedding_model()
+    text_splitter = create_text_splitter(args.splitter, embedding_model)
+    vector_store = incremental_ingest(docs_path="docs", persist_directory=persist_directory, manifest_path=manifest_path, embedding_model=embedding_model, answer_cache_path=answer_cache_path, lexical_index_path=lexical_index_path, text_splitter=text_splitter)
+    embedding_model.print_stats()
+    build_quantized_index(vector_store, mode=args.quantize, dims=args.dims, directory=quantized_index_dir) # rebuilt if one exists, even without --quantize
+    return
+  
+  if args.stream:
+    embedding_model = create_embedding_model()
+    vector_store = stream_ingest(docs_path="docs", persist_directory=persist_directory, manifest_path=manifest_path, lexical_index_path=lexical_index_path, batch_size=args.batch_size, embedding_model=embedding_model, workers=args.workers)
+    embedding_model.print_stats()
+    build_quantized_index(vector_store, mode=args.quantize, dims=args.dims, directory=quantized_index_dir) # rebuilt if one exists, even without --quantize
+    return
+  
   #1. Load documents from a directory
   documents = load_documents(docs_path="docs")
   #2. Split documents into chunks
-  chunks = split_documents(documents)
+  embedding_model = create_embedding_model()
+  chunks = split_documents(documents, text_splitter=create_text_splitter(args.splitter, embedding_model))
   #3. Generate embeddings for each chunk and store embeddings in a vector database
-  vector_store = create_vector_store(chunks)
+  vector_store = create_vector_store(chunks, persist_directory=persist_directory, manifest_path=manifest_path, lexical_index_path=lexical_index_path, embedding_model=embedding_model)
+  #4. Report how many chunks were served from the embedding cache
+  embedding_model.print_stats()
+  #5. Build the compact quantized index (--quantize), or rebuild the existing one
+  build_quantized_index(vector_store, mode=args.quantize, dims=args.dims, directory=quantized_index_dir)
   
 if __name__ == "__main__":
   main()
\ No newline at end of file
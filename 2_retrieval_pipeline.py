@@ -1,41 +1,32 @@
-from langchain_chroma import Chroma
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage
 from dotenv import load_dotenv
+from retrieval_client import RetrievalClient
 
 load_dotenv()
 
-# Initialize Chroma vector database
-persistent_directory = "db/chroma_db"
-
-# Initialize the embedding model
-embedding_model = OpenAIEmbeddings(model="text-embedding-3-small")
-
-# Load the persisted Chroma vector database
-db = Chroma(
-  persist_directory=persistent_directory,
-  embedding_function=embedding_model,
-  collection_metadata={"hnsw:space": "cosine"}
-)
+# Connect to the retrieval server (python retrieval_server.py), which keeps
+# the Chroma vector database and the embedding model loaded between requests
+client = RetrievalClient()
 
 # Example user query
 query = "What was Microsoft's first hardware product release?"
 
-# Create a retriever from the vector database
-retriever = db.as_retriever(search_kwargs={"k": 5}) # retrieve top 3 most similar chunks
+# Retrieve relevant document chunks for the query
+relevant_docs = client.search(query, search_type="hybrid", k=5) # top 5 chunks by BM25 + vector similarity (fused)
+
+## Dense-only or lexical-only (no embedding call) searches
+# relevant_docs = client.search(query, k=5)
+# relevant_docs = client.search(query, search_type="bm25", k=5)
 
-## Another way to create retriever with different search parameters
-# retriever = db.as_retriever(
+## Another way to search with different search parameters
+# relevant_docs = client.search(
+#   query,
 #   search_type="similarity_score_threshold", # use similarity score thresholding
-#   search_kwargs={
-#     "k": 3, # retrieve top 3 most similar chunks
-#     "score_threshold": 0.3 # only return chunks with similarity score above 0.3
-#   }
+#   k=3, # retrieve top 3 most similar chunks
+#   score_threshold=0.3 # only return chunks with similarity score above 0.3
 # )
 
-# Retrieve relevant document chunks for the query
-relevant_docs = retriever.invoke(query)
-
 print(f"User Query: {query}\n")
 
 print("--- Retrieved Relevant Document Chunks ---")
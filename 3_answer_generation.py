@@ -1,53 +1,73 @@
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
+from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, SystemMessage
 from dotenv import load_dotenv
+from retrieval_client import RetrievalClient
+from answer_cache import SemanticAnswerCache
+from streaming_generation import print_stream
+from context_reader import ContextReader
 
 load_dotenv()
 
-persistent_directory = "db/chroma_db"
+# Retrieval is served by the long-lived retrieval server (python retrieval_server.py)
+client = RetrievalClient()
 
-embedding_model = OpenAIEmbeddings(model="text-embedding-3-small")
+# Answers to near-identical questions over the same chunks are reused
+answer_cache = SemanticAnswerCache(threshold=0.95)
 
-db = Chroma(
-  persist_directory=persistent_directory,
-  embedding_function=embedding_model,
-  collection_metadata={"hnsw:space": "cosine"})
+# Context is sliced from the memory-mapped source files at the byte ranges recorded at ingest time;
+# neighbouring chunks are looked up by ID (metadata only) when context is widened, and the text of
+# chunks sent without it that cannot be read here (another host, edited file) is fetched by ID
+context_reader = ContextReader(fetch_metadatas=client.chunk_metadatas, fetch_texts=client.chunk_texts)
 
 query = "What was Microsoft's first hardware product release?"
 
-retriever = db.as_retriever(search_kwargs={"k": 5})
+# Embed the query (cached by the server, so the search below does not embed it again)
+query_embedding = client.embed_query(query)
 
 # Retrieve relevant document chunks for the query
-relevant_docs = retriever.invoke(query)
+# (chunks found at their recorded location are sent without text: context_reader reads them from the files)
+relevant_docs = client.search(query, k=5, omit_located_text=True)
 
 print(f"User Query: {query}\n")
 
 # print("--- Retrieved Relevant Document Chunks ---")
 # for i, doc in enumerate(relevant_docs, 1):
-#   print(f"Document {i}:\n{doc.page_content}\n ")
+#   print(f"Document {i}:\n{context_reader.build_context([doc])}\n ")
   
-# Combine query with retrieved documents for further processing (e.g., generating answers)
-# This part can be integrated with a language model to generate answers based on the retrieved documents.
-combined_input = f"""Based on the following documents, answer the Query: {query}
+# Serve the answer from the cache when a similar question was answered over the same chunks
+cached_answer = answer_cache.lookup(query_embedding, relevant_docs)
 
-Documents: {chr(10).join([doc.page_content for doc in relevant_docs])} 
+if cached_answer is not None:
+  print("--- Model Response (cached) ---")
+  print(cached_answer)
+else:
+  # Adjacent retrieved chunks of the same file become one passage (neighbours=1 adds a chunk on each side)
+  context_windows = context_reader.windows(relevant_docs, neighbours=0)
+  context = chr(10).join(context_reader.read(window) for window in context_windows)
+  print(f"Context: {len(relevant_docs)} chunks -> {len(context_windows)} passages, {context_reader.bytes_read} bytes read from source files\n")
+  
+  # Combine query with retrieved documents for further processing (e.g., generating answers)
+  # This part can be integrated with a language model to generate answers based on the retrieved documents.
+  combined_input = f"""Based on the following documents, answer the Query: {query}
+
+Documents: {context} 
 
 Provide a clear answer using only the information from the documents above. If the information is not available, respond with 'Information not found in the documents.'
 """
 
-# Model initialization (example using ChatOpenAI)
-model = ChatOpenAI(model="gpt-4o")
+  # Model initialization (example using ChatOpenAI)
+  model = ChatOpenAI(model="gpt-4o", stream_usage=True) # stream_usage reports exact token counts
 
-# Prepare messages for the model
-messages = [
-  SystemMessage(content="You are a helpful assistant that provides answers based on the provided documents."),
-  HumanMessage(content=combined_input)
-]
+  # Prepare messages for the model
+  messages = [
+    SystemMessage(content="You are a helpful assistant that provides answers based on the provided documents."),
+    HumanMessage(content=combined_input)
+  ]
 
-# Get the model's response
-result = model.invoke(messages)
-
-# Print the model's response
-print("--- Model Response ---")
-print(result.content)
\ No newline at end of file
+  # Stream the model's response, printing tokens as they arrive
+  print("--- Model Response ---")
+  answer, metrics = print_stream(model, messages)
+  metrics.print() # time to first token and tokens/sec
+  
+  # Cache the answer with the query embedding and the retrieved chunk IDs
+  answer_cache.store(query, query_embedding, relevant_docs, answer)
\ No newline at end of file
@@ -1,46 +1,67 @@
+import uuid
 from dotenv import load_dotenv
 from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+from langchain_openai import ChatOpenAI
+from langchain_core.messages import HumanMessage, SystemMessage
+from embedding_cache import QueryEmbeddingCache
+from embedding_providers import cache_model_name, create_embeddings, embedding_config
+from answer_cache import SemanticAnswerCache
+from collection_paths import collection_paths
+from streaming_generation import print_stream
+from chat_history import ChatHistoryStore
+from query_rewrite import ConversationalRewriter
 
 # Initialize environment variables
 load_dotenv()
 
 # Initialize Chroma vector database and embedding model
 persistent_directory = "db/chroma_db"
-embedding_model = OpenAIEmbeddings(model="text-embedding-3-small")
+# Repeated (or rewritten to the same) questions reuse the cached query embedding
+# (provider from EMBEDDING_PROVIDER, model from its own variable, OpenAI by default)
+embedding_provider, embedding_model_name = embedding_config()
+embedding_model = QueryEmbeddingCache(
+  create_embeddings(embedding_provider, embedding_model_name),
+  model_name=cache_model_name(embedding_provider, embedding_model_name),
+  max_size=1000, # number of queries to keep
+  ttl=3600 # seconds before a cached embedding expires
+)
 
 # Load the persisted Chroma vector database
 db = Chroma(
   persist_directory=persistent_directory,
   embedding_function=embedding_model)
 
-# Set up the language model
-model = ChatOpenAI(model="gpt-4o")
+# Set up the language model (stream_usage reports exact token counts when streaming)
+model = ChatOpenAI(model="gpt-4o", stream_usage=True)
 
-# Store chat history
-chat_history = []
+# Reuse answers to near-identical (standalone) questions over the same chunks
+_, _, _, answer_cache_path = collection_paths(persistent_directory) # the cache incremental ingest invalidates
+answer_cache = SemanticAnswerCache(cache_path=answer_cache_path, threshold=0.95)
 
-def ask_question(user_input):
+# Store chat history per session, bounded by a token budget
+# (older turns are compacted into a rolling summary, idle sessions are evicted)
+history_store = ChatHistoryStore(
+  summary_model=model,
+  max_tokens=2000, # token budget of the recent turns per session
+  max_sessions=1000, # least recently used sessions are evicted beyond this
+  idle_timeout=3600 # seconds before an idle session is evicted
+)
+
+# Rewrites follow-ups to standalone queries, skipping the LLM for self-contained
+# questions and memoising rewrites per (conversation state, input)
+rewriter = ConversationalRewriter(model)
+
+def ask_question(user_input, session_id="default", stream=False):
   print(f"\nUser Query: {user_input}\n")
   
-  # Make input standalone if chat history exists
-  if chat_history:
-    # Ask the model to rewrite the input
-    messages = [
-            SystemMessage(content="Given the chat history, rewrite the new input to be standalone and searchable. Just return the rewritten input."),
-        ] + chat_history + [
-            HumanMessage(content=f"New input: {user_input}")
-        ]
-    # Get the rewritten input from the model
-    rewritten_response = model.invoke(messages)
-    
+  # Bounded history of this session (summary + recent turns)
+  chat_history = history_store.messages(session_id)
+  
+  # Make input standalone if chat history exists (only calls the model when needed)
+  standalone_input, reason = rewriter.rewrite(user_input, chat_history)
+  if standalone_input != user_input:
     # Use the rewritten input for searching
-    standalone_input = rewritten_response.content.strip()
-    print(f"Searching for: {standalone_input}\n")
-  else:
-    # No chat history, use the original input
-    standalone_input = user_input
+    print(f"Searching for: {standalone_input} ({reason})\n")
   
   # Find relevant documents
   retriever = db.as_retriever(search_kwargs={"k": 5})
@@ -53,40 +74,58 @@ def ask_question(user_input):
     preview = '\n'.join(lines) # Preview of the document content
     print(f"Document {i} Preview:\n{preview}\n")
     
-  # Create prompt
-  combined_input = f"""Based on the following documents, answer the Query: {standalone_input}
-  Documents: {chr(10).join([doc.page_content for doc in relevant_docs])}
-  Provide a clear answer using only the information from the documents above. If the information is not available, respond with 'Information not found in the documents.'
-  """
-  # Prepare messages for the model
-  messages = [
-    SystemMessage(content="You are a helpful assistant that provides answers based on the provided documents."),
-    HumanMessage(content=combined_input)
-  ]
+  # Check the answer cache (the query embedding is already cached from the retrieval above)
+  query_embedding = embedding_model.embed_query(standalone_input)
+  answer = answer_cache.lookup(query_embedding, relevant_docs)
   
-  result = model.invoke(messages)
-  answer = result.content
+  from_cache = answer is not None
+  if from_cache:
+    print("(answer served from cache)")
+  else:
+    # Create prompt
+    combined_input = f"""Based on the following documents, answer the Query: {standalone_input}
+    Documents: {chr(10).join([doc.page_content for doc in relevant_docs])}
+    Provide a clear answer using only the information from the documents above. If the information is not available, respond with 'Information not found in the documents.'
+    """
+    # Prepare messages for the model
+    messages = [
+      SystemMessage(content="You are a helpful assistant that provides answers based on the provided documents."),
+      HumanMessage(content=combined_input)
+    ]
+    
+    if stream:
+      # Print tokens as they arrive instead of waiting for the full response
+      print("Answer: ", end="", flush=True)
+      answer, metrics = print_stream(model, messages)
+      metrics.print()
+    else:
+      result = model.invoke(messages)
+      answer = result.content
+    answer_cache.store(standalone_input, query_embedding, relevant_docs, answer)
   
-  # Save to chat history
-  chat_history.append(HumanMessage(content=user_input))
-  chat_history.append(AIMessage(content=answer))
+  # Save to chat history (may compact older turns into the summary)
+  history_store.add_turn(session_id, user_input, answer)
   
-  # Print the model's response
-  print(f"Answer: {answer}")
+  # Print the model's response (already printed while streaming)
+  if not stream or from_cache:
+    print(f"Answer: {answer}")
   return answer
 
 # Simple function to ask a question and get response from the model
 def start_chat():
   print("Ask question, and type 'exit' to quit.")
+  session_id = str(uuid.uuid4()) # each chat gets its own history
   
   while True:
     user_input = input("Enter question: ")
     
     if user_input.lower() == 'exit':
+      embedding_model.print_stats()
+      answer_cache.print_stats()
       print("Exiting chat.")
       break
     
-    ask_question(user_input)
+    ask_question(user_input, session_id=session_id, stream=True)
 
 if __name__ == "__main__":
   start_chat()
\ No newline at end of file
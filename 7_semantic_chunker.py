@@ -1,5 +1,5 @@
 from langchain_experimental.text_splitter import SemanticChunker
-from langchain_openai import OpenAIEmbeddings
+from embedding_providers import create_embeddings
 from dotenv import load_dotenv
 
 load_dotenv()  # Load environment variables from .env file
@@ -21,7 +21,7 @@ Tesla is working to diversify its supplier base.
 New manufacturing techniques are being implemented to reduce costs."""
 
 semantic_splitter = SemanticChunker(
-    embeddings=OpenAIEmbeddings(),
+    embeddings=create_embeddings(), # EMBEDDING_PROVIDER=openai (default), local or fake
     # Breakpoint threshold type and amount
     # Options: "percentile", "standard_deviation"
     # "percentile" means the threshold is a percentile of the embedding distances
@@ -1,8 +1,17 @@
+import argparse
+
 from langchain_openai import ChatOpenAI
+from langchain_community.document_loaders import TextLoader
 from dotenv import load_dotenv
+from agentic_chunking import AgenticSplitter
 
 load_dotenv()  # Load environment variables from .env file
 
+parser = argparse.ArgumentParser(description="Agentic chunking demo")
+parser.add_argument("--long", nargs="?", const="docs/tesla.txt", default=None, metavar="PATH",
+                    help="also chunk a long document with AgenticSplitter (default docs/tesla.txt, many LLM calls on the first run)")
+args = parser.parse_args()
+
 # Initialize the ChatOpenAI model with GPT-4 and temperature set to 0
 llm = ChatOpenAI(model="gpt-4o", temperature=0)
 
@@ -57,4 +66,13 @@ for chunk in chunks:
 # Print the resulting chunks
 for i, chunk in enumerate(clean_chunks):
     print(f"Chunk {i}: ({len(chunk)} chars)")
-    print(f"{chunk}\n")
\ No newline at end of file
+    print(f"{chunk}\n")
+
+# Long documents (--long): a single prompt exceeds the output limit, so AgenticSplitter
+# sends overlapping windows of numbered lines (8 at a time) and only asks for
+# the line numbers where chunks start. The chunks are cut from the source text.
+if args.long:
+    agentic_splitter = AgenticSplitter(llm, target_chars=800, window_lines=150, overlap_lines=20, max_concurrency=8)
+    documents = TextLoader(args.long).load()
+    long_chunks = agentic_splitter.split_documents(documents) # drop-in for text_splitter.split_documents
+    print(f"{args.long}: {len(long_chunks)} chunks, longest {max((len(chunk.page_content) for chunk in long_chunks), default=0)} chars")
\ No newline at end of file
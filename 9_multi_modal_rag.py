@@ -2,8 +2,14 @@
 # pip install "unstructured[all-docs]" 
 
 
+import os
 import json
+import gzip
+import hashlib
 from typing import List
+import tempfile
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 import ssl
 import nltk
 
@@ -20,31 +26,145 @@ nltk.download('averaged_perceptron_tagger_eng', quiet=True)
 # Unstructured for document parsing
 from unstructured.partition.pdf import partition_pdf
 from unstructured.chunking.title import chunk_by_title
+from unstructured.staging.base import elements_to_dicts, elements_from_dicts
+from unstructured.__version__ import __version__ as unstructured_version
+from unstructured.documents.elements import assign_and_map_hash_ids
+from pypdf import PdfReader, PdfWriter # installed with unstructured[pdf]
 
 # LangChain components
 from langchain_core.documents import Document
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_openai import ChatOpenAI
 from langchain_chroma import Chroma
 from langchain_core.messages import HumanMessage
 from dotenv import load_dotenv
+from embedding_scheduler import EmbeddingScheduler
+from embedding_providers import create_embeddings, embedding_config
+from streaming_generation import print_stream
+from blob_store import BlobStore
+from image_preprocessing import ImagePreprocessor
+from chunk_summarization import summarize_contents
 
 load_dotenv()
 
-# Step 1: Partition PDF using unstructured library
-def partition_document(file_path: str):
-    """Extract elements from PDF using unstructured"""
-    print(f"Partitioning {file_path}...")
+# Images and tables live in a content-addressed blob store, Chroma metadata only keeps references
+blob_store = BlobStore("db/blobs")
+
+# Images are deduplicated, downsized and recompressed before every vision call
+image_preprocessor = ImagePreprocessor(max_pixels=1024 * 1024, max_bytes=200_000, max_images=8)
+
+# Options passed to partition_pdf (part of the partition cache key)
+PARTITION_OPTIONS = {
+    "strategy": "hi_res", # Use hi_res strategy for better extraction (most accurate but slower)
+    "infer_table_structure": True, # Keep tables as structured data, not just scrambled text
+    "extract_image_block_types": ["Image"], # Extract image blocks
+    "extract_image_block_to_payload": True # Extract image blocks to payload as base64 data
+}
+
+def partition_cache_key(file_path: str, options: dict) -> str:
+    """Cache key from the PDF bytes, the partition options and the unstructured version"""
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(block)
+    sha256.update(json.dumps(options, sort_keys=True).encode("utf-8"))
+    sha256.update(unstructured_version.encode("utf-8"))
+    return sha256.hexdigest()
+
+def partition_page_range(file_path: str, range_path: str, starting_page: int, last_modified: str):
+    """Partition one page range (runs in a worker process), returns element dicts"""
     elements = partition_pdf(
-        filename=file_path, # Path to the PDF file
-        strategy="hi_res", # Use hi_res strategy for better extraction (most accurate but slower)
-        infer_table_structure=True, # Keep tables as structured data, not just scrambled text
-        extract_image_block_types=["Image"], # Extract image blocks
-        extract_image_block_to_payload=True # Extract image blocks to payload as base64 data
+        filename=range_path,
+        starting_page_number=starting_page, # keep the page numbers of the full PDF
+        metadata_filename=file_path, # and its filename/directory
+        metadata_last_modified=last_modified,
+        **PARTITION_OPTIONS
     )
+    return elements_to_dicts(elements)
+
+def partition_pdf_parallel(file_path: str, workers: int = None, pages_per_task: int = 20):
+    """Split the PDF into page ranges and partition them in a process pool
+
+    Ranges are merged back in page order, so element order and page numbers match
+    a serial partition_pdf run. Element ids are re-derived over the merged list.
+    """
+    reader = PdfReader(file_path)
+    page_count = len(reader.pages)
+    workers = workers or os.cpu_count() or 1
+    # Same last_modified as a serial run reads from the original file
+    last_modified = datetime.fromtimestamp(os.path.getmtime(file_path)).strftime("%Y-%m-%dT%H:%M:%S")
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Write each page range to its own small PDF
+        tasks = []
+        for start in range(0, page_count, pages_per_task):
+            writer = PdfWriter()
+            for page in reader.pages[start:start + pages_per_task]:
+                writer.add_page(page)
+            range_path = os.path.join(tmp_dir, f"pages_{start + 1}.pdf")
+            with open(range_path, "wb") as f:
+                writer.write(f)
+            tasks.append((range_path, start + 1))
+        
+        print(f"Partitioning {file_path} ({page_count} pages) in {len(tasks)} page ranges on {workers} processes...")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(partition_page_range, file_path, range_path, start, last_modified) for range_path, start in tasks]
+            elements = []
+            for future in futures: # results in page order
+                elements.extend(elements_from_dicts(future.result()))
+    
+    # Ids hash the element's position in the document, so recompute them for the merged list
+    return assign_and_map_hash_ids(elements)
+
+# Step 1: Partition PDF using unstructured library
+def partition_document(file_path: str, cache_dir: str = "db/partition_cache", use_cache: bool = True, workers: int = 1, pages_per_task: int = 20):
+    """Extract elements from PDF using unstructured (cached on disk by content hash + options)
+    
+    workers > 1 (or None for all CPUs) partitions page ranges in parallel; the result
+    (and its cache entry) is the same as the serial run.
+    """
+    cache_path = os.path.join(cache_dir, partition_cache_key(file_path, PARTITION_OPTIONS) + ".json.gz")
+    
+    # Byte-identical PDF with the same options: skip partitioning entirely
+    if use_cache and os.path.exists(cache_path):
+        with gzip.open(cache_path, "rt", encoding="utf-8") as f:
+            elements = elements_from_dicts(json.load(f))
+        print(f"Loaded {len(elements)} elements for {file_path} from partition cache")
+        return elements
+    
+    if workers == 1:
+        print(f"Partitioning {file_path}...")
+        elements = partition_pdf(
+            filename=file_path, # Path to the PDF file
+            **PARTITION_OPTIONS
+        )
+    else:
+        elements = partition_pdf_parallel(file_path, workers=workers, pages_per_task=pages_per_task)
     
     print(f"Extracted {len(elements)} elements")
+    
+    if use_cache:
+        # Store as compact gzipped JSON, written atomically
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = cache_path + ".tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(elements_to_dicts(elements), f, separators=(",", ":"))
+        os.replace(tmp_path, cache_path)
+    
     return elements
 
+def compare_partitions(file_path: str, workers: int = 4, pages_per_task: int = 4):
+    """Partitions a PDF serially and in parallel (cache bypassed), returns both element lists
+
+    Check with element_rows(serial) == element_rows(parallel).
+    """
+    serial = partition_document(file_path, use_cache=False, workers=1)
+    parallel = partition_document(file_path, use_cache=False, workers=workers, pages_per_task=pages_per_task)
+    return serial, parallel
+
+def element_rows(elements):
+    """(id, category, page number, text) of each element, for comparing partition runs"""
+    return [(element.id, element.category, element.metadata.page_number, element.text) for element in elements]
+
 # Step 2: Chunking by title
 def create_chunks_by_title(elements):
     """Create intelligent chunks using title-based strategy"""
@@ -90,120 +210,43 @@ def separate_content_types(chunk):
     content_data['types'] = list(set(content_data['types'])) # Remove duplicates in types
     return content_data # Return the content data dictionary
 
-def create_ai_enhanced_summary(text: str, tables: List[str], images: List[str]) -> str:
-    """Create AI-enhanced summary for mixed content"""
-    
-    try:
-        # Initialize LLM (needs vision model for images)
-        llm = ChatOpenAI(model="gpt-4o", temperature=0)
-        
-        # Build the text prompt
-        prompt_text = f"""You are creating a searchable description for document content retrieval.
-
-        CONTENT TO ANALYZE:
-        TEXT CONTENT:
-        {text}
-
-        """
-        
-        # Add tables if present
-        if tables:
-            prompt_text += "TABLES:\n"
-            for i, table in enumerate(tables): # Loop through each table
-                prompt_text += f"Table {i+1}:\n{table}\n\n"
-        
-        prompt_text += """
-        YOUR TASK:
-        Generate a comprehensive, searchable description that covers:
-
-        1. Key facts, numbers, and data points from text and tables
-        2. Main topics and concepts discussed  
-        3. Questions this content could answer
-        4. Visual content analysis (charts, diagrams, patterns in images)
-        5. Alternative search terms users might use
-
-        Make it detailed and searchable - prioritize findability over brevity.
-
-        SEARCHABLE DESCRIPTION:"""
-
-        # Build message content starting with text
-        message_content: List = [{"type": "text", "text": prompt_text}]
-        
-        # Add images to the message
-        for image_base64 in images: # Loop through each image
-            message_content.append({
-                "type": "image_url",
-                "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"} # Embed image as base64 data URL
-            })
-        
-        # Send to AI and get response
-        message = HumanMessage(content=message_content)
-        response = llm.invoke([message])
-        
-        # Ensure result is string (handle multi-modal content list if necessary)
-        content = response.content
-        if isinstance(content, list):
-            # Join parts if it's a list (usually text parts)
-            return "".join([str(c) for c in content])
-        
-        return str(content)
-        
-    except Exception as e:
-        print(f"AI summary failed: {e}")
-        # Fallback to simple summary
-        summary = f"{text[:300]}..."
-        if tables:
-            summary += f" [Contains {len(tables)} table(s)]"
-        if images:
-            summary += f" [Contains {len(images)} image(s)]"
-        return summary
-
 # Step 3: Create AI-enhanced summary for chunks with mixed content and convert to LangChain Documents
-def summarize_chunks(chunks):
-    """Process all chunks with AI Summaries"""
+def summarize_chunks(chunks, max_concurrency=8, llm=None):
+    """Process all chunks with AI Summaries (up to max_concurrency summaries in parallel)"""
     print("Processing chunks with AI Summaries...")
     
-    langchain_documents = []
     total_chunks = len(chunks)
+    all_content_data = []
     
-    # Loop through each chunk
+    # Analyze every chunk first (cheap, local)
     for i, chunk in enumerate(chunks):
         current_chunk = i + 1
         print(f"   Processing chunk {current_chunk}/{total_chunks}")
         
         # Analyze chunk content and separate types
         content_data = separate_content_types(chunk)
+        all_content_data.append(content_data)
         
         # Print content types found (for debugging)
         print(f"     Types found: {content_data['types']}")
         print(f"     Tables: {len(content_data['tables'])}, Images: {len(content_data['images'])}")
-        
-        # Create summary if chunk has tables/images
-        if content_data['tables'] or content_data['images']:
-            print(f"     → Creating AI summary for mixed content...")
-            try:
-                enhanced_content = create_ai_enhanced_summary(
-                    content_data['text'],
-                    content_data['tables'], 
-                    content_data['images']
-                )
-                print(f"     → AI summary created successfully")
-                print(f"     → Enhanced content preview: {enhanced_content[:200]}...")
-            except Exception as e:
-                print(f"AI summary failed: {e}")
-                enhanced_content = content_data['text']
-        else: # No tables/images, use raw text
-            print(f"     → Using raw text (no tables/images)")
-            enhanced_content = content_data['text']
-        
+    
+    # Summaries run concurrently in chunk_summarization (importable and testable without unstructured)
+    enhanced_contents = summarize_contents(all_content_data, llm=llm, max_concurrency=max_concurrency,
+                                           image_preprocessor=image_preprocessor)
+    
+    # Create LangChain Documents in the original chunk order
+    langchain_documents = []
+    for content_data, enhanced_content in zip(all_content_data, enhanced_contents):
         # Create LangChain Document with rich metadata
+        # (tables and images are stored once in the blob store, metadata holds their hashes)
         doc = Document(
             page_content=enhanced_content,
             metadata={
                 "original_content": json.dumps({
                     "raw_text": content_data['text'],
-                    "tables_html": content_data['tables'],
-                    "images_base64": content_data['images']
+                    "table_refs": [blob_store.put_text(table) for table in content_data['tables']],
+                    "image_refs": [blob_store.put_base64(image) for image in content_data['images']]
                 })
             }
         )
@@ -218,7 +261,16 @@ def create_vector_store(documents, persist_directory="dbv1/chroma_db"):
     """Create and persist ChromaDB vector store"""
     print("Creating embeddings and storing in ChromaDB...")
         
-    embedding_model = OpenAIEmbeddings(model="text-embedding-3-small")
+    provider, model_name = embedding_config() # EMBEDDING_PROVIDER and its model variable, OpenAI by default
+    if provider == "openai":
+        # Embed in concurrent, token-sized batches with rate-limit backoff
+        embedding_model = EmbeddingScheduler(
+            create_embeddings(provider, model_name, max_retries=0), # retries are handled by the scheduler
+            model_name=model_name,
+            max_in_flight=4
+        )
+    else:
+        embedding_model = create_embeddings(provider, model_name) # in-process model, no rate limits
     
     # Create ChromaDB vector store
     print("--- Creating vector store ---")
@@ -229,6 +281,8 @@ def create_vector_store(documents, persist_directory="dbv1/chroma_db"):
         collection_metadata={"hnsw:space": "cosine"}
     )
     print("--- Finished creating vector store ---")
+    if hasattr(embedding_model, "print_stats"):
+        embedding_model.print_stats()
     
     print(f"Vector store created and saved to {persist_directory}")
     return vectorstore
@@ -256,13 +310,13 @@ def export_chunks_to_json(chunks, filename="chunks_export.json"):
     return export_data
 
 # Complete RAG Ingestion Pipeline
-def complete_ingestion_pipeline(pdf_path: str):
-    """Run the complete RAG ingestion pipeline"""
+def complete_ingestion_pipeline(pdf_path: str, workers: int = 1):
+    """Run the complete RAG ingestion pipeline (workers > 1, or None for all CPUs, partitions page ranges in parallel)"""
     print("Starting RAG Ingestion Pipeline")
     print("=" * 50)
     
     # Step 1: Partition
-    elements = partition_document(pdf_path)
+    elements = partition_document(pdf_path, workers=workers)
     
     # Step 2: Chunk
     chunks = create_chunks_by_title(elements)
@@ -277,12 +331,12 @@ def complete_ingestion_pipeline(pdf_path: str):
     return db
 
 # Generate final answer using multimodal content
-def generate_final_answer(chunks, query):
-    """Generate final answer using multimodal content"""
+def generate_final_answer(chunks, query, stream=False):
+    """Generate final answer using multimodal content (stream=True prints tokens as they arrive)"""
     
     try:
         # Initialize LLM (needs vision model for images)
-        llm = ChatOpenAI(model="gpt-4o", temperature=0)
+        llm = ChatOpenAI(model="gpt-4o", temperature=0, stream_usage=True)
         
         # Build the text prompt
         prompt_text = f"""Based on the following documents, please answer this question: {query}
@@ -290,19 +344,24 @@ def generate_final_answer(chunks, query):
 CONTENT TO ANALYZE:
 """
         
-        for i, chunk in enumerate(chunks): # Loop through each chunk
+        # Parse each chunk's original content once (tables/images are only blob references)
+        original_contents = [
+            json.loads(chunk.metadata["original_content"]) if "original_content" in chunk.metadata else None
+            for chunk in chunks
+        ]
+        
+        for i, original_data in enumerate(original_contents): # Loop through each chunk
             prompt_text += f"--- Document {i+1} ---\n"
             
-            if "original_content" in chunk.metadata: # Check if original content exists
-                original_data = json.loads(chunk.metadata["original_content"]) # Load original content JSON
-                
+            if original_data is not None: # Check if original content exists
                 # Add raw text
                 raw_text = original_data.get("raw_text", "") # Get raw text
                 if raw_text: # Add raw text if exists
                     prompt_text += f"TEXT:\n{raw_text}\n\n"
                 
-                # Add tables as HTML
-                tables_html = original_data.get("tables_html", [])
+                # Add tables as HTML (loaded from the blob store; older stores keep them inline)
+                tables_html = [blob_store.get_text(ref) for ref in original_data.get("table_refs", [])]
+                tables_html += original_data.get("tables_html", [])
                 if tables_html: # Add tables if exist
                     prompt_text += "TABLES:\n"
                     for j, table in enumerate(tables_html): # Loop through each table
@@ -318,20 +377,30 @@ ANSWER:"""
         # Build message content starting with text
         message_content: List = [{"type": "text", "text": prompt_text}]
         
-        # Add all images from all chunks
-        for chunk in chunks: # Loop through each chunk
-            if "original_content" in chunk.metadata: # Check if original content exists
-                original_data = json.loads(chunk.metadata["original_content"]) # Load original content JSON
-                images_base64 = original_data.get("images_base64", []) # Get list of base64 images
-                
-                for image_base64 in images_base64: # Loop through each image
-                    message_content.append({
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}
-                    })
+        # Add all images from all chunks, loading each distinct image only once
+        image_refs = {} # ordered set of blob references
+        legacy_images = [] # base64 images stored inline by older versions of this pipeline
+        for original_data in original_contents: # Loop through each chunk
+            if original_data is not None: # Check if original content exists
+                image_refs.update(dict.fromkeys(original_data.get("image_refs", [])))
+                legacy_images.extend(original_data.get("images_base64", []))
+        
+        images_base64 = [blob_store.get_base64(ref) for ref in image_refs] + legacy_images
+        image_preprocessor.reset()
+        images_base64 = image_preprocessor.prepare(images_base64) # dedupe near-identical figures, downsize, cap
+        image_preprocessor.print_report("answer prompt")
+        for image_base64 in images_base64: # Loop through each image
+            message_content.append({
+                "type": "image_url",
+                "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}
+            })
         
         # Send to AI and get response
         message = HumanMessage(content=message_content)
+        if stream:
+            answer, metrics = print_stream(llm, [message])
+            metrics.print() # time to first token and tokens/sec
+            return answer
         response = llm.invoke([message])
         
         return response.content
@@ -345,6 +414,9 @@ if __name__ == "__main__":
     # file_path = "./docs/attention-is-all-you-need.pdf"
     # elements = partition_document(file_path)
     # print(len(elements)) => 220
+    # serial_elements, parallel_elements = compare_partitions(file_path, workers=4, pages_per_task=4) # page ranges in a process pool
+    # print(element_rows(parallel_elements) == element_rows(serial_elements)) # => True (same ids, pages and text)
+    # print([c.text for c in create_chunks_by_title(parallel_elements)] == [c.text for c in create_chunks_by_title(serial_elements)]) # => True
     # print(elements)
     # print(set([str(type(el)) for el in elements])) # Different types of element types extracted from the PDF
     # print(elements[36].to_dict()) # use to_dict() method to see all attributes of an element
@@ -379,5 +451,4 @@ if __name__ == "__main__":
     retriever = db.as_retriever(search_kwargs={"k": 3})
     chunks = retriever.invoke(query)
     
-    final_answer = generate_final_answer(chunks, query)
-    print(final_answer)
\ No newline at end of file
+    final_answer = generate_final_answer(chunks, query, stream=True) # printed while streaming
\ No newline at end of file
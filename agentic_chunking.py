@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from langchain_core.documents import Document
+from pydantic import BaseModel
+
+PROMPT_VERSION = "1" # part of the cache key, bump when the prompt changes
+CHUNKING_PROMPT = """You are a text chunking expert. The numbered lines below are a window of a longer document.
+Choose where new chunks should start so that:
+- Each chunk is around {target_chars} characters or less
+- Chunks split at natural topic boundaries
+- Related information stays together
+
+Return the numbers of the lines that start a new chunk.
+
+{numbered_lines}"""
+
+
+class ChunkStarts(BaseModel):
+    line_numbers: List[int]
+
+
+def make_windows(line_count, window_lines, overlap_lines):
+    """(start, end) line ranges of overlapping windows covering all lines"""
+    step = max(1, window_lines - overlap_lines)
+    windows = []
+    start = 0
+    while True:
+        end = min(line_count, start + window_lines)
+        windows.append((start, end))
+        if end == line_count:
+            return windows
+        start += step
+
+def owned_ranges(windows):
+    """Splits each overlap at its midpoint, so every line belongs to exactly one window
+
+    A boundary proposed inside an overlap is kept only from the window it is most
+    central to, which reconciles the two windows' (possibly different) choices.
+    """
+    owned = []
+    for i, (start, end) in enumerate(windows):
+        own_start = 0 if i == 0 else (start + windows[i - 1][1]) // 2
+        own_end = windows[i][1] if i == len(windows) - 1 else (windows[i + 1][0] + end) // 2
+        owned.append((own_start, own_end))
+    return owned
+
+
+def check_cut_from(text, chunks):
+    """Raises ValueError unless the chunks cover text in order with only whitespace between them
+
+    Chunks are stripped runs of consecutive lines, so this always holds; the check is
+    one linear scan and guards against a future change that rewrites or drops text.
+    """
+    position = 0
+    for chunk in chunks:
+        found = text.find(chunk, position)
+        if found == -1 or text[position:found].strip():
+            raise ValueError(f"Chunk at offset {position} is not cut from the source text in order")
+        position = found + len(chunk)
+    if text[position:].strip():
+        raise ValueError("Chunks do not cover the end of the source text")
+
+
+class AgenticSplitter:
+    """LLM-chosen chunk boundaries for long documents, usable like a TextSplitter
+
+    The document is cut into overlapping windows of lines. Each window is sent
+    (numbered) to the model, which returns the line numbers where chunks start; the
+    windows are processed concurrently by a bounded thread pool. Boundaries in an
+    overlap are taken from the window that owns that part of the overlap, chunks
+    longer than max_chunk_chars are split further at line boundaries. Every chunk
+    is a run of whole source lines, stripped of leading and trailing whitespace, so
+    no text is rewritten by the model.
+    A failed model call is retried up to max_retries times. If it still fails, that
+    window gets no model boundaries and is only split at max_chunk_chars, so one bad
+    window never aborts the whole document.
+    Model answers are cached in SQLite by window hash, so re-chunking unchanged
+    text costs no calls.
+    """
+
+    def __init__(self, llm, target_chars=800, max_chunk_chars=1600, window_lines=150, overlap_lines=20,
+                 max_concurrency=8, cache_path="db/agentic_chunk_cache.sqlite3", max_retries=2, retry_delay=1.0):
+        self.llm = llm.with_structured_output(ChunkStarts)
+        self.model_name = getattr(llm, "model_name", "") # part of the cache key
+        self.target_chars = target_chars
+        self.max_chunk_chars = max_chunk_chars
+        self.window_lines = window_lines
+        self.overlap_lines = overlap_lines
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.llm_calls = 0
+        self.cache_hits = 0
+        self.failed_windows = 0
+
+        cache_dir = os.path.dirname(cache_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.connection = sqlite3.connect(cache_path, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS windows (key TEXT PRIMARY KEY, starts TEXT NOT NULL)")
+        self._lock = threading.Lock() # one SQLite connection shared by the worker threads
+
+    def _window_key(self, window_text):
+        content = f"{PROMPT_VERSION}\n{self.model_name}\n{self.target_chars}\n{window_text}"
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def _window_starts(self, lines):
+        """Chunk start lines (0-based, relative to the window) chosen by the model, cached by window hash"""
+        window_text = "".join(lines)
+        key = self._window_key(window_text)
+        with self._lock:
+            row = self.connection.execute("SELECT starts FROM windows WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.cache_hits += 1
+                return json.loads(row[0])
+
+        numbered_lines = "".join(f"[{i + 1}] {line}" for i, line in enumerate(lines))
+        prompt = CHUNKING_PROMPT.format(target_chars=self.target_chars, numbered_lines=numbered_lines)
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.llm.invoke(prompt)
+                break
+            except Exception as e:
+                if attempt == self.max_retries:
+                    # Not cached, so the next run asks the model again
+                    print(f"Agentic chunking: window failed after {attempt + 1} attempts ({e}), splitting it by size only")
+                    with self._lock:
+                        self.failed_windows += 1
+                    return []
+                time.sleep(self.retry_delay * 2 ** attempt)
+        starts = sorted({number - 1 for number in response.line_numbers if 1 <= number <= len(lines)})
+
+        with self._lock:
+            self.llm_calls += 1
+            self.connection.execute("INSERT OR REPLACE INTO windows (key, starts) VALUES (?, ?)", (key, json.dumps(starts)))
+            self.connection.commit()
+        return starts
+
+    def _enforce_max_size(self, lines, starts):
+        """Adds line boundaries inside chunks longer than max_chunk_chars"""
+        bounded = []
+        ends = starts[1:] + [len(lines)]
+        for start, end in zip(starts, ends):
+            bounded.append(start)
+            size = 0
+            for i in range(start, end):
+                if size and size + len(lines[i]) > self.max_chunk_chars:
+                    bounded.append(i)
+                    size = 0
+                size += len(lines[i])
+        return bounded
+
+    def split_text(self, text):
+        lines = text.splitlines(keepends=True)
+        if not lines:
+            return []
+        windows = make_windows(len(lines), self.window_lines, self.overlap_lines)
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            window_starts = list(executor.map(lambda window: self._window_starts(lines[window[0]:window[1]]), windows))
+
+        # Keep each boundary only from the window that owns its line
+        starts = {0}
+        for (start, _), (own_start, own_end), relative_starts in zip(windows, owned_ranges(windows), window_starts):
+            starts.update(start + i for i in relative_starts if own_start <= start + i < own_end)
+        starts = self._enforce_max_size(lines, sorted(starts))
+
+        pieces = ["".join(lines[start:end]).strip() for start, end in zip(starts, starts[1:] + [len(lines)])]
+        chunks = [piece for piece in pieces if piece]
+        check_cut_from(text, chunks)
+        return chunks
+
+    def split_documents(self, documents):
+        """Same output shape as TextSplitter.split_documents (metadata copied to every chunk)"""
+        chunks = []
+        for document in documents:
+            start_time = time.perf_counter()
+            texts = self.split_text(document.page_content)
+            chunks.extend(Document(page_content=text, metadata=dict(document.metadata)) for text in texts)
+            print(f"Agentic chunking: {document.metadata.get('source', 'document')} -> {len(texts)} chunks "
+                  f"in {time.perf_counter() - start_time:.1f}s ({self.llm_calls} LLM calls, {self.cache_hits} cached windows so far)")
+        return chunks
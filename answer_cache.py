@@ -0,0 +1,149 @@
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from array import array
+
+
+def chunk_key(document):
+    """Identifies a retrieved chunk by its ID and a hash of its current content
+
+    A chunk sent without its text (read from its source file instead) uses the
+    content_hash recorded at ingest time, the SHA-256 of the same text.
+    """
+    if not document.page_content and document.metadata.get("content_hash"):
+        content_hash = document.metadata["content_hash"][:16]
+    else:
+        content_hash = hashlib.sha256(document.page_content.encode("utf-8")).hexdigest()[:16]
+    return f"{document.id or content_hash}#{content_hash}"
+
+def chunk_set_fingerprint(documents):
+    """Order-independent fingerprint of a set of retrieved chunks"""
+    keys = sorted(set(chunk_key(document) for document in documents))
+    return hashlib.sha256("\n".join(keys).encode("utf-8")).hexdigest()
+
+def cosine_similarity(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class SemanticAnswerCache:
+    """Persistent cache of generated answers, matched by query-embedding similarity
+
+    A cached answer is reused when a new query's embedding has cosine similarity of at
+    least `threshold` with the cached query AND retrieval returned the same chunks
+    (same IDs and same content). Re-ingested chunks therefore never serve stale
+    answers; `invalidate_chunks` additionally drops entries eagerly.
+    One SQLite connection is shared by all threads, serialized by a lock.
+    """
+
+    def __init__(self, cache_path="db/answer_cache.sqlite3", threshold=0.95, max_entries=10000):
+        self.cache_path = cache_path
+        self.threshold = threshold # minimum cosine similarity between queries
+        self.max_entries = max_entries # oldest entries are evicted beyond this
+        self.hits = 0
+        self.misses = 0
+
+        cache_dir = os.path.dirname(cache_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        self.connection = sqlite3.connect(cache_path, check_same_thread=False)
+        self._lock = threading.Lock() # lookup/store/invalidate may run in server worker threads
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                query TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                fingerprint TEXT NOT NULL,
+                chunk_ids TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS answers_fingerprint ON answers (fingerprint);
+            CREATE TABLE IF NOT EXISTS answer_chunks (answer_id INTEGER NOT NULL, chunk_id TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS answer_chunks_chunk_id ON answer_chunks (chunk_id);
+        """)
+
+    def lookup(self, query_embedding, documents):
+        """Returns a cached answer for a similar query over the same chunks, or None"""
+        # Only entries built from exactly the same chunks are candidates
+        fingerprint = chunk_set_fingerprint(documents)
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT embedding, answer FROM answers WHERE fingerprint = ?", (fingerprint,)
+            ).fetchall()
+
+        best_answer, best_similarity = None, self.threshold
+        for blob, answer in rows:
+            cached_embedding = array("f")
+            cached_embedding.frombytes(blob)
+            similarity = cosine_similarity(query_embedding, cached_embedding)
+            if similarity >= best_similarity:
+                best_answer, best_similarity = answer, similarity
+
+        with self._lock:
+            if best_answer is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return best_answer
+
+    def store(self, query, query_embedding, documents, answer):
+        """Caches a generated answer with its query embedding and retrieved chunk IDs"""
+        chunk_ids = [document.id for document in documents if document.id]
+        fingerprint = chunk_set_fingerprint(documents)
+        with self._lock:
+            cursor = self.connection.execute(
+                "INSERT INTO answers (query, embedding, fingerprint, chunk_ids, answer, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (query, array("f", query_embedding).tobytes(), fingerprint, json.dumps(chunk_ids), answer, time.time())
+            )
+            self.connection.executemany(
+                "INSERT INTO answer_chunks (answer_id, chunk_id) VALUES (?, ?)",
+                [(cursor.lastrowid, chunk_id) for chunk_id in chunk_ids]
+            )
+
+            # Evict the oldest entries beyond max_entries
+            stale = self.connection.execute(
+                "SELECT id FROM answers ORDER BY id DESC LIMIT -1 OFFSET ?", (self.max_entries,)
+            ).fetchall()
+            self._delete([answer_id for (answer_id,) in stale])
+            self.connection.commit()
+
+    def invalidate_chunks(self, chunk_ids):
+        """Drops every cached answer that was generated from one of these chunks"""
+        answer_ids = set()
+        chunk_ids = list(chunk_ids)
+        with self._lock:
+            for start in range(0, len(chunk_ids), 500): # stay under SQLite's parameter limit
+                batch = chunk_ids[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.connection.execute(
+                    f"SELECT answer_id FROM answer_chunks WHERE chunk_id IN ({placeholders})", batch
+                )
+                answer_ids.update(answer_id for (answer_id,) in rows)
+            self._delete(list(answer_ids))
+            self.connection.commit()
+        return len(answer_ids)
+
+    def _delete(self, answer_ids):
+        """Deletes answers and their chunk rows (callers hold the lock)"""
+        for start in range(0, len(answer_ids), 500):
+            batch = answer_ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            self.connection.execute(f"DELETE FROM answers WHERE id IN ({placeholders})", batch)
+            self.connection.execute(f"DELETE FROM answer_chunks WHERE answer_id IN ({placeholders})", batch)
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {"hits": hits, "misses": misses, "hit_rate": hits / total if total else 0.0}
+
+    def print_stats(self):
+        stats = self.stats()
+        print(f"Answer cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.1%} hit rate)")
@@ -0,0 +1,91 @@
+"""Benchmark: recall@k, memory and QPS of the quantized index vs full precision
+
+Uses the embeddings stored in db/chroma_db (or random clustered vectors with
+--synthetic N). Queries are stored embeddings with added noise; ground truth is an
+exact float32 search over all vectors.
+
+    python bench_quantized_search.py --k 10 --queries 200
+    python bench_quantized_search.py --synthetic 100000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from candidate_reranking import normalize_rows
+from quantized_index import QuantizedIndex
+
+
+def load_chroma_embeddings(persist_directory):
+    from langchain_chroma import Chroma
+    db = Chroma(persist_directory=persist_directory, collection_metadata={"hnsw:space": "cosine"})
+    collection = db._collection
+    ids, embeddings = [], []
+    for offset in range(0, collection.count(), 5000):
+        page = collection.get(include=["embeddings"], limit=5000, offset=offset)
+        ids.extend(page["ids"])
+        embeddings.extend(page["embeddings"])
+    return db, ids, np.asarray(embeddings, dtype=np.float32)
+
+def synthetic_embeddings(count, dimensions=1536, clusters=200, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimensions)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, count)] + 0.6 * rng.normal(size=(count, dimensions)).astype(np.float32)
+    return [str(i) for i in range(count)], vectors
+
+def recall_at_k(results, truth):
+    return np.mean([len(set(found) & set(expected)) / len(expected) for found, expected in zip(results, truth)])
+
+def timed(search, queries):
+    """Runs search over all queries, returns (results, queries per second)"""
+    start = time.perf_counter()
+    results = [search(query) for query in queries]
+    return results, len(queries) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--persist-directory", default="db/chroma_db")
+    parser.add_argument("--synthetic", type=int, default=None, help="use N random vectors instead of the Chroma collection")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--rescore-factor", type=int, default=10)
+    args = parser.parse_args()
+
+    db = None
+    if args.synthetic:
+        ids, vectors = synthetic_embeddings(args.synthetic)
+    else:
+        db, ids, vectors = load_chroma_embeddings(args.persist_directory)
+    full = normalize_rows(vectors)
+    count, dimensions = full.shape
+
+    rng = np.random.default_rng(1)
+    queries = normalize_rows(full[rng.choice(count, args.queries)] + 0.05 * rng.normal(size=(args.queries, dimensions)).astype(np.float32))
+
+    # Ground truth: exact float32 brute force
+    def exact_search(query):
+        scores = full @ query
+        top = np.argpartition(-scores, args.k - 1)[:args.k]
+        return [ids[i] for i in top[np.argsort(-scores[top])]]
+    truth, exact_qps = timed(exact_search, queries)
+
+    rows = [("float32 exact (brute force)", 1.0, full.nbytes, exact_qps)]
+    if db is not None:
+        collection = db._collection
+        hnsw_results, hnsw_qps = timed(lambda q: collection.query(query_embeddings=[q.tolist()], n_results=args.k, include=[])["ids"][0], queries)
+        rows.append(("float32 Chroma HNSW", recall_at_k(hnsw_results, truth), full.nbytes, hnsw_qps))
+
+    for mode in ("int8", "binary"):
+        for dims in (None, 512, 256):
+            if dims is not None and dims >= dimensions:
+                continue
+            index = QuantizedIndex.build(ids, full, mode=mode, dims=dims)
+            results, qps = timed(lambda q: [chunk_id for chunk_id, _ in index.search(q, k=args.k, rescore_factor=args.rescore_factor)], queries)
+            rows.append((f"{mode} {dims or dimensions} dims + rescore", recall_at_k(results, truth), index.memory_bytes(), qps))
+
+    print(f"{count} vectors x {dimensions} dims, {args.queries} queries, k={args.k}, rescore top {args.k * args.rescore_factor}\n")
+    print(f"{'index':<32} {'recall@k':>9} {'RAM (MB)':>10} {'QPS':>9}")
+    for name, recall, memory, qps in rows:
+        print(f"{name:<32} {recall:>9.3f} {memory / 1e6:>10.1f} {qps:>9.0f}")
+    print("\nRAM is the vectors/codes scanned per query; re-scoring reads the float32 rows from a memory map.")
@@ -0,0 +1,90 @@
+"""Benchmark: LLM rewrite calls and time saved by the conversational rewrite fast path
+
+Replays scripted conversations (with scripted answers, so only the rewrite step is
+measured) twice: once rewriting every follow-up with the model, as ask_question
+used to, and once through ConversationalRewriter.
+
+    python bench_query_rewrite.py
+"""
+import time
+
+from langchain_openai import ChatOpenAI
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from dotenv import load_dotenv
+from query_rewrite import REWRITE_PROMPT, ConversationalRewriter
+
+load_dotenv()
+
+# (user input, scripted answer) turns
+CONVERSATIONS = [
+    [
+        ("What was Microsoft's first hardware product release?", "Microsoft's first hardware product was the Microsoft Mouse in 1983."),
+        ("Where was it released?", "It was released in the United States."),
+        ("How much did Microsoft pay to acquire GitHub?", "Microsoft paid $7.5 billion for GitHub in 2018."),
+        ("When did the acquisition close?", "The acquisition closed in October 2018."),
+        ("Who founded Microsoft?", "Bill Gates and Paul Allen founded Microsoft in 1975."),
+    ],
+    [
+        ("How does Tesla make money?", "Tesla earns most of its revenue from selling electric vehicles, plus energy storage and services."),
+        ("What about its energy business?", "Tesla Energy sells Powerwall, Megapack and solar products."),
+        ("Which island does SpaceX lease for its launches in the Pacific?", "SpaceX used Omelek Island in the Kwajalein Atoll for Falcon 1 launches."),
+        ("Why did they stop launching there?", "SpaceX moved to Falcon 9 launches from Florida and California."),
+        ("What products does Nvidia sell?", "Nvidia sells GPUs, data center platforms and automotive systems."),
+        ("And the revenue?", "Most revenue comes from its data center segment."),
+    ],
+    [
+        ("What is Google's parent company?", "Alphabet Inc. is Google's parent company since 2015."),
+        ("When was Google founded?", "Google was founded in 1998 by Larry Page and Sergey Brin."),
+        ("Where was it founded?", "Google was founded in Menlo Park, California."),
+    ],
+]
+CONVERSATIONS.append(CONVERSATIONS[0]) # FAQ-style traffic: the same conversation from another user
+
+
+def replay(rewrite):
+    """Runs every conversation through rewrite(user_input, chat_history); returns total ms"""
+    start = time.perf_counter()
+    for conversation in CONVERSATIONS:
+        chat_history = []
+        for user_input, answer in conversation:
+            rewrite(user_input, chat_history)
+            chat_history = chat_history + [HumanMessage(content=user_input), AIMessage(content=answer)]
+    return (time.perf_counter() - start) * 1000
+
+
+if __name__ == "__main__":
+    model = ChatOpenAI(model="gpt-4o", temperature=0)
+    follow_ups = sum(len(conversation) - 1 for conversation in CONVERSATIONS)
+
+    # Baseline: one model call for every follow-up
+    baseline_calls = 0
+    def always_rewrite(user_input, chat_history):
+        global baseline_calls
+        if not chat_history:
+            return user_input
+        baseline_calls += 1
+        messages = [SystemMessage(content=REWRITE_PROMPT)] + chat_history + [HumanMessage(content=f"New input: {user_input}")]
+        return model.invoke(messages).content.strip()
+
+    baseline_ms = replay(always_rewrite)
+
+    # Fast path: heuristic skip + memoised rewrites
+    rewriter = ConversationalRewriter(model)
+    def fast_rewrite(user_input, chat_history):
+        standalone_input, reason = rewriter.rewrite(user_input, chat_history)
+        if chat_history:
+            print(f"  {reason:<35} {user_input!r} -> {standalone_input!r}")
+        return standalone_input
+
+    print("Fast path decisions:")
+    fast_ms = replay(fast_rewrite)
+    stats = rewriter.stats()
+
+    print("\n" + "=" * 60)
+    print(f"Follow-up turns:          {follow_ups}")
+    print(f"Baseline:                 {baseline_calls} LLM calls, {baseline_ms:.0f} ms ({baseline_ms / follow_ups:.0f} ms/turn)")
+    print(f"Fast path:                {stats['llm_calls']} LLM calls, {fast_ms:.0f} ms ({fast_ms / follow_ups:.0f} ms/turn)")
+    print(f"  skipped by heuristic:   {stats['skipped']}")
+    print(f"  served from cache:      {stats['cache_hits']}")
+    print(f"Saved per turn:           {(baseline_calls - stats['llm_calls']) / follow_ups:.2f} LLM calls, "
+          f"{(baseline_ms - fast_ms) / follow_ups:.0f} ms")
@@ -0,0 +1,67 @@
+"""Benchmark: SemanticSplitter vs CharacterTextSplitter (and LangChain's SemanticChunker)
+
+Splits every docs/*.txt file and reports chunks/sec and MB/s. SemanticSplitter
+runs twice through the persistent embedding cache with different thresholds: the
+second run reads every sentence embedding from the cache.
+
+Uses the configured embedding provider (EMBEDDING_PROVIDER, the offline `fake`
+provider by default here so the benchmark needs no API key).
+
+    python bench_semantic_chunking.py
+    EMBEDDING_PROVIDER=openai python bench_semantic_chunking.py --langchain
+"""
+import argparse
+import glob
+import logging
+import os
+import time
+
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from langchain_text_splitters import CharacterTextSplitter
+from embedding_cache import CachedEmbeddings
+from embedding_providers import cache_model_name, create_embeddings, embedding_config
+from semantic_chunking import SemanticSplitter
+
+load_dotenv()
+logging.getLogger("langchain_text_splitters").setLevel(logging.ERROR) # "Created a chunk of size ..." warnings
+
+
+def timed(name, split, documents, megabytes):
+    start = time.perf_counter()
+    chunks = split(documents)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<45} {len(chunks):>7} chunks {elapsed:>8.2f}s {len(chunks) / elapsed:>10.0f} chunks/s {megabytes / elapsed:>7.2f} MB/s")
+    return chunks
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", default="docs")
+    parser.add_argument("--cache-path", default="db/bench_embedding_cache.sqlite3")
+    parser.add_argument("--langchain", action="store_true", help="also run langchain_experimental's SemanticChunker")
+    args = parser.parse_args()
+
+    provider, model_name = embedding_config(os.getenv("EMBEDDING_PROVIDER", "fake"))
+    os.makedirs(os.path.dirname(args.cache_path) or ".", exist_ok=True)
+    embedding_model = CachedEmbeddings(create_embeddings(provider, model_name), cache_model_name(provider, model_name), cache_path=args.cache_path)
+
+    documents = []
+    for path in sorted(glob.glob(os.path.join(args.docs, "*.txt"))):
+        with open(path, "r", encoding="utf-8") as f:
+            documents.append(Document(page_content=f.read(), metadata={"source": path}))
+    megabytes = sum(len(document.page_content.encode("utf-8")) for document in documents) / 1e6
+    print(f"{len(documents)} documents, {megabytes:.2f} MB, embeddings: {provider} ({model_name})\n")
+
+    timed("CharacterTextSplitter(800)", CharacterTextSplitter(chunk_size=800, chunk_overlap=0).split_documents, documents, megabytes)
+    timed("SemanticSplitter p95 (cold cache)", SemanticSplitter(embedding_model, breakpoint_amount=95).split_documents, documents, megabytes)
+    timed("SemanticSplitter p90 (cached embeddings)", SemanticSplitter(embedding_model, breakpoint_amount=90).split_documents, documents, megabytes)
+    timed("SemanticSplitter 1.5 std (cached embeddings)", SemanticSplitter(embedding_model, "standard_deviation", 1.5).split_documents, documents, megabytes)
+
+    if args.langchain:
+        from langchain_experimental.text_splitter import SemanticChunker
+        chunker = SemanticChunker(embeddings=create_embeddings(provider, model_name), breakpoint_threshold_type="percentile", breakpoint_threshold_amount=95)
+        timed("langchain SemanticChunker p95 (no cache)", chunker.split_documents, documents, megabytes)
+
+    print()
+    embedding_model.print_stats()
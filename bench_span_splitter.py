@@ -0,0 +1,71 @@
+"""Benchmark: offset-based span splitters vs the langchain character splitters
+
+Splits every docs/*.txt file with both implementations, checks that the chunks
+are identical and reports the best time of several passes and MB/s, for the
+spans alone and for Documents with materialised text.
+
+    python bench_span_splitter.py
+    python bench_span_splitter.py --repeat 20
+"""
+import argparse
+import glob
+import logging
+import os
+import time
+
+from langchain_core.documents import Document
+from langchain_text_splitters import CharacterTextSplitter, RecursiveCharacterTextSplitter
+from span_splitter import SpanCharacterSplitter, SpanRecursiveSplitter
+
+# "Created a chunk of size ..." warnings, logged by both implementations
+logging.getLogger("langchain_text_splitters").setLevel(logging.ERROR)
+logging.getLogger("span_splitter").setLevel(logging.ERROR)
+SEPARATORS = ["\n\n", "\n", ". ", " ", ""] # as in 6_recursive_character_text_splitter.py
+
+
+def timed(name, split, documents, megabytes, repeat):
+    elapsed = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = split(documents)
+        elapsed = min(elapsed, time.perf_counter() - start)
+    print(f"  {name:<40} {len(result):>7} chunks {elapsed * 1000:>9.1f} ms {megabytes / elapsed:>8.1f} MB/s")
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", default="docs")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    documents = []
+    for path in sorted(glob.glob(os.path.join(args.docs, "*.txt"))):
+        with open(path, "r", encoding="utf-8") as f:
+            documents.append(Document(page_content=f.read(), metadata={"source": path}))
+    megabytes = sum(len(document.page_content.encode("utf-8")) for document in documents) / 1e6
+    print(f"{len(documents)} documents, {megabytes:.2f} MB, best of {args.repeat} passes\n")
+
+    pairs = [
+        ("CharacterTextSplitter(800, 0)",
+         CharacterTextSplitter(chunk_size=800, chunk_overlap=0),
+         SpanCharacterSplitter(chunk_size=800, chunk_overlap=0)),
+        ("CharacterTextSplitter(800, 200)",
+         CharacterTextSplitter(chunk_size=800, chunk_overlap=200),
+         SpanCharacterSplitter(chunk_size=800, chunk_overlap=200)),
+        ("RecursiveCharacterTextSplitter(800, 0)",
+         RecursiveCharacterTextSplitter(separators=SEPARATORS, chunk_size=800, chunk_overlap=0),
+         SpanRecursiveSplitter(separators=SEPARATORS, chunk_size=800, chunk_overlap=0)),
+        ("RecursiveCharacterTextSplitter(100, 0)",
+         RecursiveCharacterTextSplitter(separators=SEPARATORS, chunk_size=100, chunk_overlap=0),
+         SpanRecursiveSplitter(separators=SEPARATORS, chunk_size=100, chunk_overlap=0)),
+    ]
+    for name, langchain_splitter, span_splitter in pairs:
+        expected = langchain_splitter.split_documents(documents)
+        actual = span_splitter.split_documents(documents)
+        identical = [(d.page_content, d.metadata) for d in expected] == [(d.page_content, d.metadata) for d in actual]
+        print(f"{name} (identical output: {identical})")
+        baseline = timed("langchain split_documents", langchain_splitter.split_documents, documents, megabytes, args.repeat)
+        spans = timed("span split_document_spans (no text)", span_splitter.split_document_spans, documents, megabytes, args.repeat)
+        full = timed("span split_documents", span_splitter.split_documents, documents, megabytes, args.repeat)
+        print(f"  speed-up: {baseline / spans:.1f}x spans only, {baseline / full:.1f}x with Documents\n")
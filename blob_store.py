@@ -0,0 +1,52 @@
+import base64
+import hashlib
+import mmap
+import os
+
+
+class BlobStore:
+    """Content-addressed, file-backed store for large chunk payloads (images, tables)
+
+    Each blob is written once to <root>/<first 2 hex chars>/<sha256>, so identical
+    images or tables shared by several chunks are stored once. Vector store metadata
+    only keeps the sha256 references, and blobs are read back (memory-mapped) on demand.
+    """
+
+    def __init__(self, root="db/blobs"):
+        self.root = root
+
+    def _path(self, ref):
+        return os.path.join(self.root, ref[:2], ref)
+
+    def put(self, data: bytes) -> str:
+        """Stores bytes (if not already present) and returns their reference"""
+        ref = hashlib.sha256(data).hexdigest()
+        path = self._path(ref)
+        if not os.path.exists(path): # deduplicated by content
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return ref
+
+    def put_text(self, text: str) -> str:
+        return self.put(text.encode("utf-8"))
+
+    def put_base64(self, data_base64: str) -> str:
+        """Stores a base64 payload as raw bytes (a quarter smaller on disk)"""
+        return self.put(base64.b64decode(data_base64))
+
+    def get(self, ref: str) -> bytes:
+        """Reads a blob through a memory map"""
+        with open(self._path(ref), "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return bytes(mapped)
+
+    def get_text(self, ref: str) -> str:
+        return self.get(ref).decode("utf-8")
+
+    def get_base64(self, ref: str) -> str:
+        return base64.b64encode(self.get(ref)).decode("ascii")
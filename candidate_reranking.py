@@ -0,0 +1,90 @@
+import numpy as np
+
+
+def normalize_rows(matrix):
+    """Scales each row to unit length (zero rows stay zero)"""
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+def maximal_marginal_relevance(query_similarities, matrix, k, lambda_mult=0.5):
+    """Greedy MMR over unit-normalized candidate rows, returns the selected row indices
+
+    Same selection as LangChain's maximal_marginal_relevance, but the max similarity
+    of every candidate to the already selected ones is updated in place with one
+    matrix-vector product per pick instead of being recomputed.
+    """
+    count = len(query_similarities)
+    if count == 0 or k <= 0:
+        return []
+    selected = [int(np.argmax(query_similarities))]
+    max_redundancy = matrix @ matrix[selected[0]] # max similarity to any selected candidate
+    while len(selected) < min(k, count):
+        mmr_scores = lambda_mult * query_similarities - (1 - lambda_mult) * max_redundancy
+        mmr_scores[selected] = -np.inf
+        best = int(np.argmax(mmr_scores))
+        selected.append(best)
+        np.maximum(max_redundancy, matrix @ matrix[best], out=max_redundancy)
+    return selected
+
+
+class CandidateSet:
+    """Candidates fetched once from the vector store, re-ranked locally with NumPy
+
+    Holds the fetched documents and their embeddings (two store calls: a similarity
+    search and a get() of the embeddings), so top-k, score threshold and MMR
+    selections (or a sweep over lambda_mult) cost no further store calls.
+    Scores are cosine similarities, the same relevance scores Chroma returns for a
+    cosine collection.
+    """
+
+    def __init__(self, documents, embeddings, query_embedding):
+        self.documents = documents
+        if not documents: # nothing retrieved (empty collection): every selection is empty
+            self.matrix = np.zeros((0, 0), dtype=np.float32)
+            self.scores = np.zeros(0, dtype=np.float32)
+            self.order = np.zeros(0, dtype=np.intp)
+            return
+        self.matrix = normalize_rows(np.asarray(embeddings, dtype=np.float32).reshape(len(documents), -1))
+        query = normalize_rows(np.asarray(query_embedding, dtype=np.float32))
+        self.scores = self.matrix @ query
+        self.order = np.argsort(-self.scores, kind="stable") # best first
+
+    @classmethod
+    def from_chroma(cls, db, query_embedding, fetch_k=20):
+        """One vector search for the candidates, then one lookup of their embeddings by ID"""
+        documents = db.similarity_search_by_vector(query_embedding, k=fetch_k)
+        if not documents:
+            return cls([], [], query_embedding)
+        result = db.get(ids=[document.id for document in documents], include=["embeddings"])
+        embeddings = dict(zip(result["ids"], result["embeddings"])) # get() does not keep the order of ids
+        return cls(documents, [embeddings[document.id] for document in documents], query_embedding)
+
+    def _results(self, indices):
+        return [(self.documents[i], float(self.scores[i])) for i in indices]
+
+    def similarity(self, k=4):
+        """Top k candidates by cosine similarity"""
+        return self._results(self.order[:k])
+
+    def similarity_score_threshold(self, k=4, score_threshold=0.0):
+        """Top k candidates with a similarity of at least score_threshold"""
+        top = self.order[:k]
+        return self._results(top[self.scores[top] >= score_threshold])
+
+    def mmr(self, k=4, lambda_mult=0.5):
+        """Maximal marginal relevance selection (0 = max diversity, 1 = max relevance)"""
+        return self._results(maximal_marginal_relevance(self.scores, self.matrix, k, lambda_mult))
+
+    def select(self, search_type="similarity", k=4, score_threshold=None, lambda_mult=0.5, **_):
+        """Same search_type/search_kwargs as db.as_retriever() (fetch_k is the candidate set size)"""
+        if search_type == "similarity":
+            return self.similarity(k)
+        if search_type == "similarity_score_threshold":
+            return self.similarity_score_threshold(k, score_threshold or 0.0)
+        if search_type == "mmr":
+            return self.mmr(k, lambda_mult)
+        raise ValueError(f"Unknown search_type {search_type!r}")
+
+    def lambda_sweep(self, k=4, lambda_values=(0.0, 0.25, 0.5, 0.75, 1.0)):
+        """MMR selections for several lambda_mult values, {lambda_mult: [(document, score)]}"""
+        return {lambda_mult: self.mmr(k, lambda_mult) for lambda_mult in lambda_values}
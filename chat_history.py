@@ -0,0 +1,107 @@
+import threading
+import time
+from collections import OrderedDict
+
+import tiktoken
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+
+class ChatSession:
+    """History of one conversation: a rolling summary plus the most recent turns"""
+
+    def __init__(self):
+        self.summary = "" # compacted older turns
+        self.turns = [] # [(HumanMessage, AIMessage, token count)], oldest first
+        self.tokens = 0 # tokens in the recent turns
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock() # one compaction at a time per session
+
+
+class ChatHistoryStore:
+    """Per-session chat history with a token budget
+
+    When a session's recent turns exceed `max_tokens`, the oldest turns are folded
+    into a rolling summary with one LLM call (only the evicted turns and the previous
+    summary are sent), so the history sent with each request stays bounded no matter
+    how long the conversation gets. Sessions are evicted when idle for
+    `idle_timeout` seconds or when more than `max_sessions` are open (least
+    recently used first).
+    """
+
+    def __init__(self, summary_model, max_tokens=2000, max_sessions=1000, idle_timeout=3600, model_name="gpt-4o"):
+        self.summary_model = summary_model # model used to compact old turns
+        self.max_tokens = max_tokens # token budget of the recent turns per session
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout # seconds
+        self.encoding = tiktoken.encoding_for_model(model_name)
+        self.sessions = OrderedDict() # session_id -> ChatSession, least recently used first
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        """Drops idle sessions and the least recently used ones beyond max_sessions"""
+        while self.sessions:
+            session_id, session = next(iter(self.sessions.items()))
+            if len(self.sessions) > self.max_sessions or now - session.last_used > self.idle_timeout:
+                del self.sessions[session_id]
+            else:
+                break
+
+    def get(self, session_id):
+        """Returns the session, creating it if needed"""
+        now = time.monotonic()
+        with self._lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = self.sessions[session_id] = ChatSession()
+            session.last_used = now
+            self.sessions.move_to_end(session_id)
+            self._evict(now)
+            return session
+
+    def messages(self, session_id):
+        """Returns the history to send to the model: summary (if any) + recent turns"""
+        session = self.get(session_id)
+        with session.lock:
+            messages = []
+            if session.summary:
+                messages.append(SystemMessage(content=f"Summary of the earlier conversation: {session.summary}"))
+            for human, ai, _ in session.turns:
+                messages.extend([human, ai])
+            return messages
+
+    def add_turn(self, session_id, user_input, answer):
+        """Appends a turn, compacting the oldest turns into the summary if over budget"""
+        session = self.get(session_id)
+        tokens = len(self.encoding.encode(user_input)) + len(self.encoding.encode(answer))
+        with session.lock:
+            session.turns.append((HumanMessage(content=user_input), AIMessage(content=answer), tokens))
+            session.tokens += tokens
+            if session.tokens > self.max_tokens:
+                self._compact(session)
+
+    def _compact(self, session):
+        """Moves the oldest turns into the rolling summary until the budget is met"""
+        evicted = []
+        # Always keep the latest turn verbatim, it is what follow-ups refer to
+        while session.tokens > self.max_tokens // 2 and len(session.turns) > 1:
+            human, ai, tokens = session.turns.pop(0)
+            session.tokens -= tokens
+            evicted.append(f"User: {human.content}\nAssistant: {ai.content}")
+
+        if not evicted:
+            return
+
+        prompt = f"""Update the running summary of a conversation with the new exchanges below.
+Keep names, entities, numbers and open questions that later questions may refer to. Answer with the updated summary only, in at most 150 words.
+
+Current summary:
+{session.summary or "(empty)"}
+
+New exchanges:
+{chr(10).join(evicted)}
+"""
+        session.summary = str(self.summary_model.invoke([HumanMessage(content=prompt)]).content).strip()
+
+    def clear(self, session_id):
+        with self._lock:
+            self.sessions.pop(session_id, None)
@@ -0,0 +1,150 @@
+"""AI summaries of multi-modal chunks (text, tables and images), run concurrently on one shared client"""
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List
+
+from langchain_core.messages import HumanMessage
+from langchain_openai import ChatOpenAI
+
+from embedding_scheduler import is_retryable, retry_after_seconds
+
+
+def summary_model():
+    """The vision model used for summaries (retries are handled by invoke_with_retry)"""
+    return ChatOpenAI(model="gpt-4o", temperature=0, max_retries=0)
+
+def invoke_with_retry(llm, messages, max_retries=4, base_delay=1.0):
+    """Invoke the LLM, retrying rate limits and transient errors with exponential backoff"""
+    for attempt in range(max_retries + 1):
+        try:
+            return llm.invoke(messages)
+        except Exception as e:
+            if attempt == max_retries or not is_retryable(e):
+                raise
+            # Honour Retry-After when the server sends one, otherwise back off with jitter
+            delay = retry_after_seconds(e) or base_delay * 2 ** attempt * random.uniform(0.5, 1.0)
+            time.sleep(delay)
+
+def create_ai_enhanced_summary(text: str, tables: List[str], images: List[str], llm=None) -> str:
+    """Create AI-enhanced summary for mixed content (pass a shared llm to reuse one client)
+
+    `images` are sent as given: summarize_contents has already run them through the image preprocessor.
+    """
+
+    try:
+        # Initialize LLM (needs vision model for images) unless a shared one is passed in
+        if llm is None:
+            llm = summary_model()
+
+        # Build the text prompt
+        prompt_text = f"""You are creating a searchable description for document content retrieval.
+
+        CONTENT TO ANALYZE:
+        TEXT CONTENT:
+        {text}
+
+        """
+
+        # Add tables if present
+        if tables:
+            prompt_text += "TABLES:\n"
+            for i, table in enumerate(tables): # Loop through each table
+                prompt_text += f"Table {i+1}:\n{table}\n\n"
+
+        prompt_text += """
+        YOUR TASK:
+        Generate a comprehensive, searchable description that covers:
+
+        1. Key facts, numbers, and data points from text and tables
+        2. Main topics and concepts discussed
+        3. Questions this content could answer
+        4. Visual content analysis (charts, diagrams, patterns in images)
+        5. Alternative search terms users might use
+
+        Make it detailed and searchable - prioritize findability over brevity.
+
+        SEARCHABLE DESCRIPTION:"""
+
+        # Build message content starting with text
+        message_content: List = [{"type": "text", "text": prompt_text}]
+
+        # Add images to the message (already deduplicated and downsized)
+        for image_base64 in images: # Loop through each image
+            message_content.append({
+                "type": "image_url",
+                "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"} # Embed image as base64 data URL
+            })
+
+        # Send to AI and get response
+        message = HumanMessage(content=message_content)
+        response = invoke_with_retry(llm, [message])
+
+        # Ensure result is string (handle multi-modal content list if necessary)
+        content = response.content
+        if isinstance(content, list):
+            # Join parts if it's a list (usually text parts)
+            return "".join([str(c) for c in content])
+
+        return str(content)
+
+    except Exception as e:
+        print(f"AI summary failed: {e}")
+        # Fallback to simple summary
+        summary = f"{text[:300]}..."
+        if tables:
+            summary += f" [Contains {len(tables)} table(s)]"
+        if images:
+            summary += f" [Contains {len(images)} image(s)]"
+        return summary
+
+def summarize_contents(contents, llm=None, max_concurrency=8, image_preprocessor=None):
+    """Page content for each chunk: an AI summary for chunks with tables or images, the raw text otherwise
+
+    `contents` are dicts with 'text', 'tables' and 'images' (base64), as built by
+    separate_content_types. Up to `max_concurrency` summaries run in parallel on one
+    shared client (pass a stub `llm`, any object with `invoke`, to run without the API).
+    The result keeps the order of `contents`.
+    """
+    if llm is None:
+        llm = summary_model()
+    start_time = time.perf_counter()
+
+    # Deduplicate and downsize the images of each prompt (undecodable images are skipped)
+    if image_preprocessor is not None:
+        image_preprocessor.reset() # one savings report per document
+        images_to_send = [image_preprocessor.prepare(content_data['images']) for content_data in contents]
+    else:
+        images_to_send = [content_data['images'] for content_data in contents]
+
+    # Chunks with tables or images get an AI summary, the rest use their raw text
+    mixed_indices = [i for i, content_data in enumerate(contents) if content_data['tables'] or content_data['images']]
+    enhanced_contents = [content_data['text'] for content_data in contents]
+    print(f"   → Creating AI summaries for {len(mixed_indices)} mixed-content chunks ({max_concurrency} at a time)...")
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        futures = {
+            executor.submit(
+                create_ai_enhanced_summary,
+                contents[i]['text'],
+                contents[i]['tables'],
+                images_to_send[i],
+                llm
+            ): i
+            for i in mixed_indices
+        }
+
+        # Report progress as summaries finish (in any order)
+        # (create_ai_enhanced_summary falls back to the raw text itself when a summary fails)
+        for done, future in enumerate(as_completed(futures), 1):
+            i = futures[future]
+            enhanced_contents[i] = future.result()
+            print(f"     → Chunk {i + 1} summarized ({done}/{len(mixed_indices)}, "
+                  f"{done / (time.perf_counter() - start_time):.2f} chunks/sec)")
+
+    if mixed_indices:
+        elapsed = time.perf_counter() - start_time
+        print(f"Summarized {len(mixed_indices)} chunks in {elapsed:.1f}s ({len(mixed_indices) / elapsed:.2f} chunks/sec)")
+        if image_preprocessor is not None:
+            image_preprocessor.print_report()
+    return enhanced_contents
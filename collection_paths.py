@@ -0,0 +1,22 @@
+import os
+
+DEFAULT_PERSIST_DIRECTORY = "db/chroma_db"
+
+
+def collection_paths(persist_directory=DEFAULT_PERSIST_DIRECTORY):
+    """(manifest_path, quantized_index_dir, lexical_index_path, answer_cache_path) of a Chroma directory
+
+    The default db/chroma_db keeps them in db/; any other directory (e.g. one per
+    embedding provider) keeps its own inside itself, so collections never share them.
+    Ingestion, the retrieval server and the answer scripts all derive them from here.
+    """
+    if os.path.normpath(persist_directory) == os.path.normpath(DEFAULT_PERSIST_DIRECTORY):
+        root = "db"
+    else:
+        root = persist_directory
+    return (
+        os.path.join(root, "ingest_manifest.json"),
+        os.path.join(root, "quantized_index"),
+        os.path.join(root, "bm25_index.npz"),
+        os.path.join(root, "answer_cache.sqlite3"),
+    )
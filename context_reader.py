@@ -0,0 +1,247 @@
+import hashlib
+import json
+import mmap
+import os
+from typing import NamedTuple, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from span_splitter import span_text
+
+# Chunk metadata written at ingest time: where the chunk lives in its source file
+LOCATION_KEYS = ("byte_offset", "byte_length", "content_hash")
+SKIPS_KEY = "byte_skips" # JSON [[start, end], ...] byte ranges cut out of the chunk, only set when there are any
+TEXT_OMITTED_KEY = "text_omitted" # set by RetrievalClient on chunks the server sent without text (omit_located_text)
+
+
+def chunk_locations(text, spans, encoding="utf-8"):
+    """(byte_offset, byte_length, content_hash, byte_skips) of each span in the encoded text
+
+    The byte range covers the span in the file, byte_skips are the ranges inside it
+    that are not part of the chunk (Span.skips), and content_hash is the SHA-256 of
+    the chunk text itself (page_content), so the range minus the skips hashes to it.
+    Spans come in text order, so byte offsets are accumulated from one span start
+    to the next instead of encoding the text before every chunk.
+    """
+    locations = []
+    position, byte_position = 0, 0
+    for span in spans:
+        byte_position += len(text[position:span.start].encode(encoding))
+        position = span.start
+        data = span_text(text, span).encode(encoding)
+        if not span.skips:
+            locations.append((byte_position, len(data), hashlib.sha256(data).hexdigest(), ()))
+            continue
+        byte_at = lambda offset: byte_position + len(text[span.start:offset].encode(encoding))
+        skips = tuple((byte_at(start), byte_at(end)) for start, end in span.skips)
+        locations.append((byte_position, byte_at(span.end) - byte_position, hashlib.sha256(data).hexdigest(), skips))
+    return locations
+
+def kept_ranges(start, end, skips):
+    """(start, end) ranges of [start, end) left after cutting out the sorted, disjoint skips"""
+    ranges, position = [], start
+    for skip_start, skip_end in skips:
+        ranges.append((position, skip_start))
+        position = skip_end
+    ranges.append((position, end))
+    return [(a, b) for a, b in ranges if a < b]
+
+def merge_ranges(ranges):
+    """Sorted union of (start, end) ranges"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return tuple(merged)
+
+def split_documents_with_locations(text_splitter, documents, encoding="utf-8"):
+    """Splits with a span splitter and records each chunk's byte range and hash in its metadata
+
+    Locations are only recorded when the loaded text is exactly the decoded file
+    (no newline translation or BOM), otherwise the offsets would not match the file.
+    """
+    chunks = []
+    for document in documents:
+        text = document.page_content
+        spans = text_splitter.split_spans(text)
+        source = document.metadata.get("source")
+        locations = [None] * len(spans)
+        if source and os.path.isfile(source) and os.path.getsize(source) == len(text.encode(encoding)):
+            locations = chunk_locations(text, spans, encoding)
+        for span, location in zip(spans, locations):
+            metadata = dict(document.metadata)
+            if location is not None:
+                metadata.update(zip(LOCATION_KEYS, location[:3]))
+                if location[3]:
+                    metadata[SKIPS_KEY] = json.dumps(location[3])
+            chunks.append(Document(page_content=span_text(text, span), metadata=metadata))
+    return chunks
+
+def parse_chunk_id(chunk_id):
+    """(source, index) from a "<source>:<index>" chunk ID, None if it has no index"""
+    source, _, index = (chunk_id or "").rpartition(":")
+    return (source, int(index)) if source and index.isdigit() else None
+
+
+class ContextWindow(NamedTuple):
+    source: str
+    start: int # byte range in the source file
+    end: int
+    chunk_ids: Tuple[str, ...]
+    text: Optional[str] = None # stored page_content, for chunks without a (valid) file location
+    skips: Tuple[Tuple[int, int], ...] = () # byte ranges inside [start, end) that are not chunk text
+
+
+class ContextReader:
+    """Builds prompt context by slicing memory-mapped source files
+
+    Retrieved chunks are located through the byte offset, length and hash stored
+    in their metadata (minus the byte_skips ranges the splitter cut out, so a
+    chunk reads back exactly as its page_content). Chunks of the same file that overlap or follow each other
+    are merged into one window, which is read from the file in one slice; the
+    mapped pages live in the OS page cache, not in Python strings. With
+    neighbours > 0, each chunk is widened by that many chunks on both sides, whose
+    locations are fetched (metadata only, no text) with fetch_metadatas(ids).
+    Chunks whose file is missing or changed since ingestion (hash mismatch) fall
+    back to their stored page_content. A chunk the server sent without text
+    (omit_located_text) that cannot be located here, e.g. on another host or after
+    an edit, has its text fetched with fetch_texts(ids); without fetch_texts that
+    raises ValueError rather than putting an empty passage in the context.
+    """
+
+    def __init__(self, fetch_metadatas=None, encoding="utf-8", fetch_texts=None):
+        self.fetch_metadatas = fetch_metadatas # ids -> {id: metadata}
+        self.fetch_texts = fetch_texts # ids -> {id: page_content}
+        self.encoding = encoding
+        self._maps = {} # source -> (mtime_ns, size, mmap)
+        self.bytes_read = 0
+
+    def _map(self, source):
+        """Memory map of a source file, re-opened when the file changes"""
+        stat = os.stat(source)
+        cached = self._maps.get(source)
+        if cached is None or cached[:2] != (stat.st_mtime_ns, stat.st_size):
+            if cached is not None:
+                cached[2].close()
+            with open(source, "rb") as f:
+                cached = self._maps[source] = (stat.st_mtime_ns, stat.st_size, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        return cached[2]
+
+    def locate(self, chunk_id, metadata):
+        """(source, start, end, index, skips) of a chunk if the file still holds it, else None"""
+        if not metadata or not all(key in metadata for key in LOCATION_KEYS):
+            return None
+        source, offset = metadata.get("source"), metadata["byte_offset"]
+        end = offset + metadata["byte_length"]
+        try:
+            skips = tuple(tuple(skip) for skip in json.loads(metadata.get(SKIPS_KEY) or "[]"))
+            mapped = self._map(source)
+        except (OSError, TypeError, ValueError):
+            return None
+        if end > len(mapped) or not all(offset <= start < stop <= end for start, stop in skips):
+            return None
+        sha256 = hashlib.sha256()
+        with memoryview(mapped) as view: # hash the mapped bytes without copying them
+            for start, stop in kept_ranges(offset, end, skips):
+                sha256.update(view[start:stop])
+        if sha256.hexdigest() != metadata["content_hash"]:
+            return None
+        parsed = parse_chunk_id(chunk_id)
+        return source, offset, end, parsed[1] if parsed and parsed[0] == source else None, skips
+
+    def _neighbours(self, located, neighbours):
+        """Locations of the chunks around each located chunk, fetched by ID"""
+        wanted = set()
+        for chunk_id, (source, _, _, index, _) in located.items():
+            if index is not None:
+                wanted.update(f"{source}:{index + offset}" for offset in range(-neighbours, neighbours + 1) if index + offset >= 0)
+        wanted.difference_update(located)
+        if not wanted:
+            return {}
+        found = {}
+        for chunk_id, metadata in self.fetch_metadatas(sorted(wanted)).items():
+            location = self.locate(chunk_id, metadata)
+            if location is not None:
+                found[chunk_id] = location
+        return found
+
+    def windows(self, documents, neighbours=0):
+        """Merged context windows for retrieved documents, in order of their best-ranked chunk"""
+        located, ranks, fallback, omitted = {}, {}, [], []
+        for rank, document in enumerate(documents):
+            if document.id in located:
+                continue
+            location = self.locate(document.id, document.metadata)
+            if location is None:
+                if document.metadata.get(TEXT_OMITTED_KEY):
+                    omitted.append((rank, document))
+                else:
+                    fallback.append((rank, ContextWindow(document.metadata.get("source", ""), 0, 0, (document.id,), document.page_content)))
+                continue
+            located[document.id] = location
+            ranks[document.id] = rank
+
+        # The server could read these chunks but this reader cannot: fetch their text in one call
+        if omitted:
+            ids = [document.id for _, document in omitted]
+            if self.fetch_texts is None:
+                raise ValueError(f"Chunks {ids} were sent without text and cannot be located here; pass fetch_texts")
+            texts = self.fetch_texts(ids)
+            missing = [chunk_id for chunk_id in ids if texts.get(chunk_id) is None]
+            if missing:
+                raise ValueError(f"Chunks {missing} were sent without text and are no longer in the collection")
+            fallback.extend((rank, ContextWindow(document.metadata.get("source", ""), 0, 0, (document.id,), texts[document.id]))
+                            for rank, document in omitted)
+
+        if neighbours > 0 and self.fetch_metadatas is not None and located:
+            retrieved = dict(located)
+            for chunk_id, location in self._neighbours(retrieved, neighbours).items():
+                source, _, _, index, _ = location
+                # A neighbour is ranked like the best retrieved chunk it sits next to
+                near = [ranks[other] for other, (s, _, _, i, _) in retrieved.items()
+                        if s == source and i is not None and abs(i - index) <= neighbours]
+                located[chunk_id] = location
+                ranks[chunk_id] = min(near, default=len(documents))
+
+        # Merge byte ranges per file: overlapping, touching or consecutive chunks form one window
+        merged = []
+        for chunk_id in sorted(located, key=lambda chunk_id: located[chunk_id][:2]):
+            source, start, end, index, skips = located[chunk_id]
+            if merged:
+                window = merged[-1]
+                if window["source"] == source and (
+                    start <= window["end"] or (index is not None and window["last_index"] is not None and index == window["last_index"] + 1)
+                ):
+                    window["end"] = max(window["end"], end)
+                    window["last_index"] = index
+                    window["chunk_ids"].append(chunk_id)
+                    window["rank"] = min(window["rank"], ranks[chunk_id])
+                    window["skips"].extend(skips)
+                    continue
+            merged.append({"source": source, "start": start, "end": end, "last_index": index, "chunk_ids": [chunk_id],
+                           "rank": ranks[chunk_id], "skips": list(skips)})
+
+        windows = [(window["rank"], ContextWindow(window["source"], window["start"], window["end"], tuple(window["chunk_ids"]),
+                                                  skips=merge_ranges(window["skips"])))
+                   for window in merged]
+        return [window for _, window in sorted(windows + fallback, key=lambda item: item[0])]
+
+    def read(self, window):
+        """Text of a window, sliced from the mapped file (without its skipped ranges)"""
+        if window.text is not None:
+            return window.text
+        mapped = self._map(window.source)
+        ranges = kept_ranges(window.start, window.end, window.skips)
+        self.bytes_read += sum(end - start for start, end in ranges)
+        return b"".join(mapped[start:end] for start, end in ranges).decode(self.encoding)
+
+    def build_context(self, documents, neighbours=0, separator="\n"):
+        """Prompt context for retrieved documents: the merged windows joined with separator"""
+        return separator.join(self.read(window) for window in self.windows(documents, neighbours))
+
+    def close(self):
+        for _, _, mapped in self._maps.values():
+            mapped.close()
+        self._maps.clear()
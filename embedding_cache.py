@@ -0,0 +1,211 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+def embedding_key(model_name, text):
+    """Content address of a chunk: (model name, sha256 of the chunk text)"""
+    text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return f"{model_name}:{text_hash}"
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an embedding model with a persistent on-disk cache
+
+    Vectors are stored in a small SQLite file keyed by (model name, chunk-text hash),
+    so re-running ingestion only pays for chunks that are new or have changed.
+    """
+
+    def __init__(self, embedding_model, model_name, cache_path="db/embedding_cache.sqlite3"):
+        self.embedding_model = embedding_model # underlying (remote) embedding model
+        self.model_name = model_name # part of the cache key so models never mix
+        self.cache_path = cache_path
+        self.hits = 0
+        self.misses = 0
+
+        # Make sure the cache directory exists before SQLite creates the file
+        cache_dir = os.path.dirname(cache_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        self.connection = sqlite3.connect(cache_path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+
+    def _lookup_blobs(self, keys):
+        """Returns {key: float32 bytes} for every key already in the cache"""
+        found = {}
+        # SQLite limits the number of bound parameters, so query in slices
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.connection.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+            )
+            found.update(rows)
+        return found
+
+    def _store(self, items):
+        """Persists (key, float32 bytes) pairs"""
+        self.connection.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", items)
+        self.connection.commit()
+
+    def _embed_blobs(self, texts):
+        """Returns (keys, {key: float32 bytes}), only calling the model for cache misses"""
+        keys = [embedding_key(self.model_name, text) for text in texts]
+        blobs = self._lookup_blobs(list(set(keys)))
+
+        # Collect unique misses (identical chunks are embedded once)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key in blobs:
+                self.hits += 1
+            else:
+                self.misses += 1
+                missing.setdefault(key, text)
+
+        if missing:
+            missing_keys = list(missing)
+            vectors = self.embedding_model.embed_documents([missing[key] for key in missing_keys])
+            new_items = [(key, array("f", vector).tobytes()) for key, vector in zip(missing_keys, vectors)]
+            self._store(new_items)
+            blobs.update(new_items)
+        return keys, blobs
+
+    def embed_documents(self, texts):
+        """Embeds texts, only calling the model for cache misses"""
+        keys, blobs = self._embed_blobs(texts)
+        vectors = []
+        for key in keys:
+            vector = array("f")
+            vector.frombytes(blobs[key])
+            vectors.append(vector.tolist())
+        return vectors
+
+    def embed_documents_array(self, texts):
+        """Same as embed_documents, but returns a float32 NumPy matrix
+
+        The stored bytes are copied straight into the matrix, without building a
+        Python float per dimension (what makes re-chunking whole documents slow).
+        """
+        keys, blobs = self._embed_blobs(texts)
+        return np.frombuffer(b"".join(blobs[key] for key in keys), dtype=np.float32).reshape(len(keys), -1)
+
+    def embed_query(self, text):
+        """Queries are not cached here, they go straight to the model"""
+        return self.embedding_model.embed_query(text)
+
+    def stats(self):
+        """Returns hit/miss counters for this run"""
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0.0
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": hit_rate}
+
+    def print_stats(self):
+        stats = self.stats()
+        print(f"Embedding cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"({stats['hit_rate']:.1%} hit rate) at {self.cache_path}")
+        # Also report the wrapped model's counters (e.g. scheduler throughput)
+        if hasattr(self.embedding_model, "print_stats"):
+            self.embedding_model.print_stats()
+
+
+def normalize_query(text):
+    """Collapses whitespace and case so trivially different queries share an entry"""
+    return " ".join(text.split()).casefold()
+
+
+class QueryEmbeddingCache(Embeddings):
+    """Wraps an embedding model with a bounded in-memory LRU cache (with TTL) for queries
+
+    Entries are keyed by (model name, normalized query text). Document embeddings
+    are passed straight through to the wrapped model.
+    """
+
+    def __init__(self, embedding_model, model_name, max_size=10000, ttl=3600):
+        self.embedding_model = embedding_model
+        self.model_name = model_name
+        self.max_size = max_size # entries kept before the least recently used one is evicted
+        self.ttl = ttl # seconds an entry stays valid
+        self.entries = OrderedDict() # key -> (expires_at, vector), oldest first
+        self._lock = threading.Lock() # shared by the retrieval server's worker threads
+        self.hits = 0
+        self.misses = 0
+
+    def embed_query(self, text):
+        """Returns the cached query embedding, embedding the query on a miss"""
+        key = (self.model_name, normalize_query(text))
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(key) # mark as most recently used
+                self.hits += 1
+                return list(entry[1])
+            self.misses += 1
+
+        vector = self.embedding_model.embed_query(text)
+
+        with self._lock:
+            self.entries[key] = (now + self.ttl, vector)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False) # evict the least recently used entry
+        return list(vector)
+
+    def embed_queries(self, texts):
+        """Embeds several queries, sending all cache misses in a single batch call"""
+        keys = [(self.model_name, normalize_query(text)) for text in texts]
+        now = time.monotonic()
+        vectors = [None] * len(texts)
+        missing = []
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                entry = self.entries.get(key)
+                if entry is not None and entry[0] > now:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    vectors[i] = list(entry[1])
+                else:
+                    self.misses += 1
+                    missing.append(i)
+
+        if missing:
+            new_vectors = self.embedding_model.embed_documents([texts[i] for i in missing])
+            with self._lock:
+                for i, vector in zip(missing, new_vectors):
+                    vectors[i] = list(vector)
+                    self.entries[keys[i]] = (now + self.ttl, vector)
+                    self.entries.move_to_end(keys[i])
+                while len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+        return vectors
+
+    def embed_documents(self, texts):
+        return self.embedding_model.embed_documents(texts)
+
+    def stats(self):
+        """Returns hit/miss counters and current size"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self.entries),
+            }
+
+    def print_stats(self):
+        stats = self.stats()
+        print(f"Query embedding cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"({stats['hit_rate']:.1%} hit rate), {stats['size']} entries")
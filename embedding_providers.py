@@ -0,0 +1,136 @@
+import hashlib
+import os
+import re
+import threading
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Selected with EMBEDDING_PROVIDER (e.g. in .env), the model with the provider's own variable below
+EMBEDDING_PROVIDERS = ("openai", "local", "fake")
+DEFAULT_MODELS = {
+    "openai": "text-embedding-3-small",
+    "local": "sentence-transformers/all-MiniLM-L6-v2",
+    "fake": "hash-1536", # hash-<dimensions>
+}
+# One variable per provider, so switching EMBEDDING_PROVIDER never hands one provider another's model name
+MODEL_ENV_VARS = {
+    "openai": "EMBEDDING_MODEL",
+    "local": "LOCAL_EMBEDDING_MODEL",
+    "fake": "FAKE_EMBEDDING_MODEL",
+}
+
+
+def embedding_config(provider=None, model_name=None):
+    """Resolves (provider, model_name) from the arguments, then the environment, then the defaults
+
+    The model name comes from the provider's variable in MODEL_ENV_VARS
+    (EMBEDDING_MODEL for openai, LOCAL_EMBEDDING_MODEL for local, FAKE_EMBEDDING_MODEL for fake).
+    """
+    provider = provider or os.getenv("EMBEDDING_PROVIDER", "openai")
+    if provider not in EMBEDDING_PROVIDERS:
+        raise ValueError(f"Unknown embedding provider {provider!r}, expected one of {EMBEDDING_PROVIDERS}")
+    model_name = model_name or os.getenv(MODEL_ENV_VARS[provider]) or DEFAULT_MODELS[provider]
+    if provider == "fake":
+        hash_dimensions(model_name) # fail here, with the variable to fix, rather than at the first embedding
+    return provider, model_name
+
+def hash_dimensions(model_name):
+    """Dimensions of a fake "hash-<dimensions>" model name"""
+    match = re.fullmatch(r"hash-(\d+)", model_name)
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"Fake embedding models are named hash-<dimensions> (e.g. hash-1536), got {model_name!r}; "
+                         f"set {MODEL_ENV_VARS['fake']} or leave it unset")
+    return int(match.group(1))
+
+def cache_model_name(provider, model_name):
+    """Model name used in embedding cache keys (OpenAI keeps the bare name, so existing caches stay valid)"""
+    return model_name if provider == "openai" else f"{provider}:{model_name}"
+
+def create_embeddings(provider=None, model_name=None, **openai_kwargs):
+    """Creates the configured embedding model (openai_kwargs go to OpenAIEmbeddings)"""
+    provider, model_name = embedding_config(provider, model_name)
+    if provider == "openai":
+        from langchain_openai import OpenAIEmbeddings
+        return OpenAIEmbeddings(model=model_name, **openai_kwargs)
+    if provider == "local":
+        return LocalEmbeddings(model_name)
+    return HashEmbeddings(dimensions=hash_dimensions(model_name))
+
+
+class HashEmbeddings(Embeddings):
+    """Deterministic offline embeddings for tests and benchmarks
+
+    Feature hashing of lower-cased words into `dimensions` signed buckets, then
+    L2-normalized. Identical texts always get identical vectors (in every process)
+    and texts sharing words get similar ones, with no model and no network.
+    """
+
+    def __init__(self, dimensions=1536):
+        self.dimensions = dimensions
+        self._token_cache = {} # word -> (bucket, sign)
+
+    def _bucket(self, token):
+        cached = self._token_cache.get(token)
+        if cached is None:
+            value = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+            cached = self._token_cache[token] = (value % self.dimensions, 1.0 if value >> 63 else -1.0)
+        return cached
+
+    def embed_documents(self, texts):
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            buckets = [self._bucket(token) for token in re.findall(r"\w+", text.lower())] or [self._bucket("")]
+            indices, signs = zip(*buckets)
+            np.add.at(matrix[row], np.array(indices), np.array(signs, dtype=np.float32))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return (matrix / np.where(norms == 0, 1.0, norms)).tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+_local_models = {} # model name -> loaded model, shared by every LocalEmbeddings in the process
+_local_models_lock = threading.Lock()
+
+def load_local_model(model_name):
+    """Loads a sentence-transformers model on CPU once per process"""
+    with _local_models_lock:
+        if model_name not in _local_models:
+            try:
+                from sentence_transformers import SentenceTransformer
+            except ImportError as e:
+                raise ImportError("The local embedding provider needs sentence-transformers: "
+                                  "pip install sentence-transformers (or pip install -r requirements.txt)") from e
+            _local_models[model_name] = SentenceTransformer(model_name, device="cpu")
+        return _local_models[model_name]
+
+
+class LocalEmbeddings(Embeddings):
+    """CPU-local embeddings with batched inference and an in-memory model cache
+
+    Texts are sorted by length before batching, so each batch pads to similar
+    lengths, and the vectors are put back in input order with one NumPy scatter.
+    """
+
+    def __init__(self, model_name=DEFAULT_MODELS["local"], batch_size=64):
+        self.model_name = model_name
+        self.batch_size = batch_size
+
+    def embed_documents(self, texts):
+        if not texts:
+            return []
+        model = load_local_model(self.model_name)
+        order = np.argsort([len(text) for text in texts], kind="stable")
+        vectors = model.encode(
+            [texts[i] for i in order],
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+        )
+        result = np.empty_like(vectors)
+        result[order] = vectors
+        return result.tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
@@ -0,0 +1,170 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+import tiktoken
+from langchain_core.embeddings import Embeddings
+
+
+def is_rate_limit(error):
+    """True for HTTP 429 responses from the embedding endpoint"""
+    return getattr(error, "status_code", None) == 429
+
+def is_retryable(error):
+    """Rate limits, server errors and connection problems are worth retrying"""
+    status_code = getattr(error, "status_code", None)
+    if status_code is not None:
+        return status_code == 429 or status_code >= 500
+    return isinstance(error, (openai.APIConnectionError, ConnectionError, TimeoutError))
+
+def retry_after_seconds(error):
+    """Reads the Retry-After header of a rate-limited response, if present"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class EmbeddingScheduler(Embeddings):
+    """Sends embedding requests as concurrent, token-sized batches
+
+    - Up to `max_in_flight` batches are sent at the same time.
+    - Batches are filled up to a token budget. The budget is halved after a rate limit
+      and slowly grows back after successful requests.
+    - Rate-limited requests are retried after the server's Retry-After delay (or an
+      exponential backoff with jitter), and all workers pause until then.
+
+    The wrapped model should have its own retries disabled (e.g. `max_retries=0`).
+    """
+
+    def __init__(self, embedding_model, model_name="text-embedding-3-small", max_in_flight=4,
+                 max_batch_tokens=8000, min_batch_tokens=500, max_batch_size=512,
+                 max_retries=6, base_delay=1.0, max_delay=60.0):
+        self.embedding_model = embedding_model
+        self.max_in_flight = max_in_flight # number of concurrent requests
+        self.max_batch_tokens = max_batch_tokens # upper bound of the adaptive token budget
+        self.min_batch_tokens = min_batch_tokens # lower bound of the adaptive token budget
+        self.max_batch_size = max_batch_size # maximum number of texts per request
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        try:
+            self.encoding = tiktoken.encoding_for_model(model_name) # used to count tokens per text
+        except KeyError: # a model tiktoken does not know (e.g. self-hosted): count like the OpenAI embedding models
+            self.encoding = tiktoken.get_encoding("cl100k_base")
+
+        self.batch_tokens = max_batch_tokens # current token budget per batch
+        self._lock = threading.Lock()
+        self._pause_until = 0.0 # shared backoff deadline after a rate limit
+
+        # Throughput counters
+        self.chunks_embedded = 0
+        self.requests = 0
+        self.rate_limited = 0
+        self.elapsed = 0.0
+
+    def _next_batch(self, state, token_counts):
+        """Takes the next batch (start, end) using the current token budget"""
+        with self._lock:
+            start = state["cursor"]
+            if start >= len(token_counts):
+                return None
+            end, tokens = start, 0
+            while end < len(token_counts) and end - start < self.max_batch_size:
+                # Always take at least one text, even if it exceeds the budget on its own
+                if end > start and tokens + token_counts[end] > self.batch_tokens:
+                    break
+                tokens += token_counts[end]
+                end += 1
+            state["cursor"] = end
+            return start, end
+
+    def _wait_for_rate_limit(self):
+        """Blocks while another worker is backing off from a rate limit"""
+        while True:
+            with self._lock:
+                delay = self._pause_until - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def _embed_batch(self, texts):
+        """Embeds one batch, retrying rate limits and transient errors"""
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_rate_limit()
+            try:
+                vectors = self.embedding_model.embed_documents(texts)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                backoff = min(self.max_delay, self.base_delay * 2 ** attempt)
+                delay = retry_after_seconds(e) or backoff * random.uniform(0.5, 1.0)
+                with self._lock:
+                    self.requests += 1
+                    if is_rate_limit(e):
+                        # Shrink batches and make every worker wait for the server
+                        self.rate_limited += 1
+                        self.batch_tokens = max(self.min_batch_tokens, self.batch_tokens // 2)
+                        self._pause_until = max(self._pause_until, time.monotonic() + delay)
+                if not is_rate_limit(e):
+                    time.sleep(delay)
+            else:
+                with self._lock:
+                    self.requests += 1
+                    # Grow the budget back slowly after a success
+                    self.batch_tokens = min(self.max_batch_tokens, int(self.batch_tokens * 1.1) + 1)
+                return vectors
+
+    def embed_documents(self, texts):
+        """Embeds texts in concurrent batches, preserving input order"""
+        if not texts:
+            return []
+        start_time = time.perf_counter()
+        token_counts = [len(tokens) for tokens in self.encoding.encode_batch(texts)]
+        results = [None] * len(texts)
+        state = {"cursor": 0}
+
+        def worker():
+            while True:
+                batch = self._next_batch(state, token_counts)
+                if batch is None:
+                    return
+                start, end = batch
+                results[start:end] = self._embed_batch(texts[start:end])
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            futures = [executor.submit(worker) for _ in range(self.max_in_flight)]
+            for future in futures:
+                future.result() # re-raise errors from the workers
+
+        with self._lock:
+            self.chunks_embedded += len(texts)
+            self.elapsed += time.perf_counter() - start_time
+        return results
+
+    def embed_query(self, text):
+        """Single queries are sent directly, with the same retry behaviour"""
+        return self._embed_batch([text])[0]
+
+    def stats(self):
+        """Returns throughput counters"""
+        chunks_per_sec = self.chunks_embedded / self.elapsed if self.elapsed else 0.0
+        return {
+            "chunks": self.chunks_embedded,
+            "requests": self.requests,
+            "rate_limited": self.rate_limited,
+            "seconds": self.elapsed,
+            "chunks_per_sec": chunks_per_sec,
+            "batch_tokens": self.batch_tokens,
+        }
+
+    def print_stats(self):
+        stats = self.stats()
+        print(f"Embedding throughput: {stats['chunks']} chunks in {stats['seconds']:.2f}s "
+              f"({stats['chunks_per_sec']:.1f} chunks/sec), {stats['requests']} requests, "
+              f"{stats['rate_limited']} rate limited, batch budget {stats['batch_tokens']} tokens")
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import random
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_embedding(value, dimensions):
+    """Deterministic unit vector derived from the hash of the input"""
+    seed = hashlib.sha256(json.dumps(value).encode("utf-8")).digest()
+    values = []
+    counter = 0
+    while len(values) < dimensions:
+        block = hashlib.sha256(seed + counter.to_bytes(4, "little")).digest()
+        values.extend(v / 2**31 for v in struct.unpack("<8i", block))
+        counter += 1
+    values = values[:dimensions]
+    norm = sum(v * v for v in values) ** 0.5 or 1.0
+    return [v / norm for v in values]
+
+
+def start_fake_embedding_server(port=0, latency=0.05, rate_limit_probability=0.1, retry_after=0.5, dimensions=1536):
+    """Starts a local OpenAI-compatible /v1/embeddings server in a background thread
+
+    Every request sleeps for `latency` seconds and is answered with a 429 (and a
+    Retry-After header) with probability `rate_limit_probability`.
+    Returns the server and the base URL to pass to OpenAIEmbeddings(base_url=...).
+    """
+    stats = {"requests": 0, "rate_limited": 0, "inputs": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            time.sleep(latency)
+
+            with lock:
+                stats["requests"] += 1
+                rate_limited = random.random() < rate_limit_probability
+                if rate_limited:
+                    stats["rate_limited"] += 1
+
+            if rate_limited:
+                payload = json.dumps({"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}).encode("utf-8")
+                self.send_response(429)
+                self.send_header("Retry-After", str(retry_after))
+            else:
+                # Input can be a string, a list of strings or a list of token arrays
+                inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+                if inputs and isinstance(inputs[0], int):
+                    inputs = [inputs]
+                with lock:
+                    stats["inputs"] += len(inputs)
+                payload = json.dumps({
+                    "object": "list",
+                    "model": body.get("model", "fake"),
+                    "data": [
+                        {"object": "embedding", "index": i, "embedding": fake_embedding(value, body.get("dimensions") or dimensions)}
+                        for i, value in enumerate(inputs)
+                    ],
+                    "usage": {"prompt_tokens": 0, "total_tokens": 0},
+                }).encode("utf-8")
+                self.send_response(200)
+
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass # keep the console quiet
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.stats = stats
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    return server, base_url
+
+
+if __name__ == "__main__":
+    # Run the embedding scheduler against the fake server to check batching and backoff
+    from langchain_openai import OpenAIEmbeddings
+    from embedding_scheduler import EmbeddingScheduler
+
+    server, base_url = start_fake_embedding_server(latency=0.1, rate_limit_probability=0.2)
+    print(f"Fake embedding server running at {base_url}")
+
+    embedding_model = OpenAIEmbeddings(model="text-embedding-3-small", base_url=base_url, api_key="fake", max_retries=0)
+    scheduler = EmbeddingScheduler(embedding_model, max_in_flight=8, max_batch_tokens=2000, base_delay=0.1)
+
+    texts = [f"Chunk {i}: Tesla reported record revenue in Q{i % 4 + 1}. " * (1 + i % 20) for i in range(2000)]
+    vectors = scheduler.embed_documents(texts)
+
+    assert len(vectors) == len(texts)
+    assert vectors[0] == scheduler.embed_documents([texts[0]])[0] # order is preserved
+    scheduler.print_stats()
+    print(f"Server: {server.stats['requests']} requests, {server.stats['rate_limited']} answered with 429")
+    server.shutdown()
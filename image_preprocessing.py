@@ -0,0 +1,160 @@
+import base64
+import hashlib
+import io
+import logging
+import math
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+def difference_hash(image, hash_size=8):
+    """64-bit perceptual hash (dHash): near-identical images get nearby hashes"""
+    pixels = list(image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+def estimate_image_tokens(width, height):
+    """Estimated vision tokens for a high-detail image (OpenAI tiling: 85 + 170 per 512px tile)"""
+    # Fit within 2048x2048, then scale the shortest side down to 768
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+class ImagePreprocessor:
+    """Deduplicates, downsizes and recompresses images before they are sent to a vision model
+
+    - Near-duplicate images (dHash within `hash_threshold` bits) are sent once per
+      prompt. Each prompt is deduplicated on its own, so every chunk that had images
+      still gets them described.
+    - Images that cannot be decoded are logged and skipped.
+    - Images are resized to at most `max_pixels` and re-encoded as JPEG, lowering the
+      quality until they fit in `max_bytes`.
+    - At most `max_images` images are kept per prompt.
+    Counters (bytes and estimated tokens before/after) accumulate until `reset()`.
+    Processed images are memoised by content, keeping the `max_memo` most recently used.
+    """
+
+    QUALITY_STEPS = (85, 75, 65, 50, 35)
+
+    def __init__(self, max_pixels=1024 * 1024, max_bytes=200_000, max_images=8, hash_threshold=5, max_memo=64):
+        self.max_pixels = max_pixels
+        self.max_bytes = max_bytes
+        self.max_images = max_images
+        self.hash_threshold = hash_threshold
+        self.max_memo = max_memo
+        self.processed = OrderedDict() # sha256 of input -> (base64 output, dhash, tokens before, tokens after), LRU order
+        self._lock = threading.Lock() # summaries call prepare() from several threads
+        self.reset()
+
+    def reset(self):
+        """Starts a new run: clears the counters"""
+        with self._lock:
+            self.stats = {
+                "images_in": 0, "failed": 0, "duplicates": 0, "over_cap": 0, "images_out": 0,
+                "bytes_before": 0, "bytes_after": 0, "tokens_before": 0, "tokens_after": 0,
+            }
+
+    def _process(self, image_base64):
+        """Resizes and recompresses one image (memoised by content)"""
+        key = hashlib.sha256(image_base64.encode("ascii")).hexdigest()
+        with self._lock:
+            if key in self.processed:
+                self.processed.move_to_end(key)
+                return self.processed[key]
+
+        image = Image.open(io.BytesIO(base64.b64decode(image_base64)))
+        tokens_before = estimate_image_tokens(*image.size)
+        image_hash = difference_hash(image)
+
+        if image.width * image.height > self.max_pixels:
+            scale = math.sqrt(self.max_pixels / (image.width * image.height))
+            image = image.resize((max(1, int(image.width * scale)), max(1, int(image.height * scale))), Image.LANCZOS)
+        if image.mode != "RGB":
+            image = image.convert("RGB") # JPEG has no alpha or palette
+
+        for quality in self.QUALITY_STEPS:
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG", quality=quality, optimize=True)
+            if buffer.tell() <= self.max_bytes:
+                break
+        data = buffer.getvalue()
+
+        # Never make an image bigger than it was
+        if len(data) >= len(base64.b64decode(image_base64)) and tokens_before <= estimate_image_tokens(*image.size):
+            output = image_base64
+        else:
+            output = base64.b64encode(data).decode("ascii")
+
+        result = (output, image_hash, tokens_before, estimate_image_tokens(*image.size))
+        with self._lock:
+            self.processed[key] = result
+            while len(self.processed) > self.max_memo:
+                self.processed.popitem(last=False)
+        return result
+
+    def prepare(self, images_base64):
+        """Returns the deduplicated, downsized images to send (at most max_images)
+
+        Images near-identical to one earlier in the same prompt are dropped, and images
+        that cannot be decoded are logged and skipped.
+        """
+        kept = []
+        kept_hashes = []
+        stats = dict.fromkeys(self.stats, 0)
+
+        for image_base64 in images_base64:
+            stats["images_in"] += 1
+            stats["bytes_before"] += len(image_base64)
+            try:
+                output, image_hash, tokens_before, tokens_after = self._process(image_base64)
+            except Exception as e: # bad base64, truncated or unsupported image data
+                logger.warning("Skipping an image that cannot be decoded: %s", e)
+                stats["failed"] += 1
+                continue
+            stats["tokens_before"] += tokens_before
+
+            if any(hamming_distance(image_hash, other) <= self.hash_threshold for other in kept_hashes):
+                stats["duplicates"] += 1
+                continue
+            if len(kept) >= self.max_images:
+                stats["over_cap"] += 1
+                continue
+
+            kept.append(output)
+            kept_hashes.append(image_hash)
+            stats["images_out"] += 1
+            stats["bytes_after"] += len(output)
+            stats["tokens_after"] += tokens_after
+
+        with self._lock: # summaries call prepare() from several threads
+            for name, value in stats.items():
+                self.stats[name] += value
+        return kept
+
+    def print_report(self, label="document"):
+        stats = self.stats
+        if not stats["images_in"]:
+            return
+        saved_bytes = stats["bytes_before"] - stats["bytes_after"]
+        saved_tokens = stats["tokens_before"] - stats["tokens_after"]
+        print(f"Image preprocessing for {label}: {stats['images_in']} images in, {stats['images_out']} sent "
+              f"({stats['duplicates']} duplicates, {stats['over_cap']} over the per-prompt cap, "
+              f"{stats['failed']} undecodable)")
+        print(f"  {stats['bytes_before'] / 1024:.0f} KB -> {stats['bytes_after'] / 1024:.0f} KB "
+              f"({saved_bytes / 1024:.0f} KB saved), ~{stats['tokens_before']} -> ~{stats['tokens_after']} "
+              f"image tokens ({saved_tokens} saved)")
@@ -0,0 +1,174 @@
+import math
+import os
+import re
+import threading
+from array import array
+from collections import Counter
+
+import numpy as np
+
+# Very common English words, skipped so they do not bloat postings or scores
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "did", "do", "does", "for", "from", "how", "in",
+    "is", "it", "its", "of", "on", "or", "that", "the", "this", "to", "was", "were", "what", "when",
+    "where", "which", "who", "why", "with",
+}
+
+
+def tokenize(text):
+    """Lower-cased word tokens without stopwords"""
+    return [token for token in re.findall(r"\w+", text.lower()) if token not in STOPWORDS]
+
+
+class LexicalIndex:
+    """BM25 inverted index over chunk texts, keyed by the same chunk IDs as Chroma
+
+    Postings are compact typed arrays (one array of document numbers and one of term
+    frequencies per term), scored with NumPy at query time. Chunks can be added,
+    replaced and deleted incrementally: deleted documents are tombstoned (length 0)
+    and skipped when scoring, and the postings are compacted once more than
+    `compact_ratio` of the documents are tombstones. Saved as one .npz file.
+    """
+
+    def __init__(self, path="db/bm25_index.npz", k1=1.5, b=0.75, compact_ratio=0.25):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.compact_ratio = compact_ratio
+        self.doc_ids = [] # document number -> chunk ID
+        self.doc_numbers = {} # chunk ID -> document number (live documents only)
+        self.doc_lengths = array("I") # tokens per document, 0 = deleted
+        self.postings = {} # term -> (array of document numbers, array of term frequencies)
+        self.total_length = 0 # tokens in live documents
+        self.mtime = None # mtime of the file the index was loaded from
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.doc_numbers)
+
+    @classmethod
+    def load(cls, path="db/bm25_index.npz", **kwargs):
+        """Loads a saved index (an empty one if the file does not exist yet)"""
+        index = cls(path, **kwargs)
+        if not os.path.exists(path):
+            return index
+        with np.load(path) as data:
+            index.doc_ids = data["doc_ids"].tolist()
+            index.doc_lengths = array("I", data["doc_lengths"].astype(np.uint32).tobytes())
+            offsets, docs, tfs = data["offsets"], data["docs"].astype(np.uint32), data["tfs"].astype(np.uint32)
+            for i, term in enumerate(data["terms"].tolist()):
+                start, end = offsets[i], offsets[i + 1]
+                index.postings[term] = (array("I", docs[start:end].tobytes()), array("I", tfs[start:end].tobytes()))
+        index.doc_numbers = {doc_id: n for n, doc_id in enumerate(index.doc_ids) if index.doc_lengths[n]}
+        index.total_length = sum(index.doc_lengths)
+        index.mtime = os.path.getmtime(path)
+        return index
+
+    def save(self):
+        """Writes the postings as flat arrays (CSR layout), atomically"""
+        with self._lock:
+            terms = sorted(self.postings)
+            lengths = [len(self.postings[term][0]) for term in terms]
+            offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=offsets[1:])
+            docs = np.concatenate([np.frombuffer(self.postings[term][0], dtype=np.uint32) for term in terms] or [np.zeros(0, np.uint32)])
+            tfs = np.concatenate([np.frombuffer(self.postings[term][1], dtype=np.uint32) for term in terms] or [np.zeros(0, np.uint32)])
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = self.path + ".tmp.npz"
+            np.savez(
+                tmp_path,
+                terms=np.array(terms, dtype=str),
+                offsets=offsets,
+                docs=docs,
+                tfs=tfs.astype(np.uint16) if tfs.size and tfs.max() < 65536 else tfs,
+                doc_ids=np.array(self.doc_ids, dtype=str),
+                doc_lengths=np.frombuffer(self.doc_lengths, dtype=np.uint32),
+            )
+            os.replace(tmp_path, self.path)
+
+    def add(self, ids, texts):
+        """Adds (or replaces) chunks"""
+        with self._lock:
+            self._delete(ids)
+            for doc_id, text in zip(ids, texts):
+                counts = Counter(tokenize(text))
+                n = len(self.doc_ids)
+                self.doc_ids.append(doc_id)
+                self.doc_numbers[doc_id] = n
+                length = sum(counts.values())
+                self.doc_lengths.append(max(length, 1)) # an empty chunk is still a live document
+                self.total_length += max(length, 1)
+                for term, tf in counts.items():
+                    posting = self.postings.get(term)
+                    if posting is None:
+                        posting = self.postings[term] = (array("I"), array("I"))
+                    posting[0].append(n) # document numbers only grow, so postings stay sorted
+                    posting[1].append(tf)
+
+    def add_documents(self, documents, ids):
+        self.add(ids, [document.page_content for document in documents])
+
+    def delete(self, ids):
+        """Removes chunks (tombstoned until the next compaction)"""
+        with self._lock:
+            self._delete(ids)
+
+    def _delete(self, ids):
+        for doc_id in ids:
+            n = self.doc_numbers.pop(doc_id, None)
+            if n is not None:
+                self.total_length -= self.doc_lengths[n]
+                self.doc_lengths[n] = 0
+        deleted = len(self.doc_ids) - len(self.doc_numbers)
+        if deleted and deleted > self.compact_ratio * len(self.doc_ids):
+            self._compact()
+
+    def _compact(self):
+        """Drops tombstoned documents from the postings and renumbers the rest"""
+        lengths = np.frombuffer(self.doc_lengths, dtype=np.uint32)
+        live = lengths > 0
+        new_numbers = np.cumsum(live, dtype=np.int64) - 1 # old document number -> new one
+        postings = {}
+        for term, (docs, tfs) in self.postings.items():
+            docs = np.frombuffer(docs, dtype=np.uint32)
+            keep = live[docs]
+            if keep.any():
+                postings[term] = (
+                    array("I", new_numbers[docs[keep]].astype(np.uint32).tobytes()),
+                    array("I", np.frombuffer(tfs, dtype=np.uint32)[keep].tobytes()),
+                )
+        self.doc_ids = [doc_id for doc_id, is_live in zip(self.doc_ids, live) if is_live]
+        self.doc_lengths = array("I", lengths[live].tobytes())
+        self.doc_numbers = {doc_id: n for n, doc_id in enumerate(self.doc_ids)}
+        self.postings = postings
+
+    def search(self, query, k=4):
+        """Returns the top k [(chunk_id, bm25 score)] for a query"""
+        with self._lock:
+            if not self.doc_numbers or k <= 0:
+                return []
+            lengths = np.frombuffer(self.doc_lengths, dtype=np.uint32).astype(np.float32)
+            average_length = self.total_length / len(self.doc_numbers)
+            scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+
+            for term, query_tf in Counter(tokenize(query)).items():
+                posting = self.postings.get(term)
+                if posting is None:
+                    continue
+                docs = np.frombuffer(posting[0], dtype=np.uint32)
+                tfs = np.frombuffer(posting[1], dtype=np.uint32).astype(np.float32)
+                live = lengths[docs] > 0
+                docs, tfs = docs[live], tfs[live]
+                if docs.size == 0:
+                    continue
+                idf = math.log(1 + (len(self.doc_numbers) - docs.size + 0.5) / (docs.size + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * lengths[docs] / average_length)
+                scores[docs] += query_tf * idf * tfs * (self.k1 + 1) / (tfs + norm)
+
+            matches = np.flatnonzero(scores)
+            if matches.size > k:
+                matches = matches[np.argpartition(-scores[matches], k - 1)[:k]]
+            matches = matches[np.argsort(-scores[matches], kind="stable")]
+            return [(self.doc_ids[n], float(scores[n])) for n in matches]
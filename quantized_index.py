@@ -0,0 +1,166 @@
+import json
+import os
+
+import numpy as np
+
+from candidate_reranking import normalize_rows
+
+# Set bits per byte value, for Hamming distances on packed binary codes
+POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+QUANTIZATION_MODES = ("int8", "binary")
+
+
+def hamming_distances(codes, query_bits):
+    """Hamming distance from each packed binary code to the query code"""
+    if hasattr(np, "bitwise_count"): # NumPy 2: hardware popcount, on 64-bit words when rows allow it
+        if codes.shape[1] % 8 == 0:
+            codes, query_bits = codes.view(np.uint64), query_bits.view(np.uint64)
+        return np.bitwise_count(np.bitwise_xor(codes, query_bits)).sum(axis=1, dtype=np.int32)
+    return POPCOUNT[np.bitwise_xor(codes, query_bits)].sum(axis=1, dtype=np.int32)
+
+def truncate_embeddings(matrix, dims=None):
+    """Matryoshka-style truncation: keep the first `dims` dimensions and re-normalize"""
+    if dims is not None:
+        matrix = matrix[..., :dims]
+    return normalize_rows(matrix)
+
+
+class QuantizedIndex:
+    """Compact in-memory vector index with exact float re-scoring
+
+    Stage 1 scores every chunk against compact codes held in RAM: int8 codes
+    (per-dimension scale, 4x smaller than float32) or binary sign codes (32x
+    smaller, Hamming distance), optionally on the first `dims` dimensions only.
+    Stage 2 re-scores the best `k * rescore_factor` candidates with the
+    full-precision vectors, which are memory-mapped from disk and only paged in
+    for those rows.
+    """
+
+    def __init__(self, ids, codes, full, mode="int8", dims=None, scale=None):
+        self.ids = list(ids)
+        self.codes = codes # (n, dims) int8 or (n, dims / 8) packed bits
+        self.full = full # (n, full dims) unit-normalized float32, usually a memmap
+        self.mode = mode
+        self.dims = dims
+        self.scale = scale # per-dimension int8 scale
+        self.mtime = None # mtime of the index.json the index was loaded from
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, ids, embeddings, mode="int8", dims=None):
+        """Quantizes full-precision embeddings"""
+        if mode not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization mode {mode!r}, expected one of {QUANTIZATION_MODES}")
+        if len(ids) == 0: # empty collection: an index that returns no results
+            codes = np.zeros((0, 0), dtype=np.int8 if mode == "int8" else np.uint8)
+            scale = np.ones(0, dtype=np.float32) if mode == "int8" else None
+            return cls([], codes, np.zeros((0, 0), dtype=np.float32), mode=mode, dims=dims, scale=scale)
+        full = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        coarse = truncate_embeddings(full, dims)
+        scale = None
+        if mode == "int8":
+            scale = np.abs(coarse).max(axis=0) / 127
+            scale[scale == 0] = 1.0
+            codes = np.round(coarse / scale).astype(np.int8)
+        else:
+            codes = np.packbits(coarse > 0, axis=1)
+        return cls(ids, codes, full, mode=mode, dims=dims, scale=scale)
+
+    @classmethod
+    def from_chroma(cls, db, mode="int8", dims=None, page_size=5000):
+        """Builds the index from every embedding stored in a Chroma collection"""
+        ids, embeddings = [], []
+        while True:
+            page = db.get(include=["embeddings"], limit=page_size, offset=len(ids))
+            if not page["ids"]:
+                break
+            ids.extend(page["ids"])
+            embeddings.extend(page["embeddings"])
+        return cls.build(ids, embeddings, mode=mode, dims=dims)
+
+    def save(self, directory="db/quantized_index"):
+        """Writes the codes and the full-precision vectors (.npy, memory-mapped on load)
+
+        Every file is written to a temporary name and renamed into place, so a server
+        that has the old full.npy memory-mapped keeps reading the old file. index.json
+        is replaced last; its mtime tells readers a new index is complete.
+        """
+        os.makedirs(directory, exist_ok=True)
+
+        def save_array(name, array):
+            tmp_path = os.path.join(directory, name + ".tmp.npy")
+            np.save(tmp_path, array)
+            os.replace(tmp_path, os.path.join(directory, name + ".npy"))
+
+        save_array("full", np.asarray(self.full, dtype=np.float32))
+        save_array("codes", self.codes)
+        if self.scale is not None:
+            save_array("scale", self.scale)
+        elif os.path.exists(os.path.join(directory, "scale.npy")):
+            os.remove(os.path.join(directory, "scale.npy")) # left over from an int8 index
+        tmp_path = os.path.join(directory, "index.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"mode": self.mode, "dims": self.dims, "ids": self.ids}, f)
+        os.replace(tmp_path, os.path.join(directory, "index.json"))
+
+    @staticmethod
+    def header(directory="db/quantized_index"):
+        """The saved mode, dims and ids, None if no index was saved in directory"""
+        path = os.path.join(directory, "index.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    @classmethod
+    def load(cls, directory="db/quantized_index"):
+        mtime = os.path.getmtime(os.path.join(directory, "index.json"))
+        header = cls.header(directory)
+        scale_path = os.path.join(directory, "scale.npy")
+        index = cls(
+            header["ids"],
+            np.load(os.path.join(directory, "codes.npy")), # the compact codes live in RAM
+            np.load(os.path.join(directory, "full.npy"), mmap_mode="r"), # the full vectors stay on disk
+            mode=header["mode"],
+            dims=header["dims"],
+            scale=np.load(scale_path) if header["mode"] == "int8" else None,
+        )
+        index.mtime = mtime
+        return index
+
+    def memory_bytes(self):
+        """RAM held by the coarse stage (the full vectors are memory-mapped)"""
+        return self.codes.nbytes + (self.scale.nbytes if self.scale is not None else 0)
+
+    def coarse_scores(self, query_embedding, block_size=2048):
+        """Approximate similarity of every chunk to the query (higher is better)"""
+        query = truncate_embeddings(np.asarray(query_embedding, dtype=np.float32), self.dims)
+        scores = np.empty(len(self.codes), dtype=np.float32)
+        if self.mode == "int8":
+            weights = query * self.scale # fold the scale into the query once
+        else:
+            query_bits = np.packbits(query > 0)
+        # Small blocks keep the temporary float / XOR arrays in cache
+        for start in range(0, len(self.codes), block_size):
+            block = self.codes[start:start + block_size]
+            if self.mode == "int8":
+                scores[start:start + len(block)] = block.astype(np.float32) @ weights
+            else:
+                scores[start:start + len(block)] = -hamming_distances(block, query_bits)
+        return scores
+
+    def search(self, query_embedding, k=4, rescore_factor=10):
+        """Coarse search, then exact cosine re-scoring; returns [(chunk_id, score)]"""
+        if not self.ids or k <= 0:
+            return []
+        scores = self.coarse_scores(query_embedding)
+        candidate_count = min(len(scores), k * rescore_factor)
+        candidates = np.argpartition(-scores, candidate_count - 1)[:candidate_count]
+        candidates.sort() # sequential reads from the memory map
+
+        query = normalize_rows(np.asarray(query_embedding, dtype=np.float32))
+        exact = np.asarray(self.full[candidates]) @ query
+        best = np.argsort(-exact, kind="stable")[:k]
+        return [(self.ids[candidates[i]], float(exact[i])) for i in best]
@@ -0,0 +1,140 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+# Words that usually point back to something said earlier in the conversation
+REFERENCE_WORDS = {
+    "it", "its", "it's", "they", "them", "their", "theirs", "this", "that", "these", "those",
+    "he", "him", "his", "she", "her", "hers", "there", "then", "former", "latter", "same",
+}
+# Possessives often refer to an entity earlier in the same question ("SpaceX ... its launches")
+POSSESSIVES = {"its", "their", "his", "her"}
+# Openings of elliptical follow-ups ("What about Google?", "And in 2020?")
+FOLLOW_UP_PREFIXES = ("and ", "also ", "what about", "how about", "how so", "but ", "or ", "so ")
+# Capitalised words that are not entities
+NON_ENTITIES = {
+    "what", "who", "when", "where", "why", "how", "which", "is", "are", "was", "were", "do", "does",
+    "did", "can", "could", "should", "would", "will", "tell", "give", "list", "explain", "describe", "i",
+    "the", "a", "an", "in", "on", "of", "for", "and", "or", "please",
+    "ceo", "cfo", "cto", "coo", "president", "chairman", "founder", "company", # roles need a referent
+}
+
+REWRITE_PROMPT = "Given the chat history, rewrite the new input to be standalone and searchable. Just return the rewritten input."
+
+
+def is_entity(word):
+    """Cheap entity guess: capitalised words and numbers (years, amounts)"""
+    return (word[0].isupper() or word[0].isdigit()) and word.lower() not in NON_ENTITIES
+
+def extract_entities(text):
+    """Lower-cased entity guesses found in a text"""
+    return {word.lower().rstrip(".") for word in re.findall(r"[A-Za-z0-9][\w'.-]*", text) if is_entity(word)}
+
+def named_entities(entities):
+    """Entities that name something (numbers alone do not say what they are about)"""
+    return {entity.removesuffix("'s") for entity in entities if not entity[0].isdigit()}
+
+def rewrite_decision(user_input, previous_turn, short_follow_up_words=3):
+    """Decides locally whether a follow-up needs an LLM rewrite; returns (needed, reason)
+
+    After the pronoun and ellipsis checks, the question's named entities are
+    compared with the previous turn's:
+    - none named ("How did revenue change in 2020?"): rewrite if the previous turn named something
+    - overlapping, in a very short question ("Tesla's margins?"): a clipped follow-up on the
+      same subject, rewrite
+    - overlapping otherwise: a continuation that names its subject, self-contained
+    - no overlap: a new topic, self-contained
+    """
+    words = re.findall(r"[A-Za-z0-9][\w'.-]*", user_input)
+    if user_input.strip().lower().startswith(FOLLOW_UP_PREFIXES):
+        return True, "elliptical follow-up"
+
+    seen_entity = False
+    for word in words:
+        lowered = word.lower()
+        if lowered in REFERENCE_WORDS and not (lowered in POSSESSIVES and seen_entity):
+            return True, "pronoun or reference"
+        seen_entity = seen_entity or is_entity(word)
+
+    question_names = named_entities(extract_entities(user_input))
+    previous_names = named_entities(extract_entities(previous_turn))
+    if not question_names:
+        # Nothing named in the question; only worth rewriting if the previous turn named something
+        if previous_names:
+            return True, "no entity, previous turn has one"
+        return False, "no entities to resolve"
+
+    if question_names & previous_names:
+        if len(words) <= short_follow_up_words:
+            return True, "short follow-up on the same entity"
+        return False, "names its subject (same entity as previous turn)"
+    return False, "self-contained (new entity)"
+
+
+class ConversationalRewriter:
+    """Rewrites follow-up questions to standalone queries, skipping the LLM when possible
+
+    - A local heuristic (references, ellipsis, entity overlap with the previous turn)
+      skips the rewrite for self-contained questions.
+    - Rewrites are memoised per (conversation state, input) in a bounded LRU.
+    """
+
+    def __init__(self, model, cache_size=1000):
+        self.model = model
+        self.cache_size = cache_size
+        self.cache = OrderedDict() # (history hash, input) -> rewritten input
+        self._lock = threading.Lock()
+        self.llm_calls = 0
+        self.skipped = 0
+        self.cache_hits = 0
+        self.llm_ms = 0.0 # time spent in rewrite calls
+
+    def history_key(self, chat_history):
+        """Hash of the conversation state the rewrite depends on"""
+        content = "\n".join(f"{type(message).__name__}:{message.content}" for message in chat_history)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def rewrite(self, user_input, chat_history):
+        """Returns (standalone input, reason)"""
+        if not chat_history:
+            return user_input, "no history"
+
+        previous_turn = " ".join(str(message.content) for message in chat_history[-2:])
+        needed, reason = rewrite_decision(user_input, previous_turn)
+        if not needed:
+            with self._lock:
+                self.skipped += 1
+            return user_input, reason
+
+        key = (self.history_key(chat_history), " ".join(user_input.split()).casefold())
+        with self._lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.cache_hits += 1
+                return self.cache[key], "cached rewrite"
+
+        messages = [SystemMessage(content=REWRITE_PROMPT)] + chat_history + [HumanMessage(content=f"New input: {user_input}")]
+        start = time.perf_counter()
+        standalone_input = str(self.model.invoke(messages).content).strip()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        with self._lock:
+            self.llm_ms += elapsed_ms
+            self.llm_calls += 1
+            self.cache[key] = standalone_input
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return standalone_input, reason
+
+    def stats(self):
+        with self._lock:
+            return {
+                "llm_calls": self.llm_calls,
+                "skipped": self.skipped,
+                "cache_hits": self.cache_hits,
+                "llm_ms": self.llm_ms,
+            }
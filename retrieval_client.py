@@ -0,0 +1,149 @@
+import http.client
+import json
+import os
+from urllib.parse import urlparse
+
+from langchain_core.documents import Document
+
+from context_reader import TEXT_OMITTED_KEY
+
+DEFAULT_SERVER_URL = os.getenv("RETRIEVAL_SERVER_URL", "http://127.0.0.1:8765")
+
+
+def to_documents(items):
+    """Converts server results back into LangChain Documents (score kept in metadata)
+
+    Chunks sent without text (omit_located_text) get an empty page_content and are
+    marked with TEXT_OMITTED_KEY; read them with ContextReader.
+    """
+    documents = []
+    for item in items:
+        metadata = dict(item["metadata"] or {})
+        if item["score"] is not None:
+            metadata["score"] = item["score"] # relevance score, when the search type has one
+        if item["page_content"] is None:
+            metadata[TEXT_OMITTED_KEY] = True
+        documents.append(Document(page_content=item["page_content"] or "", metadata=metadata, id=item["id"]))
+    return documents
+
+
+class RetrievalClient:
+    """Thin client for retrieval_server.py, reusing one keep-alive connection"""
+
+    def __init__(self, base_url=DEFAULT_SERVER_URL, timeout=30):
+        parsed = urlparse(base_url)
+        self.base_url = base_url
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.timeout = timeout
+        self.connection = None
+
+    def _request(self, method, path, payload=None):
+        """Sends a JSON request, reconnecting once if the kept-alive connection was dropped"""
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json"}
+
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self.connection.request(method, path, body=body, headers=headers)
+                response = self.connection.getresponse()
+                data = json.loads(response.read())
+                break
+            except ConnectionRefusedError:
+                raise ConnectionError(
+                    f"Retrieval server is not running at {self.base_url}. Start it with: python retrieval_server.py"
+                )
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                self.connection.close()
+                self.connection = None
+                if attempt == 1:
+                    raise
+
+        if response.status != 200:
+            raise RuntimeError(f"Retrieval server error {response.status}: {data.get('error')}")
+        return data
+
+    def search(self, query, search_type="similarity", **search_kwargs):
+        """Searches the vector database, same search_type/search_kwargs as db.as_retriever()
+
+        search_type="bm25" searches the lexical index only (no embedding call), and
+        search_type="hybrid" fuses BM25 and vector results (k, fetch_k, rrf_k).
+        omit_located_text=True leaves out the text of chunks the server found at their
+        recorded location in the source files (for callers that read them with ContextReader).
+        """
+        data = self._request("POST", "/search", {"query": query, "search_type": search_type, **search_kwargs})
+        return to_documents(data["documents"])
+
+    def search_strategies(self, query, strategies, fetch_k=20):
+        """Runs several search strategies over one candidate fetch on the server
+
+        strategies: list of dicts with search_type and its search_kwargs (k,
+        score_threshold, lambda_mult). Returns one list of Documents per strategy.
+        """
+        data = self._request("POST", "/rerank", {"query": query, "strategies": strategies, "fetch_k": fetch_k})
+        return [to_documents(results) for results in data["results"]]
+
+    def multi_search(self, queries, k=5, rrf_k=60, top_n=None, hybrid=False):
+        """Searches all query variations concurrently on the server
+
+        Returns (fused, per_query): one list ranked by reciprocal-rank fusion and
+        deduplicated by chunk ID (score = RRF score), plus the vector results of each
+        query. With hybrid=True, a BM25 search per query is fused in as well.
+        """
+        payload = {"queries": queries, "k": k, "rrf_k": rrf_k, "hybrid": hybrid}
+        if top_n is not None:
+            payload["top_n"] = top_n
+        data = self._request("POST", "/multi_search", payload)
+        return to_documents(data["documents"]), [to_documents(results) for results in data["per_query"]]
+
+    def stream_answer(self, query, k=5):
+        """Yields answer tokens from the server as they are generated
+
+        The final item is a dict with the generation metrics (time to first token, tokens/sec).
+        """
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            self.connection.request("POST", "/answer", body=json.dumps({"query": query, "k": k}).encode("utf-8"),
+                                    headers={"Content-Type": "application/json"})
+            response = self.connection.getresponse()
+        except ConnectionRefusedError:
+            raise ConnectionError(
+                f"Retrieval server is not running at {self.base_url}. Start it with: python retrieval_server.py"
+            )
+
+        if response.status != 200: # rejected before streaming started (bad request or retrieval error)
+            data = json.loads(response.read())
+            raise RuntimeError(f"Retrieval server error {response.status}: {data.get('error')}")
+
+        try:
+            for line in response: # one JSON event per line, decoded from the chunked body
+                event = json.loads(line)
+                if "error" in event:
+                    raise RuntimeError(f"Answer generation failed: {event['error']}")
+                if event.get("done"):
+                    yield event["metrics"]
+                else:
+                    yield event["token"]
+        finally:
+            if not response.isclosed(): # stopped early, the connection cannot be reused
+                self.connection.close()
+                self.connection = None
+
+    def chunk_metadatas(self, chunk_ids):
+        """Returns {chunk_id: metadata} for the given chunk IDs (no chunk text is sent)"""
+        return self._request("POST", "/chunks", {"ids": list(chunk_ids)})["metadatas"]
+
+    def chunk_texts(self, chunk_ids):
+        """Returns {chunk_id: page_content} for the given chunk IDs (for chunks ContextReader cannot locate)"""
+        return self._request("POST", "/chunks", {"ids": list(chunk_ids), "include_documents": True})["documents"]
+
+    def embed_query(self, query):
+        """Returns the query embedding (served from the server's query embedding cache)"""
+        return self._request("POST", "/embed", {"query": query})["embedding"]
+
+    def metrics(self):
+        """Returns p50/p99 latency per search type from the server"""
+        return self._request("GET", "/metrics")
@@ -0,0 +1,379 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_chroma import Chroma
+from langchain_openai import ChatOpenAI
+from langchain_core.messages import HumanMessage, SystemMessage
+from dotenv import load_dotenv
+from embedding_cache import QueryEmbeddingCache
+from embedding_providers import cache_model_name, create_embeddings, embedding_config
+from candidate_reranking import CandidateSet
+from context_reader import ContextReader
+from lexical_index import LexicalIndex
+from quantized_index import QuantizedIndex
+from collection_paths import collection_paths
+from streaming_generation import GenerationMetrics, astream_generation
+
+load_dotenv()
+
+SEARCH_TYPES = ("similarity", "similarity_score_threshold", "mmr") # same names as db.as_retriever()
+LEXICAL_SEARCH_TYPES = ("bm25", "hybrid") # BM25 only (no embedding call), BM25 + vector fused
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error"}
+
+
+def reciprocal_rank_fusion(result_lists, rrf_k=60):
+    """Fuses ranked [(document, score)] lists into one list, deduplicated by chunk ID
+
+    Each document scores sum(1 / (rrf_k + rank)) over the lists it appears in.
+    """
+    fused = {}
+    for results in result_lists:
+        for rank, (document, _) in enumerate(results, 1):
+            key = document.id or document.page_content
+            entry = fused.setdefault(key, [document, 0.0])
+            entry[1] += 1.0 / (rrf_k + rank)
+    return sorted(((document, score) for document, score in fused.values()), key=lambda item: item[1], reverse=True)
+
+def serialize_results(results, context_reader=None):
+    """Converts [(document, score)] into JSON-friendly dicts
+
+    With a context_reader, page_content is sent as None for chunks whose source
+    file still holds them (location and hash checked); the client reads those itself.
+    """
+    return [
+        {
+            "page_content": None if context_reader is not None and context_reader.locate(document.id, document.metadata) else document.page_content,
+            "metadata": document.metadata,
+            "id": document.id,
+            "score": score,
+        }
+        for document, score in results
+    ]
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+class RetrievalService:
+    """Owns the warm Chroma collection and embedding client for the lifetime of the server"""
+
+    def __init__(self, persist_directory="db/chroma_db", model_name=None, max_workers=8, lexical_index_path=None, quantized_index_dir=None):
+        print(f"Loading Chroma vector database from {persist_directory}...")
+        # Keeps its HTTP connection pool open; repeated queries are served from the LRU cache
+        # (provider from EMBEDDING_PROVIDER, model from its own variable, same as ingestion)
+        provider, model_name = embedding_config(model_name=model_name)
+        self.embedding_model = QueryEmbeddingCache(create_embeddings(provider, model_name), model_name=cache_model_name(provider, model_name))
+        self.db = Chroma(
+            persist_directory=persist_directory,
+            embedding_function=self.embedding_model,
+            collection_metadata={"hnsw:space": "cosine"}
+        )
+        # BM25 index written by 1_ingestion_pipeline.py next to this collection (unless given explicitly)
+        if lexical_index_path is None:
+            _, _, lexical_index_path, _ = collection_paths(persist_directory)
+        self.lexical_index = LexicalIndex.load(lexical_index_path)
+        self.context_reader = ContextReader() # checks chunk locations for /search with omit_located_text
+        # Optional compact int8/binary index (1_ingestion_pipeline.py --quantize) for similarity searches.
+        # Chroma stays open: quantized hits are read from it by ID, and mmr, hybrid and /rerank still use its HNSW index.
+        if quantized_index_dir and QuantizedIndex.header(quantized_index_dir) is None:
+            raise FileNotFoundError(f"No quantized index in {quantized_index_dir} (build one with 1_ingestion_pipeline.py --quantize)")
+        self.quantized_index_dir = quantized_index_dir
+        self.quantized_index = QuantizedIndex.load(quantized_index_dir) if quantized_index_dir else None
+        self.executor = ThreadPoolExecutor(max_workers=max_workers) # Chroma and OpenAI calls are blocking
+        self.model = ChatOpenAI(model="gpt-4o", stream_usage=True) # used by the streaming /answer endpoint
+        self.latencies = defaultdict(lambda: deque(maxlen=10000)) # recent latencies (ms) per search type
+
+    def search(self, query, search_type="similarity", k=4, score_threshold=None, fetch_k=20, lambda_mult=0.5):
+        """Runs one search and returns [(document, score or None)]"""
+        if self.quantized_index is not None and search_type in ("similarity", "similarity_score_threshold"):
+            results = self.quantized_search(query, k)
+            if search_type == "similarity_score_threshold":
+                results = [(document, score) for document, score in results if score >= (score_threshold or 0.0)]
+            return results
+        if search_type == "similarity":
+            return self.db.similarity_search_with_relevance_scores(query, k=k)
+        if search_type == "similarity_score_threshold":
+            return self.db.similarity_search_with_relevance_scores(query, k=k, score_threshold=score_threshold)
+        if search_type == "mmr":
+            documents = self.db.max_marginal_relevance_search(query, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult)
+            return [(document, None) for document in documents]
+        raise ValueError(f"Unknown search_type {search_type!r}, expected one of {SEARCH_TYPES + LEXICAL_SEARCH_TYPES}")
+
+    def quantized_search(self, query, k=4):
+        """Coarse search over the quantized codes, exact re-scoring, documents read from Chroma by ID"""
+        # Pick up the index rebuilt by an ingestion run since the server started (index.json is written last)
+        path = os.path.join(self.quantized_index_dir, "index.json")
+        if os.path.exists(path) and os.path.getmtime(path) != self.quantized_index.mtime:
+            self.quantized_index = QuantizedIndex.load(self.quantized_index_dir)
+        hits = self.quantized_index.search(self.embedding_model.embed_query(query), k=k)
+        documents = {document.id: document for document in self.db.get_by_ids([chunk_id for chunk_id, _ in hits])}
+        return [(documents[chunk_id], score) for chunk_id, score in hits if chunk_id in documents]
+
+    def lexical_search(self, query, k=4):
+        """BM25 search without an embedding call, returns [(document, bm25 score)]"""
+        # Pick up the index rewritten by an ingestion run since the server started
+        path = self.lexical_index.path
+        if os.path.exists(path) and os.path.getmtime(path) != self.lexical_index.mtime:
+            self.lexical_index = LexicalIndex.load(path)
+        hits = self.lexical_index.search(query, k=k)
+        if not hits:
+            return []
+        documents = {document.id: document for document in self.db.get_by_ids([chunk_id for chunk_id, _ in hits])}
+        return [(documents[chunk_id], score) for chunk_id, score in hits if chunk_id in documents]
+
+    async def hybrid_search(self, query, k=4, fetch_k=20, rrf_k=60, **_):
+        """Runs BM25 and vector search concurrently and fuses them with reciprocal-rank fusion"""
+        loop = asyncio.get_running_loop()
+        lexical_results, vector_results = await asyncio.gather(
+            loop.run_in_executor(self.executor, self.lexical_search, query, fetch_k),
+            loop.run_in_executor(self.executor, lambda: self.db.similarity_search_with_relevance_scores(query, k=fetch_k)),
+        )
+        return reciprocal_rank_fusion([lexical_results, vector_results], rrf_k=rrf_k)[:k]
+
+    async def handle_search(self, payload):
+        """Runs a search in the worker pool and records its latency"""
+        search_type = payload.pop("search_type", "similarity")
+        query = payload.pop("query")
+        omit_located_text = payload.pop("omit_located_text", False) # for clients that read chunks from the source files
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        if search_type == "hybrid":
+            results = await self.hybrid_search(query, **payload)
+        elif search_type == "bm25":
+            results = await loop.run_in_executor(self.executor, self.lexical_search, query, payload.get("k", 4))
+        else:
+            results = await loop.run_in_executor(self.executor, lambda: self.search(query, search_type, **payload))
+        self.latencies[search_type].append((time.perf_counter() - start) * 1000)
+        # Checked on the event loop thread, the only user of self.context_reader (a few KB hashed per search)
+        return {"documents": serialize_results(results, self.context_reader if omit_located_text else None)}
+
+    async def handle_rerank(self, payload):
+        """Fetches fetch_k candidates once and serves several search strategies from them
+
+        payload["strategies"] is a list of {"search_type", "k", "score_threshold", "lambda_mult"}.
+        """
+        query = payload["query"]
+        strategies = payload["strategies"]
+        fetch_k = max([payload.get("fetch_k", 20)] + [strategy.get("k", 4) for strategy in strategies])
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+
+        def fetch_and_rerank():
+            embedding = self.embedding_model.embed_query(query)
+            candidates = CandidateSet.from_chroma(self.db, embedding, fetch_k=fetch_k)
+            return [candidates.select(**strategy) for strategy in strategies]
+
+        result_lists = await loop.run_in_executor(self.executor, fetch_and_rerank)
+        self.latencies["rerank"].append((time.perf_counter() - start) * 1000)
+        return {"results": [serialize_results(results) for results in result_lists]}
+
+    async def handle_multi_search(self, payload):
+        """Searches several query variations concurrently and fuses them with reciprocal-rank fusion"""
+        queries = payload["queries"]
+        k = payload.get("k", 4)
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+
+        # One batch embedding call for all variations (cached ones are skipped)
+        embeddings = await loop.run_in_executor(self.executor, self.embedding_model.embed_queries, queries)
+
+        # Run the searches concurrently in the worker pool (plus one BM25 search per query when hybrid)
+        searches = [
+            loop.run_in_executor(self.executor, lambda e=embedding: self.db.similarity_search_by_vector_with_relevance_scores(e, k=k))
+            for embedding in embeddings
+        ]
+        if payload.get("hybrid"):
+            searches += [loop.run_in_executor(self.executor, self.lexical_search, query, k) for query in queries]
+        all_results = await asyncio.gather(*searches)
+        result_lists = all_results[:len(queries)]
+
+        fused = reciprocal_rank_fusion(all_results, rrf_k=payload.get("rrf_k", 60))
+        self.latencies["multi_query"].append((time.perf_counter() - start) * 1000)
+        return {
+            "documents": serialize_results(fused[:payload.get("top_n", len(fused))]),
+            "per_query": [serialize_results(results) for results in result_lists],
+        }
+
+    async def handle_chunks(self, payload):
+        """Returns the metadata (source file locations, no text) of chunks by ID, e.g. for context expansion
+
+        With include_documents, their text is returned too (for chunks the client cannot read from the files).
+        """
+        include_documents = payload.get("include_documents", False)
+        include = ["metadatas", "documents"] if include_documents else ["metadatas"]
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(self.executor, lambda: self.db.get(ids=payload["ids"], include=include))
+        response = {"metadatas": dict(zip(result["ids"], result["metadatas"]))}
+        if include_documents:
+            response["documents"] = dict(zip(result["ids"], result["documents"]))
+        return response
+
+    async def handle_embed(self, payload):
+        """Returns the (cached) query embedding, e.g. for semantic answer caching"""
+        loop = asyncio.get_running_loop()
+        embedding = await loop.run_in_executor(self.executor, self.embedding_model.embed_query, payload["query"])
+        return {"embedding": embedding}
+
+    async def prepare_answer(self, payload):
+        """Validates an /answer request and retrieves its context, before any response is written
+
+        Errors here go through route(), so the client gets a 400/500 JSON response
+        instead of a dropped connection.
+        """
+        query = payload["query"]
+        if not isinstance(query, str) or not query.strip():
+            raise ValueError("query must be a non-empty string")
+        k = payload.get("k", 5)
+        loop = asyncio.get_running_loop()
+        metrics = GenerationMetrics() # time to first token includes retrieval
+        results = await loop.run_in_executor(self.executor, lambda: self.search(query, k=k))
+
+        combined_input = f"""Based on the following documents, answer the Query: {query}
+
+Documents: {chr(10).join([document.page_content for document, _ in results])}
+
+Provide a clear answer using only the information from the documents above. If the information is not available, respond with 'Information not found in the documents.'
+"""
+        messages = [
+            SystemMessage(content="You are a helpful assistant that provides answers based on the provided documents."),
+            HumanMessage(content=combined_input)
+        ]
+        return {"messages": messages, "metrics": metrics}
+
+    async def stream_answer(self, writer, prepared):
+        """Streams the generated answer for a prepared request as chunked NDJSON events
+
+        Events are {"token": ...} while generating, then {"done": true, "metrics": {...}}.
+        """
+        messages, metrics = prepared["messages"], prepared["metrics"]
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n\r\n")
+
+        async def send(event):
+            data = (json.dumps(event) + "\n").encode("utf-8")
+            writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+            await writer.drain() # push every token to the client right away
+
+        try:
+            async for token in astream_generation(self.model, messages, metrics):
+                await send({"token": token})
+        except Exception as e:
+            await send({"error": str(e)})
+        else:
+            if metrics.ttft_ms is not None:
+                self.latencies["answer_ttft"].append(metrics.ttft_ms)
+            await send({"done": True, "metrics": metrics.to_dict()})
+        writer.write(b"0\r\n\r\n") # end of the chunked body
+        await writer.drain()
+
+    def metrics(self):
+        """Returns request counts and p50/p99 latency (ms) per search type"""
+        metrics = {
+            search_type: {
+                "count": len(values),
+                "p50_ms": percentile(values, 0.50),
+                "p99_ms": percentile(values, 0.99),
+            }
+            for search_type, values in self.latencies.items()
+        }
+        metrics["query_embedding_cache"] = self.embedding_model.stats()
+        return metrics
+
+    async def route(self, method, path, body):
+        """Dispatches a request to its handler and returns (status, payload)"""
+        try:
+            if method == "POST" and path == "/search":
+                return 200, await self.handle_search(json.loads(body))
+            if method == "POST" and path == "/rerank":
+                return 200, await self.handle_rerank(json.loads(body))
+            if method == "POST" and path == "/multi_search":
+                return 200, await self.handle_multi_search(json.loads(body))
+            if method == "POST" and path == "/answer":
+                return 200, await self.prepare_answer(json.loads(body)) # streamed by handle_connection
+            if method == "POST" and path == "/chunks":
+                return 200, await self.handle_chunks(json.loads(body))
+            if method == "POST" and path == "/embed":
+                return 200, await self.handle_embed(json.loads(body))
+            if method == "GET" and path == "/metrics":
+                return 200, self.metrics()
+            if method == "GET" and path == "/health":
+                return 200, {"status": "ok"}
+            return 404, {"error": f"No route for {method} {path}"}
+        except (ValueError, KeyError, TypeError) as e:
+            return 400, {"error": str(e)}
+        except Exception as e:
+            return 500, {"error": str(e)}
+
+    async def handle_connection(self, reader, writer):
+        """Serves JSON requests on one keep-alive HTTP/1.1 connection"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, value = line.decode("latin-1").split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                status, payload = await self.route(method, path, body)
+
+                # Streaming responses write their own (chunked) body
+                if method == "POST" and path == "/answer" and status == 200:
+                    await self.stream_answer(writer, payload)
+                    if headers.get("connection", "").lower() == "close":
+                        break
+                    continue
+
+                data = json.dumps(payload).encode("utf-8")
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n\r\n".encode("latin-1") + data
+                )
+                await writer.drain()
+
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError, ValueError):
+            pass # client went away or sent a malformed request
+        finally:
+            writer.close()
+
+
+async def serve(host="127.0.0.1", port=8765, persist_directory="db/chroma_db", quantized_index_dir=None, lexical_index_path=None):
+    """Serves one collection; the BM25 index defaults to the one ingested next to persist_directory"""
+    service = RetrievalService(persist_directory=persist_directory, quantized_index_dir=quantized_index_dir, lexical_index_path=lexical_index_path)
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    print(f"Retrieval server listening on http://{host}:{port} (POST /search, POST /multi_search, POST /chunks, POST /embed, POST /answer, GET /metrics)")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Long-lived retrieval server over the Chroma vector database")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--persist-directory", default="db/chroma_db")
+    parser.add_argument("--quantized-index", default=None, help="serve similarity searches from this quantized index (e.g. db/quantized_index)")
+    args = parser.parse_args()
+    if args.quantized_index and QuantizedIndex.header(args.quantized_index) is None:
+        parser.error(f"no quantized index in {args.quantized_index}: build one with python 1_ingestion_pipeline.py --quantize int8")
+
+    asyncio.run(serve(args.host, args.port, args.persist_directory, args.quantized_index))
@@ -0,0 +1,90 @@
+import re
+
+import numpy as np
+from langchain_core.documents import Document
+
+BREAKPOINT_TYPES = ("percentile", "standard_deviation", "interquartile")
+
+
+def split_sentences(text):
+    """Splits on sentence-ending punctuation followed by whitespace (as SemanticChunker does)"""
+    return [sentence for sentence in re.split(r"(?<=[.?!])\s+", text) if sentence]
+
+def combine_sentences(sentences, buffer_size=1):
+    """Each sentence joined with its `buffer_size` neighbours on both sides, the text that gets embedded"""
+    return [
+        " ".join(sentences[max(0, i - buffer_size):i + buffer_size + 1])
+        for i in range(len(sentences))
+    ]
+
+def adjacent_distances(embeddings):
+    """Cosine distance between each pair of consecutive rows"""
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix = matrix / np.where(norms == 0, 1.0, norms)
+    return 1.0 - np.einsum("ij,ij->i", matrix[:-1], matrix[1:])
+
+def breakpoint_threshold(distances, breakpoint_type="percentile", amount=95):
+    """Distance above which a new chunk starts"""
+    if breakpoint_type == "percentile":
+        return np.percentile(distances, amount)
+    if breakpoint_type == "standard_deviation":
+        return distances.mean() + amount * distances.std()
+    if breakpoint_type == "interquartile":
+        q1, q3 = np.percentile(distances, [25, 75])
+        return distances.mean() + amount * (q3 - q1)
+    raise ValueError(f"Unknown breakpoint type {breakpoint_type!r}, expected one of {BREAKPOINT_TYPES}")
+
+
+class SemanticSplitter:
+    """Semantic chunking with batched sentence embeddings and NumPy breakpoints
+
+    All sentences of all documents passed to split_documents() are embedded in one
+    embed_documents call. Wrap the model in CachedEmbeddings, and re-chunking with
+    another threshold reads every sentence embedding from the cache (as a NumPy
+    matrix, via embed_documents_array). Breakpoints are where the cosine distance
+    between neighbouring sentences exceeds the threshold.
+    """
+
+    def __init__(self, embedding_model, breakpoint_type="percentile", breakpoint_amount=95, buffer_size=1):
+        self.embedding_model = embedding_model
+        self.breakpoint_type = breakpoint_type
+        self.breakpoint_amount = breakpoint_amount
+        self.buffer_size = buffer_size
+
+    def _chunks(self, sentences, embeddings):
+        if len(sentences) < 2:
+            return [" ".join(sentences)] if sentences else []
+        distances = adjacent_distances(embeddings)
+        threshold = breakpoint_threshold(distances, self.breakpoint_type, self.breakpoint_amount)
+        boundaries = np.flatnonzero(distances > threshold) + 1 # index of the first sentence of each new chunk
+        starts = [0] + boundaries.tolist()
+        ends = boundaries.tolist() + [len(sentences)]
+        return [" ".join(sentences[start:end]) for start, end in zip(starts, ends)]
+
+    def split_texts(self, texts):
+        """Splits several texts with one batched embedding call, returns a list of chunk lists"""
+        all_sentences = [split_sentences(text) for text in texts]
+        combined = [sentence for sentences in all_sentences for sentence in combine_sentences(sentences, self.buffer_size)]
+        embeddings = None
+        if combined:
+            if hasattr(self.embedding_model, "embed_documents_array"): # CachedEmbeddings: straight from the cached bytes
+                embeddings = self.embedding_model.embed_documents_array(combined)
+            else:
+                embeddings = np.asarray(self.embedding_model.embed_documents(combined), dtype=np.float32)
+
+        results, offset = [], 0
+        for sentences in all_sentences:
+            results.append(self._chunks(sentences, embeddings[offset:offset + len(sentences)] if sentences else None))
+            offset += len(sentences)
+        return results
+
+    def split_text(self, text):
+        return self.split_texts([text])[0]
+
+    def split_documents(self, documents):
+        """Same output shape as TextSplitter.split_documents (metadata copied to every chunk)"""
+        chunks = []
+        for document, texts in zip(documents, self.split_texts([document.page_content for document in documents])):
+            chunks.extend(Document(page_content=text, metadata=dict(document.metadata)) for text in texts)
+        return chunks
@@ -0,0 +1,226 @@
+import logging
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import NamedTuple, Tuple
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+
+class Span(NamedTuple):
+    """A chunk as offsets into its source text
+
+    `skips` are (start, end) ranges inside [start, end) that are not part of the
+    chunk: CharacterTextSplitter drops the empty pieces between repeated
+    separators ("\\n\\n\\n\\n") and re-joins with a single separator, so such a chunk
+    is the span minus those ranges.
+    """
+    start: int
+    end: int
+    skips: Tuple[Tuple[int, int], ...] = ()
+
+def span_text(text, span):
+    """Materialises the chunk text of a span"""
+    if not span.skips:
+        return text[span.start:span.end]
+    parts, position = [], span.start
+    for skip_start, skip_end in span.skips:
+        parts.append(text[position:skip_start])
+        position = skip_end
+    parts.append(text[position:span.end])
+    return "".join(parts)
+
+def separator_spans(text, start, end, separator, keep_separator=False):
+    """(start, end) of the non-empty pieces of text[start:end] split on a literal separator
+
+    Same pieces as langchain's _split_text_with_regex (keep_separator False, True /
+    "start" or "end"), found with str.find instead of copied out by re.split.
+    """
+    if not separator:
+        return [(i, i + 1) for i in range(start, end)]
+    length = len(separator)
+    occurrences = []
+    position = text.find(separator, start, end)
+    while position != -1:
+        occurrences.append(position)
+        position = text.find(separator, position + length, end)
+
+    if not keep_separator:
+        bounds = [start] + [p + length for p in occurrences]
+        ends = occurrences + [end]
+    elif keep_separator == "end":
+        bounds = [start] + [p + length for p in occurrences]
+        ends = bounds[1:] + [end]
+    else: # True / "start": the separator opens the following piece
+        bounds = [start] + occurrences
+        ends = occurrences + [end]
+    return [(s, e) for s, e in zip(bounds, ends) if s < e]
+
+
+class SpanSplitter(ABC):
+    """Offset-based base for the character splitters below
+
+    Splitting works on (start, end) offsets into the source text, so no substring
+    is copied until a chunk's text is asked for. Only len() is supported as the
+    length function (offsets are characters); separators are literal strings.
+    """
+
+    def __init__(self, chunk_size=4000, chunk_overlap=200, keep_separator=False, strip_whitespace=True):
+        if chunk_size <= 0:
+            raise ValueError(f"chunk_size must be > 0, got {chunk_size}")
+        if chunk_overlap < 0:
+            raise ValueError(f"chunk_overlap must be >= 0, got {chunk_overlap}")
+        if chunk_overlap > chunk_size:
+            raise ValueError(f"Got a larger chunk overlap ({chunk_overlap}) than chunk size ({chunk_size}), should be smaller.")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.keep_separator = keep_separator
+        self.strip_whitespace = strip_whitespace
+
+    def _span(self, text, segments):
+        """Span covering the kept (start, end) segments, stripped like TextSplitter._join_docs; None if empty"""
+        if len(segments) == 1: # the common case: one contiguous slice
+            start, end = segments[0]
+            if self.strip_whitespace:
+                while start < end and text[start].isspace():
+                    start += 1
+                while end > start and text[end - 1].isspace():
+                    end -= 1
+            return Span(start, end) if start < end else None
+        segments = list(segments)
+        if self.strip_whitespace:
+            while segments:
+                start, end = segments[0]
+                while start < end and text[start].isspace():
+                    start += 1
+                if start < end:
+                    segments[0] = (start, end)
+                    break
+                segments.pop(0)
+            while segments:
+                start, end = segments[-1]
+                while end > start and text[end - 1].isspace():
+                    end -= 1
+                if end > start:
+                    segments[-1] = (start, end)
+                    break
+                segments.pop()
+        segments = [(s, e) for s, e in segments if s < e]
+        if not segments:
+            return None
+        skips = tuple((segments[i][1], segments[i + 1][0]) for i in range(len(segments) - 1))
+        return Span(segments[0][0], segments[-1][1], skips)
+
+    def _window_span(self, text, splits, lo, hi, separator_length, breaks):
+        """Span of splits[lo:hi] joined with the merge separator"""
+        start, end = splits[lo][0], splits[hi - 1][1]
+        segments, segment_start = [], start
+        # Cut out the dropped empty pieces before each break inside the window
+        for i in breaks[bisect_left(breaks, lo + 1):bisect_left(breaks, hi)]:
+            segments.append((segment_start, splits[i - 1][1] + separator_length))
+            segment_start = splits[i][0]
+        segments.append((segment_start, end))
+        return self._span(text, segments)
+
+    def _merge_spans(self, text, splits, separator_length, spans):
+        """TextSplitter._merge_splits on offsets: the window is splits[lo:i], nothing is joined"""
+        # Consecutive splits are one separator apart unless empty pieces were dropped between them
+        breaks = [i for i in range(1, len(splits)) if splits[i][0] - splits[i - 1][1] != separator_length]
+        lo, total = 0, 0
+        for i, (start, end) in enumerate(splits):
+            length = end - start
+            if total + length + (separator_length if i > lo else 0) > self.chunk_size and i > lo:
+                if total > self.chunk_size:
+                    logger.warning("Created a chunk of size %d, which is longer than the specified %d", total, self.chunk_size)
+                span = self._window_span(text, splits, lo, i, separator_length, breaks)
+                if span is not None:
+                    spans.append(span)
+                # Drop splits from the front until the rest fits in the overlap (and the next split fits)
+                while total > self.chunk_overlap or (
+                    total + length + (separator_length if i > lo else 0) > self.chunk_size and total > 0
+                ):
+                    total -= (splits[lo][1] - splits[lo][0]) + (separator_length if i - lo > 1 else 0)
+                    lo += 1
+            total += length + (separator_length if i > lo else 0)
+        if lo < len(splits):
+            span = self._window_span(text, splits, lo, len(splits), separator_length, breaks)
+            if span is not None:
+                spans.append(span)
+
+    @abstractmethod
+    def split_spans(self, text):
+        """The chunks of text as Spans, in order"""
+
+    def split_text(self, text):
+        return [span_text(text, span) for span in self.split_spans(text)]
+
+    def split_document_spans(self, documents):
+        """[(document, span)] for every chunk, without materialising any chunk text"""
+        return [(document, span) for document in documents for span in self.split_spans(document.page_content)]
+
+    def split_documents(self, documents):
+        """Same output as TextSplitter.split_documents (metadata copied to every chunk)"""
+        return [
+            Document(page_content=span_text(document.page_content, span), metadata=dict(document.metadata))
+            for document, span in self.split_document_spans(documents)
+        ]
+
+
+class SpanCharacterSplitter(SpanSplitter):
+    """Offset-based CharacterTextSplitter (same chunks, literal separator)"""
+
+    def __init__(self, separator="\n\n", **kwargs):
+        super().__init__(**kwargs)
+        self.separator = separator
+
+    def split_spans(self, text):
+        splits = separator_spans(text, 0, len(text), self.separator, self.keep_separator)
+        separator_length = 0 if self.keep_separator else len(self.separator)
+        spans = []
+        self._merge_spans(text, splits, separator_length, spans)
+        return spans
+
+
+class SpanRecursiveSplitter(SpanSplitter):
+    """Offset-based RecursiveCharacterTextSplitter (same chunks, literal separators)
+
+    Pieces that are still too long are split again with the next separator, on
+    the same offsets, so each recursion level scans only its own piece.
+    """
+
+    def __init__(self, separators=None, keep_separator=True, **kwargs):
+        super().__init__(keep_separator=keep_separator, **kwargs)
+        self.separators = separators or ["\n\n", "\n", " ", ""]
+
+    def _split(self, text, start, end, separators, spans):
+        # First separator present in the piece ("" always matches)
+        separator, remaining = separators[-1], []
+        for i, candidate in enumerate(separators):
+            if not candidate:
+                separator = candidate
+                break
+            if text.find(candidate, start, end) != -1:
+                separator, remaining = candidate, separators[i + 1:]
+                break
+
+        separator_length = 0 if self.keep_separator else len(separator)
+        good = []
+        for split in separator_spans(text, start, end, separator, self.keep_separator):
+            if split[1] - split[0] < self.chunk_size:
+                good.append(split)
+                continue
+            if good:
+                self._merge_spans(text, good, separator_length, spans)
+                good = []
+            if remaining:
+                self._split(text, split[0], split[1], remaining, spans)
+            else:
+                spans.append(Span(split[0], split[1])) # kept as is, like the langchain splitter
+        if good:
+            self._merge_spans(text, good, separator_length, spans)
+
+    def split_spans(self, text):
+        spans = []
+        self._split(text, 0, len(text), self.separators, spans)
+        return spans
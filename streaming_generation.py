@@ -0,0 +1,95 @@
+import time
+
+
+def chunk_text(chunk):
+    """Extracts the text of a streamed message chunk (content can be a list of parts)"""
+    content = chunk.content
+    if isinstance(content, list):
+        return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return content or ""
+
+
+class GenerationMetrics:
+    """Time-to-first-token and tokens/sec of one streamed generation"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_token_at = None
+        self.end = None
+        self.chunks = 0 # streamed chunks, roughly one token each
+        self.output_tokens = None # exact count, when the model reports usage
+
+    def record(self, chunk, text):
+        if text:
+            if self.first_token_at is None:
+                self.first_token_at = time.perf_counter() # first chunk that carries text
+            self.chunks += 1
+        usage = getattr(chunk, "usage_metadata", None)
+        if usage:
+            self.output_tokens = usage.get("output_tokens", self.output_tokens)
+
+    def finish(self):
+        self.end = time.perf_counter()
+
+    @property
+    def tokens(self):
+        return self.output_tokens if self.output_tokens is not None else self.chunks
+
+    @property
+    def ttft_ms(self):
+        return (self.first_token_at - self.start) * 1000 if self.first_token_at else None
+
+    @property
+    def tokens_per_sec(self):
+        if self.first_token_at is None or self.end is None or self.end <= self.first_token_at:
+            return 0.0
+        return self.tokens / (self.end - self.first_token_at)
+
+    def to_dict(self):
+        return {
+            "ttft_ms": self.ttft_ms,
+            "tokens": self.tokens,
+            "total_ms": ((self.end or time.perf_counter()) - self.start) * 1000,
+            "tokens_per_sec": self.tokens_per_sec,
+        }
+
+    def print(self):
+        stats = self.to_dict()
+        ttft = f"{stats['ttft_ms']:.0f} ms" if stats["ttft_ms"] is not None else "n/a"
+        print(f"Time to first token: {ttft}, {stats['tokens']} tokens in {stats['total_ms']:.0f} ms "
+              f"({stats['tokens_per_sec']:.1f} tokens/sec)")
+
+
+def stream_generation(model, messages, metrics=None):
+    """Yields text tokens from model.stream() as they arrive, recording metrics"""
+    metrics = metrics if metrics is not None else GenerationMetrics()
+    try:
+        for chunk in model.stream(messages):
+            text = chunk_text(chunk)
+            metrics.record(chunk, text)
+            if text:
+                yield text
+    finally:
+        metrics.finish()
+
+async def astream_generation(model, messages, metrics=None):
+    """Async version of stream_generation (model.astream), for the server API"""
+    metrics = metrics if metrics is not None else GenerationMetrics()
+    try:
+        async for chunk in model.astream(messages):
+            text = chunk_text(chunk)
+            metrics.record(chunk, text)
+            if text:
+                yield text
+    finally:
+        metrics.finish()
+
+def print_stream(model, messages):
+    """Prints tokens as they arrive and returns (full answer, metrics)"""
+    metrics = GenerationMetrics()
+    parts = []
+    for token in stream_generation(model, messages, metrics):
+        print(token, end="", flush=True)
+        parts.append(token)
+    print()
+    return "".join(parts), metrics
@@ -0,0 +1,126 @@
+"""AgenticSplitter with a stub model: windows, boundary reconciliation, size limit and cache"""
+import re
+
+import pytest
+
+pytest.importorskip("pydantic")
+from agentic_chunking import AgenticSplitter, ChunkStarts, check_cut_from, make_windows, owned_ranges
+
+
+class StubModel:
+    """Starts a chunk at every line that looks like a heading (no final period)"""
+
+    model_name = "stub"
+
+    def __init__(self, failing_windows=(), failures=0):
+        self.calls = 0
+        self.failing_windows = failing_windows # windows (by first line) whose calls always fail
+        self.failures = failures # the first `failures` calls fail
+
+    def with_structured_output(self, schema):
+        return self
+
+    def invoke(self, prompt):
+        self.calls += 1
+        if self.calls <= self.failures or any(f"[1] {line}" in prompt for line in self.failing_windows):
+            raise ValueError("model output could not be parsed")
+        numbers = [int(number) for number, line in re.findall(r"^\[(\d+)\] (.*)$", prompt, re.MULTILINE)
+                   if line.strip() and not line.rstrip().endswith(".")]
+        return ChunkStarts(line_numbers=numbers)
+
+
+def sample_text(sections=40):
+    parts = []
+    for i in range(sections):
+        parts.append(f"Section {i}\n" + "".join(f"Sentence {j} of section {i}.\n" for j in range(i % 5 + 1)) + "\n")
+    return "".join(parts)
+
+
+def assert_cut_from(text, chunks):
+    """Chunks appear in the source in order, with only whitespace between and around them"""
+    position = 0
+    for chunk in chunks:
+        found = text.find(chunk, position)
+        assert found != -1
+        assert not text[position:found].strip()
+        position = found + len(chunk)
+    assert not text[position:].strip()
+
+
+def test_windows_cover_every_line_once():
+    windows = make_windows(100, window_lines=30, overlap_lines=10)
+    owned = owned_ranges(windows)
+    assert owned[0][0] == 0 and owned[-1][1] == 100
+    assert all(a[1] == b[0] for a, b in zip(owned, owned[1:]))
+
+
+def test_chunks_are_cut_from_the_source(tmp_path):
+    text = sample_text()
+    model = StubModel()
+    splitter = AgenticSplitter(model, window_lines=25, overlap_lines=5, max_concurrency=4, cache_path=str(tmp_path / "cache.sqlite3"))
+
+    chunks = splitter.split_text(text)
+
+    assert_cut_from(text, chunks)
+    assert [chunk.splitlines()[0] for chunk in chunks] == [f"Section {i}" for i in range(40)] # one chunk per section
+    assert model.calls == len(make_windows(len(text.splitlines()), 25, 5))
+
+
+def test_long_chunks_are_split_at_line_boundaries(tmp_path):
+    text = "Heading\n" + "A sentence that keeps going.\n" * 100
+    splitter = AgenticSplitter(StubModel(), max_chunk_chars=300, cache_path=str(tmp_path / "cache.sqlite3"))
+
+    chunks = splitter.split_text(text)
+
+    assert_cut_from(text, chunks)
+    assert len(chunks) > 1 and max(len(chunk) for chunk in chunks) <= 300
+
+
+def test_unchanged_windows_are_served_from_the_cache(tmp_path):
+    text = sample_text()
+    cache_path = str(tmp_path / "cache.sqlite3")
+    first = AgenticSplitter(StubModel(), window_lines=25, overlap_lines=5, cache_path=cache_path)
+    chunks = first.split_text(text)
+
+    model = StubModel()
+    second = AgenticSplitter(model, window_lines=25, overlap_lines=5, cache_path=cache_path)
+    assert second.split_text(text) == chunks
+    assert model.calls == 0 and second.cache_hits == first.llm_calls
+
+
+def test_failed_calls_are_retried(tmp_path):
+    text = sample_text(10)
+    model = StubModel(failures=2)
+    splitter = AgenticSplitter(model, max_retries=2, retry_delay=0, cache_path=str(tmp_path / "cache.sqlite3"))
+
+    chunks = splitter.split_text(text)
+
+    assert [chunk.splitlines()[0] for chunk in chunks] == [f"Section {i}" for i in range(10)]
+    assert model.calls == 3 and splitter.failed_windows == 0
+
+
+def test_a_failing_window_is_split_by_size_only(tmp_path):
+    text = sample_text()
+    model = StubModel(failing_windows=["Section 0\n"])
+    splitter = AgenticSplitter(model, window_lines=25, overlap_lines=5, max_chunk_chars=200, max_retries=1,
+                               retry_delay=0, cache_path=str(tmp_path / "cache.sqlite3"))
+
+    chunks = splitter.split_text(text)
+
+    # The rest of the document keeps its model boundaries, the first window is cut at max_chunk_chars
+    assert_cut_from(text, chunks)
+    assert splitter.failed_windows == 1
+    assert max(len(chunk) for chunk in chunks) <= 200
+    assert chunks[-1].startswith("Section 39")
+    assert "Section 1\n" in chunks[0] # no model boundary at Section 1
+
+
+def test_chunks_out_of_order_are_rejected():
+    text = "first line\nsecond line\nthird line\n"
+    check_cut_from(text, ["first line", "second line\nthird line"])
+    with pytest.raises(ValueError):
+        check_cut_from(text, ["second line", "first line"])
+    with pytest.raises(ValueError):
+        check_cut_from(text, ["first line", "third line"]) # text dropped between chunks
+    with pytest.raises(ValueError):
+        check_cut_from(text, ["first line", "second line"]) # end not covered
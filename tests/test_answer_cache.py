@@ -0,0 +1,84 @@
+"""SemanticAnswerCache: similarity threshold, chunk fingerprints, invalidation and thread safety"""
+import hashlib
+import threading
+
+import pytest
+
+from langchain_core.documents import Document
+from answer_cache import SemanticAnswerCache, chunk_key
+
+
+def chunks(*ids, text="chunk text"):
+    return [Document(page_content=f"{text} {chunk_id}", id=chunk_id) for chunk_id in ids]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SemanticAnswerCache(cache_path=str(tmp_path / "answers.sqlite3"), threshold=0.95)
+
+
+def test_similar_query_over_the_same_chunks_is_a_hit(cache):
+    cache.store("q", [1.0, 0.0, 0.0], chunks("a:0", "b:1"), "answer")
+    assert cache.lookup([0.99, 0.05, 0.0], chunks("b:1", "a:0")) == "answer" # chunk order does not matter
+    assert cache.stats()["hits"] == 1
+
+
+def test_dissimilar_query_is_a_miss(cache):
+    cache.store("q", [1.0, 0.0, 0.0], chunks("a:0"), "answer")
+    assert cache.lookup([0.7, 0.7, 0.0], chunks("a:0")) is None # cosine 0.71 < 0.95
+    assert cache.stats() == {"hits": 0, "misses": 1, "hit_rate": 0.0}
+
+
+def test_best_match_above_the_threshold_wins(cache):
+    cache.store("q1", [1.0, 0.2, 0.0], chunks("a:0"), "first")
+    cache.store("q2", [1.0, 0.0, 0.0], chunks("a:0"), "second")
+    assert cache.lookup([1.0, 0.01, 0.0], chunks("a:0")) == "second"
+
+
+def test_different_chunks_or_changed_content_do_not_match(cache):
+    cache.store("q", [1.0, 0.0], chunks("a:0", "b:1"), "answer")
+    assert cache.lookup([1.0, 0.0], chunks("a:0")) is None # other chunk set
+    assert cache.lookup([1.0, 0.0], chunks("a:0", "b:1", text="edited")) is None # same IDs, new content
+
+
+def test_chunks_without_text_use_their_content_hash():
+    with_text = Document(page_content="some text", id="a:0")
+    located = Document(page_content="", id="a:0", metadata={"content_hash": hashlib.sha256(b"some text").hexdigest()})
+    assert chunk_key(located) == chunk_key(with_text)
+
+
+def test_invalidate_chunks_drops_answers_built_from_them(cache):
+    cache.store("q1", [1.0, 0.0], chunks("a:0", "b:0"), "first")
+    cache.store("q2", [1.0, 0.0], chunks("c:0"), "second")
+    assert cache.invalidate_chunks(["b:0", "missing:0"]) == 1
+    assert cache.lookup([1.0, 0.0], chunks("a:0", "b:0")) is None
+    assert cache.lookup([1.0, 0.0], chunks("c:0")) == "second"
+
+
+def test_oldest_entries_are_evicted(tmp_path):
+    cache = SemanticAnswerCache(cache_path=str(tmp_path / "answers.sqlite3"), max_entries=2)
+    for i in range(3):
+        cache.store(f"q{i}", [1.0, 0.0], chunks(f"c:{i}"), f"answer {i}")
+    assert cache.lookup([1.0, 0.0], chunks("c:0")) is None
+    assert cache.lookup([1.0, 0.0], chunks("c:2")) == "answer 2"
+
+
+def test_concurrent_use_from_threads(cache):
+    errors = []
+
+    def worker(n):
+        try:
+            for i in range(20):
+                cache.store(f"q{n}-{i}", [1.0, float(n)], chunks(f"t{n}:{i}"), "answer")
+                cache.lookup([1.0, float(n)], chunks(f"t{n}:{i}"))
+                cache.invalidate_chunks([f"t{n}:{i - 1}"])
+        except Exception as e: # sqlite3.ProgrammingError / InterfaceError without the lock
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert cache.stats()["hits"] == 8 * 20
@@ -0,0 +1,113 @@
+"""summarize_contents with a stub vision model: output order, concurrency limit and retries"""
+import re
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("langchain_openai")
+from langchain_core.messages import AIMessage
+
+from chunk_summarization import summarize_contents
+
+
+class RateLimitError(Exception):
+    """Looks like a 429 to is_retryable, with a short Retry-After"""
+
+    status_code = 429
+
+    class response:
+        headers = {"retry-after": "0.01"}
+
+
+class StubVisionModel:
+    """Summarizes a prompt as 'summary of <text>', tracking how many calls run at once"""
+
+    def __init__(self, delay=0.02, failures=0):
+        self.delay = delay
+        self.failures = failures # the first `failures` calls are rate limited
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def invoke(self, messages):
+        with self.lock:
+            self.calls += 1
+            call = self.calls
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay)
+            if call <= self.failures:
+                raise RateLimitError("rate limited")
+            prompt = messages[0].content[0]["text"]
+            text = re.search(r"TEXT CONTENT:\s*(.*?)\n", prompt).group(1)
+            return AIMessage(content=f"summary of {text}")
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def contents(count=20):
+    """Every third chunk is plain text, the others carry a table"""
+    return [{"text": f"chunk {i}", "tables": [] if i % 3 == 0 else [f"<table>{i}</table>"], "images": []}
+            for i in range(count)]
+
+
+def test_summaries_keep_the_chunk_order():
+    model = StubVisionModel(delay=0.001)
+    results = summarize_contents(contents(), llm=model, max_concurrency=4)
+
+    assert results == [f"chunk {i}" if i % 3 == 0 else f"summary of chunk {i}" for i in range(20)]
+    assert model.calls == 13 # plain text chunks keep their text without a call
+
+
+def test_concurrency_is_limited():
+    model = StubVisionModel()
+    summarize_contents(contents(), llm=model, max_concurrency=3)
+
+    assert model.max_active == 3
+
+
+def test_rate_limited_summaries_are_retried():
+    model = StubVisionModel(delay=0.001, failures=2)
+    results = summarize_contents(contents(3), llm=model, max_concurrency=1)
+
+    assert results == ["chunk 0", "summary of chunk 1", "summary of chunk 2"]
+    assert model.calls == 4 # two rate-limited calls, then one per mixed chunk
+
+
+def test_failed_summary_falls_back_to_the_raw_text():
+    class FailingModel:
+        def invoke(self, messages):
+            raise ValueError("bad request")
+
+    results = summarize_contents(contents(2), llm=FailingModel())
+
+    assert results == ["chunk 0", "chunk 1... [Contains 1 table(s)]"]
+
+
+def test_repeated_images_are_deduplicated_per_prompt():
+    pytest.importorskip("PIL")
+    import base64
+    import io
+
+    from PIL import Image
+
+    from image_preprocessing import ImagePreprocessor
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), "red").save(buffer, format="PNG")
+    logo = base64.b64encode(buffer.getvalue()).decode("ascii")
+    chunks = [{"text": f"chunk {i}", "tables": [], "images": [logo, logo]} for i in range(3)]
+    chunks[2]["images"] = ["not an image", logo]
+    preprocessor = ImagePreprocessor()
+
+    results = summarize_contents(chunks, llm=StubVisionModel(delay=0.001), image_preprocessor=preprocessor)
+
+    # Every chunk with images is summarized, even though it repeats the previous chunk's image
+    assert results == [f"summary of chunk {i}" for i in range(3)]
+    assert preprocessor.stats["images_out"] == 3 # the logo once per prompt
+    assert preprocessor.stats["duplicates"] == 2
+    assert preprocessor.stats["failed"] == 1 # logged and skipped, the rest of the prompt is kept
@@ -0,0 +1,85 @@
+"""ContextReader reads chunks back from their source files exactly as their page_content"""
+import pytest
+from langchain_core.documents import Document
+
+from context_reader import SKIPS_KEY, ContextReader, split_documents_with_locations
+from retrieval_client import to_documents
+from span_splitter import SpanCharacterSplitter
+
+TEXT = "Première partie.\n\nDeux\n\n\n\nTrois, après des séparateurs répétés.\n\nQuatre " + "mot " * 20 + "\n\n\n\nFin."
+
+
+def located_chunks(tmp_path, text=TEXT, chunk_size=60, chunk_overlap=20):
+    path = tmp_path / "doc.txt"
+    path.write_bytes(text.encode("utf-8"))
+    source = str(path)
+    chunks = split_documents_with_locations(SpanCharacterSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap),
+                                            [Document(page_content=text, metadata={"source": source})])
+    for index, chunk in enumerate(chunks):
+        chunk.id = f"{source}:{index}"
+    return chunks
+
+
+def test_each_chunk_reads_back_as_its_page_content(tmp_path):
+    chunks = located_chunks(tmp_path)
+    assert any(SKIPS_KEY in chunk.metadata for chunk in chunks) # repeated separators were cut out
+    reader = ContextReader()
+    for chunk in chunks:
+        (window,) = reader.windows([chunk])
+        assert window.text is None # read from the file, not the stored text
+        assert reader.read(window) == chunk.page_content
+
+
+def test_adjacent_chunks_are_merged_into_one_window(tmp_path):
+    chunks = located_chunks(tmp_path)
+    reader = ContextReader()
+    windows = reader.windows(chunks)
+    assert len(windows) == 1
+    text = reader.read(windows[0])
+    assert all(chunk.page_content in text for chunk in chunks)
+
+
+def test_changed_file_falls_back_to_the_stored_text(tmp_path):
+    chunks = located_chunks(tmp_path)
+    (tmp_path / "doc.txt").write_bytes(TEXT.replace("Deux", "Zwei").encode("utf-8"))
+    reader = ContextReader()
+    contexts = [reader.build_context([chunk]) for chunk in chunks]
+    assert contexts == [chunk.page_content for chunk in chunks]
+    changed = [chunk for chunk in chunks if "Deux" in chunk.page_content]
+    assert changed and all(reader.locate(chunk.id, chunk.metadata) is None for chunk in changed)
+
+
+def omitted(chunks):
+    """The chunks as the client gets them from /search with omit_located_text (no text)"""
+    return to_documents([{"page_content": None, "metadata": chunk.metadata, "id": chunk.id, "score": None} for chunk in chunks])
+
+
+def test_omitted_text_is_fetched_when_the_chunk_cannot_be_located(tmp_path):
+    chunks = located_chunks(tmp_path)
+    (tmp_path / "doc.txt").unlink() # e.g. the client runs on another host
+    fetched = []
+
+    def fetch_texts(ids):
+        fetched.extend(ids)
+        return {chunk.id: chunk.page_content for chunk in chunks if chunk.id in ids}
+
+    reader = ContextReader(fetch_texts=fetch_texts)
+    documents = omitted(chunks)
+    assert all(document.page_content == "" for document in documents)
+    assert reader.build_context(documents, separator="|") == "|".join(chunk.page_content for chunk in chunks)
+    assert fetched == [chunk.id for chunk in chunks] # one call for all of them
+
+
+def test_omitted_text_that_cannot_be_located_or_fetched_raises(tmp_path):
+    chunks = located_chunks(tmp_path)
+    (tmp_path / "doc.txt").write_bytes(TEXT.replace("Deux", "Zwei").encode("utf-8"))
+    documents = omitted(chunks)
+
+    with pytest.raises(ValueError, match="fetch_texts"):
+        ContextReader().build_context(documents)
+    with pytest.raises(ValueError, match="no longer in the collection"):
+        ContextReader(fetch_texts=lambda ids: {}).build_context(documents)
+    # Chunks the reader can still locate are read from the file without a fetch
+    reader = ContextReader()
+    unchanged = [chunk for chunk in chunks if reader.locate(chunk.id, chunk.metadata)]
+    assert unchanged and reader.build_context(omitted(unchanged)) == reader.build_context(unchanged)
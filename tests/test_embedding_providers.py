@@ -0,0 +1,48 @@
+"""Provider and model resolution from the environment"""
+import pytest
+
+from embedding_providers import DEFAULT_MODELS, HashEmbeddings, create_embeddings, embedding_config
+
+
+@pytest.fixture(autouse=True)
+def clean_environment(monkeypatch):
+    for name in ("EMBEDDING_PROVIDER", "EMBEDDING_MODEL", "LOCAL_EMBEDDING_MODEL", "FAKE_EMBEDDING_MODEL"):
+        monkeypatch.delenv(name, raising=False)
+
+
+def test_openai_model_variable_is_ignored_by_other_providers(monkeypatch):
+    monkeypatch.setenv("EMBEDDING_MODEL", "text-embedding-3-small")
+    assert embedding_config() == ("openai", "text-embedding-3-small")
+    assert embedding_config("fake") == ("fake", DEFAULT_MODELS["fake"])
+    assert embedding_config("local") == ("local", DEFAULT_MODELS["local"])
+
+
+def test_each_provider_reads_its_own_model_variable(monkeypatch):
+    monkeypatch.setenv("EMBEDDING_PROVIDER", "local")
+    monkeypatch.setenv("LOCAL_EMBEDDING_MODEL", "BAAI/bge-small-en-v1.5")
+    monkeypatch.setenv("FAKE_EMBEDDING_MODEL", "hash-64")
+    assert embedding_config() == ("local", "BAAI/bge-small-en-v1.5")
+    assert embedding_config("fake") == ("fake", "hash-64")
+    assert len(create_embeddings("fake").embed_query("some text")) == 64
+
+
+@pytest.mark.parametrize("model_name", ["small", "hash-", "hash-0", "hash-12x", "text-embedding-3-small"])
+def test_invalid_fake_model_names_are_rejected(monkeypatch, model_name):
+    monkeypatch.setenv("FAKE_EMBEDDING_MODEL", model_name)
+    with pytest.raises(ValueError, match="hash-<dimensions>"):
+        embedding_config("fake")
+
+
+def test_hash_embeddings_are_deterministic():
+    first, second = HashEmbeddings(dimensions=32), HashEmbeddings(dimensions=32)
+    assert first.embed_documents(["a b", "c"]) == second.embed_documents(["a b", "c"])
+
+
+def test_local_provider_without_sentence_transformers_says_how_to_install(monkeypatch):
+    import sys
+
+    import embedding_providers
+
+    monkeypatch.setitem(sys.modules, "sentence_transformers", None) # makes the import fail
+    with pytest.raises(ImportError, match="pip install sentence-transformers"):
+        embedding_providers.load_local_model("missing-model-for-test")
@@ -0,0 +1,101 @@
+"""EmbeddingScheduler against the local fake OpenAI embedding server (rate limits and retries)"""
+import random
+import time
+
+import pytest
+
+pytest.importorskip("langchain_openai")
+import openai
+from langchain_openai import OpenAIEmbeddings
+
+import embedding_scheduler
+from embedding_scheduler import EmbeddingScheduler
+from fake_embedding_server import fake_embedding, start_fake_embedding_server
+
+
+class WhitespaceEncoding:
+    """Token counts by whitespace, so the tests need no tiktoken download"""
+
+    def encode_batch(self, texts):
+        return [text.split() for text in texts]
+
+
+@pytest.fixture(autouse=True)
+def offline_encoding(monkeypatch):
+    monkeypatch.setattr(embedding_scheduler.tiktoken, "encoding_for_model", lambda model_name: WhitespaceEncoding())
+
+
+def start_server(**kwargs):
+    server, base_url = start_fake_embedding_server(latency=0.001, retry_after=0.05, **kwargs)
+    # Raw strings are sent (no client-side tokenization) and the client never retries on its own
+    model = OpenAIEmbeddings(model="text-embedding-3-small", base_url=base_url, api_key="fake",
+                             max_retries=0, check_embedding_ctx_length=False)
+    return server, model
+
+
+def test_rate_limited_batches_are_retried_in_order():
+    random.seed(0)
+    server, model = start_server(rate_limit_probability=0.3)
+    try:
+        scheduler = EmbeddingScheduler(model, max_in_flight=4, max_batch_tokens=60, min_batch_tokens=10, base_delay=0.01)
+        texts = [f"chunk {i} " + "word " * (i % 7) for i in range(200)]
+
+        vectors = scheduler.embed_documents(texts)
+
+        assert vectors == [pytest.approx(fake_embedding(text, 1536)) for text in texts]
+        assert server.stats["rate_limited"] > 0
+        assert scheduler.rate_limited == server.stats["rate_limited"] # every 429 was seen and retried
+        assert scheduler.requests == server.stats["requests"]
+        assert server.stats["inputs"] == len(texts) # each text was embedded exactly once
+    finally:
+        server.shutdown()
+
+
+def test_rate_limit_shrinks_the_batch_budget():
+    server, model = start_server(rate_limit_probability=1.0)
+    try:
+        scheduler = EmbeddingScheduler(model, max_in_flight=1, max_batch_tokens=800, min_batch_tokens=100, max_retries=2, base_delay=0.01)
+        with pytest.raises(openai.RateLimitError):
+            scheduler.embed_documents(["some text"])
+        assert scheduler.batch_tokens == 200 # halved by each retried 429: 800 -> 400 -> 200
+    finally:
+        server.shutdown()
+
+
+def test_gives_up_after_max_retries_and_honours_retry_after():
+    server, model = start_server(rate_limit_probability=1.0)
+    try:
+        scheduler = EmbeddingScheduler(model, max_in_flight=1, max_retries=2, base_delay=0.001)
+        start = time.monotonic()
+        with pytest.raises(openai.RateLimitError):
+            scheduler.embed_query("some text")
+        assert server.stats["requests"] == 3 # first attempt + 2 retries
+        assert time.monotonic() - start >= 2 * 0.05 # waited Retry-After between attempts
+    finally:
+        server.shutdown()
+
+
+def test_non_retryable_errors_are_raised_immediately():
+    calls = []
+
+    class FailingModel:
+        def embed_documents(self, texts):
+            calls.append(texts)
+            raise ValueError("bad input")
+
+    scheduler = EmbeddingScheduler(FailingModel(), max_in_flight=1)
+    with pytest.raises(ValueError):
+        scheduler.embed_documents(["a", "b"])
+    assert len(calls) == 1
+
+
+def test_unknown_model_falls_back_to_cl100k_base(monkeypatch):
+    def unknown_model(model_name):
+        raise KeyError(model_name)
+
+    requested = []
+    monkeypatch.setattr(embedding_scheduler.tiktoken, "encoding_for_model", unknown_model)
+    monkeypatch.setattr(embedding_scheduler.tiktoken, "get_encoding", lambda name: requested.append(name) or WhitespaceEncoding())
+
+    EmbeddingScheduler(object(), model_name="my-self-hosted-embedder")
+    assert requested == ["cl100k_base"]
@@ -0,0 +1,96 @@
+"""Full, incremental and streaming ingest with the offline fake embedding provider"""
+import importlib
+import os
+
+import pytest
+
+pytest.importorskip("langchain_chroma")
+from collection_paths import collection_paths
+from lexical_index import LexicalIndex
+
+ingestion = importlib.import_module("1_ingestion_pipeline")
+
+PARAGRAPH = "The {name} report covers revenue, production and outlook for the year {year}. " * 4
+
+
+def write_doc(path, name, paragraphs):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n\n".join(PARAGRAPH.format(name=name, year=2000 + i) for i in range(paragraphs)))
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    for name, paragraphs in (("alpha", 12), ("beta", 8), ("gamma", 5)):
+        write_doc(docs / f"{name}.txt", name, paragraphs)
+    persist_directory = str(tmp_path / "chroma")
+    manifest_path, _, lexical_index_path, answer_cache_path = collection_paths(persist_directory)
+    return {
+        "docs": str(docs),
+        "persist_directory": persist_directory,
+        "lexical_index_path": lexical_index_path,
+        "manifest_path": manifest_path,
+        "embedding_model": ingestion.create_embedding_model(provider="fake", model_name="hash-64", cache_path=str(tmp_path / "cache.sqlite3")),
+        "answer_cache_path": answer_cache_path,
+    }
+
+
+def ingest(mode, workspace):
+    paths = {key: workspace[key] for key in ("persist_directory", "lexical_index_path", "manifest_path", "embedding_model")}
+    if mode == "full":
+        chunks = ingestion.split_documents(ingestion.load_documents(workspace["docs"]))
+        return ingestion.create_vector_store(chunks, **paths)
+    if mode == "incremental":
+        return ingestion.incremental_ingest(docs_path=workspace["docs"], answer_cache_path=workspace["answer_cache_path"], **paths)
+    workers = 2 if mode == "stream-parallel" else None
+    return ingestion.stream_ingest(docs_path=workspace["docs"], batch_size=4, workers=workers, **paths)
+
+
+def expected_ids(docs):
+    return {chunk_id for chunk_id, _ in ingestion.iter_chunks(ingestion.iter_documents(docs))}
+
+
+@pytest.mark.parametrize("mode", ["full", "incremental", "stream", "stream-parallel"])
+def test_reingest_after_edit_and_delete(mode, workspace):
+    vector_store = ingest(mode, workspace)
+    first_ids = expected_ids(workspace["docs"])
+    assert set(vector_store.get(include=[])["ids"]) == first_ids
+    assert set(LexicalIndex.load(workspace["lexical_index_path"]).doc_numbers) == first_ids
+
+    # alpha shrinks (its trailing chunk IDs must go), gamma is removed
+    write_doc(os.path.join(workspace["docs"], "alpha.txt"), "alpha", 3)
+    os.remove(os.path.join(workspace["docs"], "gamma.txt"))
+    vector_store = ingest(mode, workspace)
+
+    ids = expected_ids(workspace["docs"])
+    assert len(ids) < len(first_ids)
+    assert set(vector_store.get(include=[])["ids"]) == ids
+    lexical_index = LexicalIndex.load(workspace["lexical_index_path"])
+    assert set(lexical_index.doc_numbers) == ids
+    assert all(not chunk_id.startswith(os.path.join(workspace["docs"], "gamma.txt")) for chunk_id, _ in lexical_index.search("gamma report", k=50))
+    # The edited text is what is indexed
+    alpha = vector_store.get(ids=[os.path.join(workspace["docs"], "alpha.txt") + ":0"], include=["documents"])["documents"][0]
+    assert "alpha report" in alpha
+
+
+def test_manifest_matches_the_collection(workspace):
+    ingest("stream", workspace)
+    manifest = ingestion.load_manifest(workspace["manifest_path"])
+    assert sorted(manifest) == sorted(os.path.join(workspace["docs"], name) for name in ("alpha.txt", "beta.txt", "gamma.txt"))
+    assert {chunk_id for entry in manifest.values() for chunk_id in entry["chunk_ids"]} == expected_ids(workspace["docs"])
+
+
+def test_collection_paths_are_kept_per_collection():
+    assert collection_paths("db/chroma_db") == ("db/ingest_manifest.json", "db/quantized_index", "db/bm25_index.npz", "db/answer_cache.sqlite3")
+    assert collection_paths("db/chroma_local/") == tuple(
+        os.path.join("db/chroma_local/", name) for name in ("ingest_manifest.json", "quantized_index", "bm25_index.npz", "answer_cache.sqlite3"))
+
+
+def test_each_collection_keeps_its_own_lexical_index(workspace):
+    ingest("incremental", workspace)
+    # Everything the ingest wrote for this collection lives inside its directory
+    assert os.path.dirname(workspace["lexical_index_path"]) == workspace["persist_directory"]
+    assert os.path.exists(workspace["lexical_index_path"])
+    assert os.path.exists(workspace["manifest_path"])
+    assert os.path.exists(workspace["answer_cache_path"])
@@ -0,0 +1,32 @@
+"""Parallel page-range partitioning gives the same elements as a serial partition_pdf run"""
+import importlib
+import os
+
+import pytest
+
+pytest.importorskip("unstructured.partition.pdf")
+from pypdf import PdfReader, PdfWriter
+
+SAMPLE_PDF = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "docs", "attention-is-all-you-need.pdf")
+
+
+@pytest.fixture(scope="module")
+def multi_modal_rag():
+    return importlib.import_module("9_multi_modal_rag")
+
+
+def test_parallel_partition_matches_serial(multi_modal_rag, tmp_path):
+    # The first pages are enough to cross several page ranges (and keep hi_res partitioning short)
+    reader, writer = PdfReader(SAMPLE_PDF), PdfWriter()
+    for page in reader.pages[:4]:
+        writer.add_page(page)
+    pdf_path = str(tmp_path / "sample.pdf")
+    with open(pdf_path, "wb") as f:
+        writer.write(f)
+
+    serial, parallel = multi_modal_rag.compare_partitions(pdf_path, workers=2, pages_per_task=1)
+
+    assert serial
+    assert multi_modal_rag.element_rows(parallel) == multi_modal_rag.element_rows(serial)
+    chunk_texts = lambda elements: [chunk.text for chunk in multi_modal_rag.create_chunks_by_title(elements)]
+    assert chunk_texts(parallel) == chunk_texts(serial)
@@ -0,0 +1,107 @@
+"""Span splitters give exactly the chunks of the langchain character splitters"""
+import glob
+import logging
+import os
+import random
+
+import pytest
+
+from langchain_core.documents import Document
+from langchain_text_splitters import CharacterTextSplitter, RecursiveCharacterTextSplitter
+from span_splitter import SpanCharacterSplitter, SpanRecursiveSplitter, SpanSplitter, span_text
+
+DOCS = sorted(glob.glob(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "docs", "*.txt")))
+KEEP_SEPARATOR = [False, True, "start", "end"]
+EDGE_TEXTS = [
+    "",
+    "   \n\n  ",
+    "no separator at all in this text",
+    "a\n\n\n\nb\n\n\n\n\n\nc", # repeated separators (dropped empty pieces)
+    "\n\n\n\nstarts and ends with separators\n\n\n\n",
+    "one\n\ntwo\n\n\n\nthree\n\nfour\n\n\n\n\n\nfive six seven eight nine ten",
+    "word " * 60,
+    "x" * 250, # longer than chunk_size, nothing to split on
+    "Sentence one. Sentence two.  Sentence three.\n\nNew paragraph. \n\n\t\nTabs\tand  spaces.",
+]
+
+
+@pytest.fixture(autouse=True)
+def quiet_size_warnings():
+    # "Created a chunk of size ..." is logged by both implementations
+    logging.getLogger("langchain_text_splitters").setLevel(logging.ERROR)
+    logging.getLogger("span_splitter").setLevel(logging.ERROR)
+
+
+def random_texts(count=200, seed=0):
+    rng = random.Random(seed)
+    alphabet = ["a", "b", " ", "\n", "\n\n", ". ", "  ", "\t", "x y", "."]
+    return ["".join(rng.choice(alphabet) for _ in range(rng.randint(0, 80))) for _ in range(count)]
+
+
+@pytest.mark.parametrize("path", DOCS, ids=os.path.basename)
+@pytest.mark.parametrize("chunk_size, chunk_overlap", [(800, 0), (800, 200), (100, 20)])
+def test_character_splitter_matches_on_docs(path, chunk_size, chunk_overlap):
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    expected = CharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap).split_text(text)
+    assert SpanCharacterSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap).split_text(text) == expected
+
+
+@pytest.mark.parametrize("path", DOCS, ids=os.path.basename)
+@pytest.mark.parametrize("chunk_size, chunk_overlap", [(800, 0), (100, 0), (100, 30)])
+def test_recursive_splitter_matches_on_docs(path, chunk_size, chunk_overlap):
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    separators = ["\n\n", "\n", ". ", " ", ""]
+    expected = RecursiveCharacterTextSplitter(separators=separators, chunk_size=chunk_size, chunk_overlap=chunk_overlap).split_text(text)
+    assert SpanRecursiveSplitter(separators=separators, chunk_size=chunk_size, chunk_overlap=chunk_overlap).split_text(text) == expected
+
+
+@pytest.mark.parametrize("keep_separator", KEEP_SEPARATOR)
+@pytest.mark.parametrize("strip_whitespace", [True, False])
+@pytest.mark.parametrize("separator", ["\n\n", " ", ". ", ""])
+@pytest.mark.parametrize("chunk_size, chunk_overlap", [(10, 0), (10, 4), (25, 10), (5, 5), (1, 0)])
+def test_character_splitter_matches_on_edge_inputs(keep_separator, strip_whitespace, separator, chunk_size, chunk_overlap):
+    options = dict(separator=separator, chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                   keep_separator=keep_separator, strip_whitespace=strip_whitespace)
+    for text in EDGE_TEXTS + random_texts(50):
+        assert SpanCharacterSplitter(**options).split_text(text) == CharacterTextSplitter(**options).split_text(text), repr(text)
+
+
+@pytest.mark.parametrize("keep_separator", KEEP_SEPARATOR)
+@pytest.mark.parametrize("strip_whitespace", [True, False])
+@pytest.mark.parametrize("separators", [None, ["\n\n", "\n", ". ", " ", ""], ["\n\n", ". "]])
+@pytest.mark.parametrize("chunk_size, chunk_overlap", [(10, 0), (10, 4), (25, 10), (5, 5), (1, 0)])
+def test_recursive_splitter_matches_on_edge_inputs(keep_separator, strip_whitespace, separators, chunk_size, chunk_overlap):
+    options = dict(chunk_size=chunk_size, chunk_overlap=chunk_overlap, keep_separator=keep_separator, strip_whitespace=strip_whitespace)
+    for text in EDGE_TEXTS + random_texts(50):
+        expected = RecursiveCharacterTextSplitter(separators=separators, **options).split_text(text)
+        assert SpanRecursiveSplitter(separators=separators, **options).split_text(text) == expected, repr(text)
+
+
+def test_spans_point_into_the_source():
+    text = EDGE_TEXTS[5]
+    splitter = SpanCharacterSplitter(chunk_size=30, chunk_overlap=0)
+    spans = splitter.split_spans(text)
+    assert spans[0].skips == ((10, 12),) # "two\n\n\n\nthree": the extra "\n\n" is cut out of the chunk
+    assert [span_text(text, span) for span in spans] == CharacterTextSplitter(chunk_size=30, chunk_overlap=0).split_text(text)
+    for span in spans:
+        assert all(span.start < start < end < span.end for start, end in span.skips)
+
+
+def test_split_documents_matches():
+    documents = [Document(page_content=text, metadata={"source": f"doc{i}"}) for i, text in enumerate(EDGE_TEXTS)]
+    expected = CharacterTextSplitter(separator=" ", chunk_size=20, chunk_overlap=5).split_documents(documents)
+    actual = SpanCharacterSplitter(separator=" ", chunk_size=20, chunk_overlap=5).split_documents(documents)
+    assert [(d.page_content, d.metadata) for d in actual] == [(d.page_content, d.metadata) for d in expected]
+
+
+@pytest.mark.parametrize("options", [dict(chunk_size=0), dict(chunk_size=10, chunk_overlap=-1), dict(chunk_size=10, chunk_overlap=11)])
+def test_invalid_sizes_are_rejected(options):
+    with pytest.raises(ValueError):
+        SpanCharacterSplitter(**options)
+
+
+def test_base_splitter_is_abstract():
+    with pytest.raises(TypeError):
+        SpanSplitter(chunk_size=100, chunk_overlap=10)